@@ -0,0 +1,102 @@
+"""Retrieval-aware cache of generated RAG answers.
+
+An answer depends on the question, the chunks retrieved for it, the model and
+the prompt, so entries are keyed by (normalized query, sorted chunk ids,
+model, prompt version): the same question over changed retrieval results
+regenerates. Entries are dropped as soon as one of their source documents is
+reprocessed or deleted in this process. Each entry also keeps a digest of the
+chunk texts it was generated from, because a document reprocessed by another
+process (worker.py) keeps its chunk ids; a digest mismatch is a miss. Entries
+expire after a TTL and the least recently used are evicted past max_entries.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Iterable, Set
+
+from embeddings import QueryEmbeddingCache
+
+
+class AnswerCache:
+    """In-process LRU cache with TTL of answers, invalidated by source document"""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (stored at, chunk digest, source document ids, answer)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_document: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def key(query: str, chunk_ids: Iterable[str], model: str, prompt_version: str) -> str:
+        parts = [QueryEmbeddingCache.normalize(query), *sorted(chunk_ids), model, prompt_version]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def digest(texts: Iterable[str]) -> str:
+        """Fingerprint of the chunk texts an answer was generated from"""
+        hasher = hashlib.sha256()
+        for text in texts:
+            hasher.update(text.encode("utf-8"))
+            hasher.update(b"\0")
+        return hasher.hexdigest()
+
+    def _discard(self, key: str):
+        _, _, document_ids, _ = self._entries.pop(key)
+        for document_id in document_ids:
+            keys = self._by_document.get(document_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[document_id]
+
+    def get(self, key: str, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl_seconds or entry[1] != digest:
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key: str, digest: str, document_ids: List[str], answer: Dict[str, Any]):
+        document_ids = frozenset(document_ids)
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (time.monotonic(), digest, document_ids, answer)
+            for document_id in document_ids:
+                self._by_document.setdefault(document_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """Drop every answer generated from any of the documents, returning how many"""
+        with self._lock:
+            keys = set()
+            for document_id in document_ids:
+                keys |= self._by_document.get(document_id, set())
+            for key in keys:
+                self._discard(key)
+            self.invalidated += len(keys)
+        return len(keys)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidated": self.invalidated,
+        }
@@ -0,0 +1,498 @@
+"""Component benchmarks for the document processing and RAG pipeline.
+
+Benchmarks run against synthetic data and only import the modules they
+measure, so they do not need MongoDB, MinIO or Ollama. Run from the backend
+directory, for example:
+
+    python benchmarks.py pdf-extractors --documents 20 --pages 10
+    python benchmarks.py ocr-preprocess --pages 5 --deskew
+    python benchmarks.py entities --megabytes 8
+    python benchmarks.py lexical --chunks 1000 10000 100000
+    python benchmarks.py vector-store --chunks 200000
+    python benchmarks.py vector-search --analysts 50
+    python benchmarks.py chunkers --documents 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import List
+
+LAB_ANALYTES = [
+    ("Hemoglobin", "g/dL", 11.5, 17.5), ("Hematocrit", "%", 34.0, 52.0),
+    ("WBC", "10^3/uL", 3.5, 11.0), ("Platelets", "10^3/uL", 140, 450),
+    ("Sodium", "mmol/L", 133, 147), ("Potassium", "mmol/L", 3.2, 5.4),
+    ("Creatinine", "mg/dL", 0.5, 1.6), ("Glucose", "mg/dL", 65, 180),
+    ("HbA1c", "%", 4.5, 9.5), ("LDL Cholesterol", "mg/dL", 60, 190),
+    ("TSH", "mIU/L", 0.3, 5.5), ("ALT", "U/L", 7, 70),
+]
+
+NOTE_SENTENCES = [
+    "Patient reports intermittent chest discomfort on exertion.",
+    "Blood pressure: 132/84, heart rate: 76, temperature: 98.4.",
+    "Continue metformin 500 mg twice daily and lisinopril 10 mg daily.",
+    "History of type 2 diabetes mellitus and essential hypertension.",
+    "Echocardiogram shows preserved ejection fraction without wall motion abnormality.",
+    "Follow up in three months with repeat lipid panel and HbA1c.",
+]
+
+
+def synthetic_report_lines(rng: random.Random, lines: int) -> List[str]:
+    """Generate lab-report style lines of text"""
+    report = []
+    for _ in range(lines):
+        if rng.random() < 0.6:
+            name, unit, low, high = rng.choice(LAB_ANALYTES)
+            report.append(f"{name:<20} {rng.uniform(low, high):8.1f} {unit:<10} ref {low}-{high}")
+        else:
+            report.append(rng.choice(NOTE_SENTENCES))
+    return report
+
+
+def build_synthetic_pdf_corpus(directory: str, documents: int, pages: int, seed: int = 7) -> List[str]:
+    """Write synthetic text-layer PDFs with reportlab and return their paths"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    paths = []
+    for document_index in range(documents):
+        path = os.path.join(directory, f"synthetic_{document_index:04d}.pdf")
+        pdf = canvas.Canvas(path, pagesize=letter)
+        for _ in range(pages):
+            text = pdf.beginText(40, 750)
+            text.setFont("Helvetica", 9)
+            for line in synthetic_report_lines(rng, 60):
+                text.textLine(line)
+            pdf.drawText(text)
+            pdf.showPage()
+        pdf.save()
+        paths.append(path)
+    return paths
+
+
+def bench_pdf_extractors(args):
+    """Compare text-layer extraction backends on a synthetic PDF corpus"""
+    from pdf_extractors import available_extractors
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = build_synthetic_pdf_corpus(directory, args.documents, args.pages)
+        total_pages = args.documents * args.pages
+        print(f"Corpus: {args.documents} documents x {args.pages} pages")
+        print(f"{'backend':<10} {'seconds':>9} {'pages/sec':>10} {'ms/page':>9} {'chars':>10}")
+
+        for extractor in available_extractors():
+            started = time.perf_counter()
+            chars = 0
+            for path in paths:
+                result = extractor.extract(path)
+                chars += sum(len(page["text"]) for page in result["pages"])
+            elapsed = time.perf_counter() - started
+            print(
+                f"{extractor.name:<10} {elapsed:9.3f} {total_pages / elapsed:10.1f} "
+                f"{1000 * elapsed / total_pages:9.2f} {chars:10d}"
+            )
+
+
+def synthetic_page_image(rng: random.Random, dpi: int = 300, skew_degrees: float = 1.5):
+    """Render a letter-size RGB page image of report text, slightly skewed like a scan"""
+    from PIL import Image, ImageDraw
+
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for line_number, line in enumerate(synthetic_report_lines(rng, 90)):
+        draw.text((dpi // 2, dpi // 2 + line_number * 32), line, fill="black")
+    return image.rotate(skew_degrees, fillcolor="white")
+
+
+def legacy_preprocess_image(image):
+    """The original RGB -> BGR -> gray -> Otsu -> PIL preprocessing"""
+    import cv2
+    import numpy as np
+    from PIL import Image
+
+    opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+    gray = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2GRAY)
+    processed = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return Image.fromarray(processed)
+
+
+def bench_ocr_preprocess(args):
+    """Time and bytes allocated per page for OCR image preprocessing"""
+    from ocr_engine import preprocess_image
+
+    rng = random.Random(11)
+    rgb_pages = [synthetic_page_image(rng) for _ in range(args.pages)]
+    gray_pages = [page.convert("L") for page in rgb_pages]
+
+    variants = [
+        ("legacy rgb", rgb_pages, legacy_preprocess_image),
+        ("grayscale", gray_pages, lambda page: preprocess_image(page)),
+        (
+            "grayscale+opts",
+            gray_pages,
+            lambda page: preprocess_image(page, deskew=args.deskew, denoise=args.denoise)
+        ),
+    ]
+
+    print(f"Pages: {args.pages} at 300 dpi (deskew={args.deskew}, denoise={args.denoise})")
+    print("Allocations are numpy/OpenCV buffers traced by tracemalloc")
+    print(f"{'variant':<16} {'ms/page':>9} {'MB alloc/page':>14} {'MB peak':>9}")
+    for name, pages, preprocess in variants:
+        tracemalloc.start()
+        started = time.perf_counter()
+        allocated = 0
+        for page in pages:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = preprocess(page)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += peak - before
+            del result
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"{name:<16} {1000 * elapsed / len(pages):9.1f} "
+            f"{allocated / len(pages) / 2 ** 20:14.1f} {peak / 2 ** 20:9.1f}"
+        )
+
+
+def bench_entities(args):
+    """Throughput of the lexicon entity extractor on multi-MB texts"""
+    from medical_entities import MedicalEntityExtractor, VITAL_SIGN_PATTERNS
+
+    started = time.perf_counter()
+    extractor = MedicalEntityExtractor.from_directory(args.lexicon_dir) if args.lexicon_dir \
+        else MedicalEntityExtractor.from_directory()
+    print(f"Lexicon load: {1000 * (time.perf_counter() - started):.1f} ms, {extractor.automaton.size} terms")
+
+    rng = random.Random(5)
+    target_chars = int(args.megabytes * 2 ** 20)
+    lines = []
+    chars = 0
+    while chars < target_chars:
+        line = " ".join(synthetic_report_lines(rng, 1))
+        lines.append(line)
+        chars += len(line) + 1
+    text = "\n".join(lines)
+    megabytes = len(text) / 2 ** 20
+
+    started = time.perf_counter()
+    for pattern in VITAL_SIGN_PATTERNS:
+        pattern.findall(text)
+    regex_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    entities = extractor.extract(text)
+    elapsed = time.perf_counter() - started
+    print(f"Text: {megabytes:.1f} MB")
+    print(f"{'mode':<22} {'seconds':>9} {'MB/sec':>9}")
+    print(f"{'vital-sign regex only':<22} {regex_elapsed:9.3f} {megabytes / regex_elapsed:9.2f}")
+    print(f"{'full extract':<22} {elapsed:9.3f} {megabytes / elapsed:9.2f}")
+
+    documents = [text[i:i + 20000] for i in range(0, len(text), 20000)]
+    started = time.perf_counter()
+    extractor.extract_batch(documents)
+    batch_elapsed = time.perf_counter() - started
+    print(
+        f"{'batch (20 KB docs)':<22} {batch_elapsed:9.3f} {megabytes / batch_elapsed:9.2f}"
+        f"  {len(documents) / batch_elapsed:.0f} docs/sec"
+    )
+    print("Entities found: " + ", ".join(f"{key}={len(values)}" for key, values in entities.items()))
+
+
+LEXICAL_QUERIES = [
+    "metformin dose", "HbA1c", "LDL Cholesterol mg/dL", "lisinopril 10 mg",
+    "potassium result", "chest discomfort on exertion", "TSH mIU/L", "ejection fraction",
+]
+
+
+def bench_lexical(args):
+    """BM25 index build time, memory and query latency against chunk count"""
+    from lexical_index import BM25Index
+
+    rng = random.Random(13)
+    print(f"{'chunks':>8} {'build s':>9} {'index MB':>9} {'B/chunk':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for chunk_count in args.chunks:
+        index = BM25Index()
+        started = time.perf_counter()
+        for document_index in range(0, chunk_count, 10):
+            document_id = f"doc{document_index}"
+            texts = [" ".join(synthetic_report_lines(rng, 12)) for _ in range(min(10, chunk_count - document_index))]
+            index.replace_document(document_id, [f"{document_id}_{i}" for i in range(len(texts))], texts)
+        build_elapsed = time.perf_counter() - started
+
+        latencies = []
+        for query_index in range(args.queries):
+            started = time.perf_counter()
+            index.search(LEXICAL_QUERIES[query_index % len(LEXICAL_QUERIES)], 20)
+            latencies.append(1000 * (time.perf_counter() - started))
+        latencies.sort()
+        print(
+            f"{chunk_count:8d} {build_elapsed:9.2f} {index.nbytes() / 2 ** 20:9.2f} "
+            f"{index.nbytes() / chunk_count:8.0f} {latencies[len(latencies) // 2]:8.2f} "
+            f"{latencies[int(0.99 * (len(latencies) - 1))]:8.2f}"
+        )
+
+
+def bench_vector_store(args):
+    """Size, cold start and query latency of the memory-mapped vector store"""
+    import numpy as np
+    from vector_store import MmapVectorStore
+
+    rng = np.random.default_rng(3)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    print(f"Chunks: {args.chunks} x {args.dim} dims (float32 would be {args.chunks * args.dim * 4 / 2 ** 20:.0f} MB)")
+    print(f"{'dtype':<8} {'build s':>8} {'file MB':>8} {'cold ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'recall@10':>10}")
+    for dtype in ("float16", "int8"):
+        with tempfile.TemporaryDirectory() as directory:
+            store = MmapVectorStore(directory, dtype=dtype)
+            started = time.perf_counter()
+            exact_scores = np.full((args.queries, 10), -np.inf, dtype=np.float32)
+            exact_ids = np.zeros((args.queries, 10), dtype=np.int64)
+            for start in range(0, args.chunks, 10000):
+                count = min(10000, args.chunks - start)
+                vectors = rng.normal(size=(count, args.dim)).astype(np.float32)
+                ids = [f"doc{(start + i) // 10}_{(start + i) % 10}" for i in range(count)]
+                store.upsert("bench", ids, [""] * count, vectors, [{"document_id": ids[i].split("_")[0]} for i in range(count)])
+
+                # Exact float32 top 10 for recall
+                normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+                scores = np.concatenate([exact_scores, queries @ normalized.T], axis=1)
+                candidates = np.concatenate([exact_ids, np.tile(np.arange(start, start + count), (args.queries, 1))], axis=1)
+                keep = np.argsort(-scores, axis=1)[:, :10]
+                exact_scores = np.take_along_axis(scores, keep, axis=1)
+                exact_ids = np.take_along_axis(candidates, keep, axis=1)
+            build_elapsed = time.perf_counter() - started
+            store.close()
+            file_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+            started = time.perf_counter()
+            store = MmapVectorStore(directory, dtype=dtype)
+            store.query("bench", queries[:1].tolist(), 10)
+            cold_ms = 1000 * (time.perf_counter() - started)
+
+            latencies, hits = [], 0
+            for query_index, query in enumerate(queries):
+                started = time.perf_counter()
+                result = store.query("bench", [query.tolist()], 10)
+                latencies.append(1000 * (time.perf_counter() - started))
+                expected = {f"doc{i // 10}_{i % 10}" for i in exact_ids[query_index]}
+                hits += len(expected & set(result["ids"][0]))
+            store.close()
+            latencies.sort()
+            print(
+                f"{dtype:<8} {build_elapsed:8.1f} {file_bytes / 2 ** 20:8.0f} {cold_ms:8.1f} "
+                f"{latencies[len(latencies) // 2]:8.1f} {latencies[int(0.99 * (len(latencies) - 1))]:8.1f} "
+                f"{hits / (10 * args.queries):10.3f}"
+            )
+
+
+def bench_vector_search(args):
+    """p50/p99 latency of concurrent analysts' vector searches with and without coalescing"""
+    import numpy as np
+    from vector_search import VectorSearchBatcher
+    from vector_store import MmapVectorStore
+
+    rng = np.random.default_rng(9)
+    queries = rng.normal(size=(args.analysts * args.queries, args.dim)).astype(np.float32).tolist()
+
+    async def run_analysts(search) -> List[float]:
+        """Every analyst queries at once, latency counts from that moment to the analyst's result"""
+        latencies = []
+
+        async def analyst(query: List[float], started: float):
+            await search(query)
+            latencies.append(1000 * (time.perf_counter() - started))
+
+        for start in range(0, len(queries), args.analysts):
+            started = time.perf_counter()
+            await asyncio.gather(*(analyst(query, started) for query in queries[start:start + args.analysts]))
+        return sorted(latencies)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = MmapVectorStore(directory)
+        for start in range(0, args.chunks, 10000):
+            count = min(10000, args.chunks - start)
+            ids = [f"chunk{start + i}" for i in range(count)]
+            store.upsert("bench", ids, [""] * count, rng.normal(size=(count, args.dim)).astype(np.float32),
+                         [{"document_id": f"doc{(start + i) // 10}"} for i in range(count)])
+
+        async def blocking(query):
+            # The original handler: a synchronous store call on the event loop
+            return store.query("bench", [query], 10)
+
+        # A batch size of 1 flushes every query on its own, i.e. pool only
+        variants = [("blocking", lambda: blocking)]
+        for name, coalesce_ms, max_batch_size in (("pool", 0.0, 1), ("coalesced", args.coalesce_ms, 32)):
+            def variant(coalesce_ms=coalesce_ms, max_batch_size=max_batch_size):
+                batcher = VectorSearchBatcher(
+                    store.query, max_threads=args.threads, coalesce_ms=coalesce_ms, max_batch_size=max_batch_size
+                )
+                return lambda query: batcher.query("bench", query, 10)
+            variants.append((name, variant))
+
+        print(f"Chunks: {args.chunks} x {args.dim} dims, {args.analysts} concurrent analysts x {args.queries} queries")
+        print(f"{'variant':<10} {'seconds':>8} {'queries/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for name, make_search in variants:
+            started = time.perf_counter()
+            latencies = asyncio.run(run_analysts(make_search()))
+            elapsed = time.perf_counter() - started
+            print(
+                f"{name:<10} {elapsed:8.2f} {len(latencies) / elapsed:10.1f} "
+                f"{latencies[len(latencies) // 2]:8.1f} {latencies[int(0.99 * (len(latencies) - 1))]:8.1f}"
+            )
+        store.close()
+
+
+SECTION_HEADINGS = ["HISTORY OF PRESENT ILLNESS", "MEDICATIONS", "LABORATORY RESULTS", "ASSESSMENT AND PLAN"]
+
+
+def synthetic_clinical_document(rng: random.Random, pages: int) -> List[str]:
+    """Page texts of a note with section headings, prose paragraphs and lab tables"""
+    page_texts = []
+    for _ in range(pages):
+        lines = []
+        for heading in rng.sample(SECTION_HEADINGS, 3):
+            lines.append(heading)
+            if heading == "LABORATORY RESULTS":
+                lines.extend(
+                    f"{name:<20} {rng.uniform(low, high):8.1f} {unit:<10} ref {low}-{high}"
+                    for name, unit, low, high in rng.sample(LAB_ANALYTES, 8)
+                )
+            else:
+                lines.append(" ".join(rng.choice(NOTE_SENTENCES) for _ in range(rng.randint(4, 12))))
+            lines.append("")
+        page_texts.append("\n".join(lines))
+    return page_texts
+
+
+def bench_chunkers(args):
+    """Throughput and index size of the section-aware chunker against the character splitter"""
+    from chunking import MedicalChunker, estimate_tokens, page_starts
+
+    count_tokens, tokenizer_name = estimate_tokens, "estimate"
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+        count_tokens, tokenizer_name = (
+            lambda texts: [len(ids) for ids in tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]]
+        ), args.tokenizer
+
+    rng = random.Random(17)
+    documents = [synthetic_clinical_document(rng, args.pages) for _ in range(args.documents)]
+    texts = ["\n".join(pages) for pages in documents]
+    megabytes = sum(len(text) for text in texts) / 2 ** 20
+
+    splitters = []
+    try:
+        try:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+        except ImportError:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+        character_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", ". ", " ", ""]
+        )
+        splitters.append(("chars 1000/200", lambda text, pages: character_splitter.split_text(text)))
+    except ImportError:
+        print("langchain not installed, skipping the character splitter")
+    chunker = MedicalChunker(args.chunk_tokens, args.overlap_tokens, count_tokens)
+    splitters.append((
+        f"tokens {args.chunk_tokens}/{args.overlap_tokens}",
+        lambda text, pages: [
+            chunk["text"] for chunk in chunker.split(text, page_starts([len(page) for page in pages]))
+        ]
+    ))
+
+    print(f"Corpus: {args.documents} documents x {args.pages} pages, {megabytes:.1f} MB, tokens: {tokenizer_name}")
+    print(f"Index size assumes {args.dim}-dim float32 vectors plus chunk text")
+    print(
+        f"{'splitter':<16} {'MB/sec':>8} {'chunks':>8} {'avg tok':>8} {'>{0} tok'.format(args.model_max_tokens):>9} "
+        f"{'split rows':>10} {'text MB':>8} {'index MB':>9}"
+    )
+    lab_rows = {line for pages in documents for page in pages for line in page.split("\n") if "ref " in line}
+    for name, split in splitters:
+        started = time.perf_counter()
+        chunk_texts = [chunk for text, pages in zip(texts, documents) for chunk in split(text, pages)]
+        elapsed = time.perf_counter() - started
+
+        token_counts = count_tokens(chunk_texts)
+        over_limit = sum(1 for count in token_counts if count > args.model_max_tokens)
+        # Lab rows cut in two show up as a partial row at a chunk edge
+        split_rows = sum(
+            1 for chunk in chunk_texts for edge in (chunk.split("\n")[0], chunk.split("\n")[-1])
+            if "ref " in edge and edge not in lab_rows
+        )
+        text_bytes = sum(len(chunk.encode()) for chunk in chunk_texts)
+        index_bytes = text_bytes + len(chunk_texts) * args.dim * 4
+        print(
+            f"{name:<16} {megabytes / elapsed:8.2f} {len(chunk_texts):8d} "
+            f"{sum(token_counts) / len(token_counts):8.1f} {over_limit:9d} {split_rows:10d} "
+            f"{text_bytes / 2 ** 20:8.2f} {index_bytes / 2 ** 20:9.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HealthSync pipeline benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pdf_parser = subparsers.add_parser("pdf-extractors", help=bench_pdf_extractors.__doc__)
+    pdf_parser.add_argument("--documents", type=int, default=20)
+    pdf_parser.add_argument("--pages", type=int, default=10)
+    pdf_parser.set_defaults(run=bench_pdf_extractors)
+
+    ocr_parser = subparsers.add_parser("ocr-preprocess", help=bench_ocr_preprocess.__doc__)
+    ocr_parser.add_argument("--pages", type=int, default=5)
+    ocr_parser.add_argument("--deskew", action="store_true")
+    ocr_parser.add_argument("--denoise", action="store_true")
+    ocr_parser.set_defaults(run=bench_ocr_preprocess)
+
+    entity_parser = subparsers.add_parser("entities", help=bench_entities.__doc__)
+    entity_parser.add_argument("--megabytes", type=float, default=8.0)
+    entity_parser.add_argument("--lexicon-dir", default=None)
+    entity_parser.set_defaults(run=bench_entities)
+
+    lexical_parser = subparsers.add_parser("lexical", help=bench_lexical.__doc__)
+    lexical_parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 100000])
+    lexical_parser.add_argument("--queries", type=int, default=200)
+    lexical_parser.set_defaults(run=bench_lexical)
+
+    store_parser = subparsers.add_parser("vector-store", help=bench_vector_store.__doc__)
+    store_parser.add_argument("--chunks", type=int, default=200000)
+    store_parser.add_argument("--dim", type=int, default=384)
+    store_parser.add_argument("--queries", type=int, default=50)
+    store_parser.set_defaults(run=bench_vector_store)
+
+    search_parser = subparsers.add_parser("vector-search", help=bench_vector_search.__doc__)
+    search_parser.add_argument("--chunks", type=int, default=50000)
+    search_parser.add_argument("--dim", type=int, default=384)
+    search_parser.add_argument("--analysts", type=int, default=50)
+    search_parser.add_argument("--queries", type=int, default=10, help="rounds in which every analyst queries")
+    search_parser.add_argument("--threads", type=int, default=4)
+    search_parser.add_argument("--coalesce-ms", type=float, default=3.0)
+    search_parser.set_defaults(run=bench_vector_search)
+
+    chunker_parser = subparsers.add_parser("chunkers", help=bench_chunkers.__doc__)
+    chunker_parser.add_argument("--documents", type=int, default=200)
+    chunker_parser.add_argument("--pages", type=int, default=4)
+    chunker_parser.add_argument("--chunk-tokens", type=int, default=240)
+    chunker_parser.add_argument("--overlap-tokens", type=int, default=24)
+    chunker_parser.add_argument("--model-max-tokens", type=int, default=256)
+    chunker_parser.add_argument("--dim", type=int, default=384)
+    chunker_parser.add_argument(
+        "--tokenizer", default=None,
+        help="Hugging Face tokenizer to count tokens with, e.g. sentence-transformers/all-MiniLM-L6-v2"
+    )
+    chunker_parser.set_defaults(run=bench_chunkers)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
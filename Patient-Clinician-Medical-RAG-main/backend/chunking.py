@@ -0,0 +1,201 @@
+"""Token-aware, section-aware chunking of medical document text.
+
+Text is segmented into section headings, table rows and prose sentences, each
+measured in embedding-model tokens. Units are packed into chunks of at most
+chunk_tokens: a section that fits in the current chunk is packed whole, any
+other section starts a new chunk at its heading, a table that fits in one
+chunk is never split, and an oversized table is split between rows.
+Overlap is carried only between chunks cut from the same block. Every chunk
+records its character span in the document text and the pages it covers.
+"""
+import bisect
+import re
+from typing import List, Optional, Dict, Any, Callable, Tuple
+
+# Model tokens per text; estimate_tokens is used when no tokenizer is available
+TokenCounter = Callable[[List[str]], List[int]]
+
+SECTION_NAMES = {
+    "chief complaint", "history of present illness", "hpi", "past medical history", "past surgical history",
+    "family history", "social history", "medications", "current medications", "allergies", "review of systems",
+    "physical exam", "physical examination", "vital signs", "vitals", "laboratory results", "lab results", "labs",
+    "imaging", "impression", "assessment", "plan", "assessment and plan", "diagnosis", "diagnoses",
+    "procedures", "discharge summary", "discharge instructions", "follow up", "findings", "results",
+}
+
+HEADING_PATTERN = re.compile(r"^[A-Z][A-Z0-9 /&(),'-]{2,60}:?$")
+TITLE_HEADING_PATTERN = re.compile(r"^[A-Z][A-Za-z /&(),'-]{2,48}:$")
+DECIMAL_PATTERN = re.compile(r"\d+\.\d+")
+# Column gaps, or a single "analyte value unit [range] [flag]" lab result line
+TABLE_ROW_PATTERN = re.compile(
+    r"\t|\||\S {2,}\S.* {2,}\S"
+    r"|^\s*[A-Za-z][\w ()/%,.-]{0,40}?[:\s]\s*[<>]?\d+(?:\.\d+)?\s*(?:%|[a-zA-Zµ][\w/^µ]*)?"
+    r"(?:\s*\(?(?:ref\.?\s*)?\d+(?:\.\d+)?\s*-\s*\d+(?:\.\d+)?\)?)?(?:\s*[HL]\*?)?\s*$"
+)
+SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+(?=[A-Z0-9(])")
+WORD_PATTERN = re.compile(r"\S+")
+BLANK_LINE = re.compile(r"\n[ \t\r\f\v]*\n")
+TOKEN_ESTIMATE_PATTERN = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(texts: List[str]) -> List[int]:
+    """Approximate word-piece token counts without loading a tokenizer"""
+    return [len(TOKEN_ESTIMATE_PATTERN.findall(text)) for text in texts]
+
+
+def page_starts(page_chars: List[int], separator_length: int = 1) -> List[int]:
+    """Character offset of each page in text joined from pages with a separator"""
+    starts, offset = [], 0
+    for chars in page_chars:
+        starts.append(offset)
+        offset += chars + separator_length
+    return starts
+
+
+class MedicalChunker:
+    """Packs headings, table rows and sentences into token-bounded chunks"""
+
+    def __init__(self, chunk_tokens: int = 240, overlap_tokens: int = 24, count_tokens: Optional[TokenCounter] = None):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens or estimate_tokens
+
+    def _is_heading(self, line: str) -> bool:
+        stripped = line.strip()
+        if stripped.rstrip(":").lower() in SECTION_NAMES:
+            return True
+        if TITLE_HEADING_PATTERN.match(stripped):
+            return True
+        return bool(HEADING_PATTERN.match(stripped)) and not DECIMAL_PATTERN.search(stripped)
+
+    def _segment(self, text: str) -> List[Tuple[int, int, str, int, str]]:
+        """(start, end, kind, block, section) units in document order"""
+        units = []
+        block = -1
+        previous_kind = None
+        previous_end = 0
+        section = ""
+        for match in re.finditer(r"[^\n]+", text):
+            line = match.group()
+            if not line.strip():
+                continue
+            start = match.start() + len(line) - len(line.lstrip())
+            end = match.start() + len(line.rstrip())
+            # A blank line between two lines ends the block
+            blank_before = BLANK_LINE.search(text, previous_end, start) is not None
+            previous_end = end
+
+            if self._is_heading(line):
+                section = line.strip().rstrip(":")
+                block += 1
+                units.append((start, end, "heading", block, section))
+                previous_kind = "heading"
+                continue
+
+            kind = "table" if TABLE_ROW_PATTERN.search(line) else "prose"
+            if kind != previous_kind or blank_before:
+                block += 1
+            previous_kind = kind
+            if kind == "table":
+                units.append((start, end, kind, block, section))
+                continue
+
+            sentence_start = start
+            for sentence_break in SENTENCE_BREAK.finditer(text, start, end):
+                units.append((sentence_start, sentence_break.start(), kind, block, section))
+                sentence_start = sentence_break.end()
+            units.append((sentence_start, end, kind, block, section))
+        return units
+
+    def _split_oversized(self, text: str, units: List[Tuple[int, int, str, int, str]],
+                         tokens: List[int]) -> Tuple[List[Tuple[int, int, str, int, str]], List[int]]:
+        """Break units longer than a chunk into word windows"""
+        if all(count <= self.chunk_tokens for count in tokens):
+            return units, tokens
+        split_units, split_tokens = [], []
+        for unit, count in zip(units, tokens):
+            if count <= self.chunk_tokens:
+                split_units.append(unit)
+                split_tokens.append(count)
+                continue
+            start, end, kind, block, section = unit
+            words = list(WORD_PATTERN.finditer(text, start, end))
+            window = max(1, len(words) * self.chunk_tokens // (2 * count))
+            pieces = [(words[i].start(), words[min(i + window, len(words)) - 1].end())
+                      for i in range(0, len(words), window)]
+            split_units.extend((piece_start, piece_end, kind, block, section) for piece_start, piece_end in pieces)
+            split_tokens.extend(self.count_tokens([text[piece_start:piece_end] for piece_start, piece_end in pieces]))
+        return split_units, split_tokens
+
+    def split(self, text: str, page_offsets: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """Chunk text into dicts with text, token count, char span, pages and section
+
+        page_offsets are the character offsets where each page starts in text.
+        """
+        units = self._segment(text)
+        if not units:
+            return []
+        tokens = self.count_tokens([text[start:end] for start, end, _, _, _ in units])
+        units, tokens = self._split_oversized(text, units, tokens)
+
+        # Token size of each block and section, to keep those that fit in one chunk together
+        block_tokens: Dict[int, int] = {}
+        section_tokens: List[int] = []
+        for (_, _, kind, block, _), count in zip(units, tokens):
+            block_tokens[block] = block_tokens.get(block, 0) + count
+            if kind == "heading" or not section_tokens:
+                section_tokens.append(0)
+            section_tokens[-1] += count
+        section_index = -1
+
+        chunks: List[Dict[str, Any]] = []
+        current: List[int] = []
+        current_tokens = 0
+
+        def flush(carry_block: Optional[int] = None):
+            nonlocal current, current_tokens
+            if not current:
+                return
+            start, end = units[current[0]][0], units[current[-1]][1]
+            sections = list(dict.fromkeys(units[index][4] for index in current if units[index][4]))
+            chunks.append(self._chunk(text, start, end, current_tokens, "; ".join(sections), page_offsets))
+            carried: List[int] = []
+            carried_tokens = 0
+            if carry_block is not None and self.overlap_tokens:
+                for index in reversed(current):
+                    if units[index][3] != carry_block or carried_tokens + tokens[index] > self.overlap_tokens:
+                        break
+                    carried.insert(0, index)
+                    carried_tokens += tokens[index]
+            current, current_tokens = carried, carried_tokens
+
+        for index, (start, end, kind, block, section) in enumerate(units):
+            first_of_block = index == 0 or units[index - 1][3] != block
+            if kind == "heading" or index == 0:
+                section_index += 1
+            if kind == "heading" and current_tokens + section_tokens[section_index] > self.chunk_tokens:
+                flush()
+            elif first_of_block and kind == "table" and block_tokens[block] <= self.chunk_tokens \
+                    and current_tokens + block_tokens[block] > self.chunk_tokens \
+                    and units[current[-1]][2] != "heading":
+                flush()
+            if current_tokens + tokens[index] > self.chunk_tokens:
+                flush(carry_block=block)
+                if current_tokens + tokens[index] > self.chunk_tokens:
+                    current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens[index]
+        flush()
+        return chunks
+
+    def _chunk(self, text: str, start: int, end: int, tokens: int, section: str,
+               page_offsets: Optional[List[int]]) -> Dict[str, Any]:
+        chunk = {"text": text[start:end], "tokens": tokens, "char_start": start, "char_end": end}
+        if page_offsets:
+            chunk["page_start"] = bisect.bisect_right(page_offsets, start)
+            chunk["page_end"] = bisect.bisect_right(page_offsets, end - 1)
+        if section:
+            chunk["section"] = section
+        return chunk
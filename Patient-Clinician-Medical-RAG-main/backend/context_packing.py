@@ -0,0 +1,175 @@
+"""Token-budgeted packing of retrieved chunks into LLM context.
+
+Neighbouring chunks of a document share their overlap, and chunks next to
+each other in a document read better as one passage. Chunks are grouped by
+document and merged wherever their character spans overlap or touch, so the
+overlap is sent once. Passages with identical text (e.g. a deduplicated
+upload shared by two documents) and passages contained in another one are
+sent once. Passages are then added in order of their best-ranked chunk until
+the token budget is used. A passage that does not fit is split back at chunk
+boundaries, dropping its lowest-ranked chunks first, so the best chunks of a
+long merged passage still make it in. A top chunk larger than the whole budget
+is cut at a word boundary.
+"""
+import re
+from typing import List, Optional, Dict, Any, Callable
+
+from chunking import estimate_tokens
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+class ContextPacker:
+    """Merges overlapping chunks and fills a token budget with the best passages"""
+
+    def __init__(self, count_tokens: Optional[TokenCounter] = None, adjacent_gap_chars: int = 4):
+        self.count_tokens = count_tokens or estimate_tokens
+        self.adjacent_gap_chars = adjacent_gap_chars
+
+    @staticmethod
+    def _passage(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """One passage of a document's chunks, given in text order with overlapping or touching spans"""
+        first = chunks[0]
+        passage = {
+            "rank": min(chunk["rank"] for chunk in chunks),
+            "text": first["text"],
+            "document_id": first["document_id"],
+            "chunk_ids": [chunk["chunk_id"] for chunk in chunks],
+            "metadata": first["metadata"],
+            "char_start": first["char_start"],
+            "char_end": first["char_end"],
+            "chunks": chunks,
+        }
+        for chunk in chunks[1:]:
+            gap = chunk["char_start"] - passage["char_end"]
+            if chunk["char_end"] > passage["char_end"]:
+                # Chunk text is the document text of its span, so the overlap is cut from the later one
+                tail = chunk["text"][max(0, -gap):]
+                passage["text"] = passage["text"] + (" " if gap == 1 else "\n" if gap > 0 else "") + tail
+                passage["char_end"] = chunk["char_end"]
+                passage["metadata"] = {**passage["metadata"], "page_end": chunk["metadata"].get("page_end")}
+        return passage
+
+    def _join(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Passages of chunks, merging a document's chunks wherever their spans overlap or touch"""
+        passages = []
+        spans: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            if chunk["char_start"] is None or chunk["char_end"] is None:
+                passages.append(self._passage([chunk]))
+            else:
+                spans.setdefault(chunk["document_id"], []).append(chunk)
+
+        for document_chunks in spans.values():
+            document_chunks = sorted(document_chunks, key=lambda chunk: chunk["char_start"])
+            group, group_end = [document_chunks[0]], document_chunks[0]["char_end"]
+            for chunk in document_chunks[1:]:
+                if chunk["char_start"] - group_end > self.adjacent_gap_chars:
+                    passages.append(self._passage(group))
+                    group, group_end = [], chunk["char_end"]
+                group.append(chunk)
+                group_end = max(group_end, chunk["char_end"])
+            passages.append(self._passage(group))
+        return passages
+
+    def _merge(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Passages of chunks merged per document, each with the rank of its best chunk"""
+        chunks = []
+        for rank, doc in enumerate(docs):
+            metadata = doc.get("metadata") or {}
+            chunks.append({
+                "rank": rank,
+                "text": doc["content"],
+                "document_id": doc["document_id"],
+                "chunk_id": doc.get("chunk_id"),
+                "metadata": metadata,
+                "char_start": metadata.get("char_start"),
+                "char_end": metadata.get("char_end"),
+            })
+
+        # Longest first so a passage repeated inside another one is dropped
+        unique: List[Dict[str, Any]] = []
+        for passage in sorted(self._join(chunks), key=lambda passage: len(passage["text"]), reverse=True):
+            text = passage["text"].strip()
+            container = next((kept for kept in unique if text in kept["text"]), None)
+            if container is None:
+                unique.append(passage)
+                continue
+            container["rank"] = min(container["rank"], passage["rank"])
+            # The container's copies of the dropped chunks take over their ranks
+            for chunk in passage["chunks"]:
+                for kept_chunk in container["chunks"]:
+                    if chunk["text"].strip() in kept_chunk["text"]:
+                        kept_chunk["rank"] = min(kept_chunk["rank"], chunk["rank"])
+        return sorted(unique, key=lambda passage: passage["rank"])
+
+    def _count(self, passages: List[Dict[str, Any]]) -> int:
+        """Set each passage's token count, as it appears in the prompt with its source line"""
+        for passage, tokens in zip(passages, self.count_tokens([self.block(passage) for passage in passages])):
+            passage["tokens"] = tokens
+        return sum(passage["tokens"] for passage in passages)
+
+    def _shrink(self, passage: Dict[str, Any], budget_tokens: int) -> List[Dict[str, Any]]:
+        """The passage's best chunks that fit budget_tokens, dropping the lowest-ranked first"""
+        chunks = sorted(passage["chunks"], key=lambda chunk: chunk["rank"])
+        while len(chunks) > 1:
+            chunks = chunks[:-1]
+            # Dropping a middle chunk splits the passage in two
+            pieces = self._join(chunks)
+            if self._count(pieces) <= budget_tokens:
+                return sorted(pieces, key=lambda piece: piece["char_start"] or 0)
+        return []
+
+    def pack(self, docs: List[Dict[str, Any]], budget_tokens: int) -> List[Dict[str, Any]]:
+        """Merged passages, best first, whose token counts add up to at most budget_tokens
+
+        docs are retrieval results ({"chunk_id", "content", "document_id",
+        "metadata"}) in rank order.
+        """
+        passages = self._merge(docs)
+        if not passages or budget_tokens <= 0:
+            return []
+        self._count(passages)
+
+        packed, used = [], 0
+        for passage in passages:
+            if used + passage["tokens"] <= budget_tokens:
+                pieces = [passage]
+            else:
+                pieces = self._shrink(passage, budget_tokens - used)
+            packed.extend(pieces)
+            used += sum(piece["tokens"] for piece in pieces)
+        if not packed:
+            best = min(passages[0]["chunks"], key=lambda chunk: chunk["rank"])
+            top = self._passage([best])
+            self._count([top])
+            packed = [self._truncate(top, budget_tokens)]
+        return packed
+
+    def _truncate(self, passage: Dict[str, Any], budget_tokens: int) -> Dict[str, Any]:
+        words = list(WORD_PATTERN.finditer(passage["text"]))
+        if not words:
+            return {**passage, "tokens": 0}
+        keep = max(1, len(words) * budget_tokens // max(1, passage["tokens"]))
+        while True:
+            text = passage["text"][:words[keep - 1].end()]
+            tokens = self.count_tokens([self.block({**passage, "text": text})])[0]
+            if tokens <= budget_tokens or keep == 1:
+                return {**passage, "text": text, "tokens": tokens, "truncated": True}
+            keep = max(1, keep * budget_tokens // tokens - 1)
+
+    @staticmethod
+    def block(passage: Dict[str, Any]) -> str:
+        """A passage's text under a line naming its file and pages"""
+        metadata = passage["metadata"]
+        source = metadata.get("filename") or passage["document_id"]
+        if metadata.get("page_start") is not None:
+            pages = metadata["page_start"], metadata.get("page_end") or metadata["page_start"]
+            source += f", page {pages[0]}" if pages[0] == pages[1] else f", pages {pages[0]}-{pages[1]}"
+        return f"[{source}]\n{passage['text'].strip()}"
+
+    @classmethod
+    def format(cls, passages: List[Dict[str, Any]]) -> str:
+        return "\n\n".join(cls.block(passage) for passage in passages)
@@ -0,0 +1,386 @@
+"""Shared sentence-embedding service.
+
+The model is loaded once per process and embedding requests from concurrent
+ingestions are merged into large batches, flushed when they reach
+max_batch_size texts or after max_wait_ms, so the CPU runs a few big encodes
+instead of many small ones. An optional on-disk cache keyed by model and chunk
+text hash lets re-indexing and duplicate content skip the model entirely, and
+an in-process LRU/TTL cache serves repeated search queries.
+"""
+import asyncio
+import copy
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """SQLite embedding cache keyed by (model, sha256 of chunk text) with LRU eviction"""
+
+    # Stay below SQLite's bound-parameter limit
+    QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_entries: int = 500000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash BLOB NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model: str, hashes: List[bytes]) -> Dict[bytes, List[float]]:
+        """Return cached vectors by hash and refresh their recency"""
+        found: Dict[bytes, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(hashes), self.QUERY_CHUNK):
+                part = hashes[start:start + self.QUERY_CHUNK]
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [model, *part]
+                ).fetchall()
+                for text_hash, vector in rows:
+                    found[bytes(text_hash)] = array("f", vector).tolist()
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(set(hashes)) - len(found)
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[bytes, List[float]]]):
+        """Store vectors, evicting the least recently used entries over max_entries"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(model, text_hash, array("f", vector).tobytes(), now) for text_hash, vector in items]
+            )
+            self._entries += self._connection.total_changes - before
+
+            overflow = self._entries - self.max_entries
+            if overflow > 0:
+                # Evict a little extra so eviction does not run on every insert
+                evict = overflow + max(1, self.max_entries // 100)
+                deleted = self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (evict,)
+                ).rowcount
+                self._entries -= deleted
+                self.evictions += deleted
+            self._connection.commit()
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU cache with TTL from normalized query text to its embedding"""
+
+    _WHITESPACE = re.compile(r"\s+")
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+        # Moving average of a query encode, credited as saved time on every hit
+        self._miss_ms = 0.0
+
+    @classmethod
+    def normalize(cls, query: str) -> str:
+        return cls._WHITESPACE.sub(" ", query).strip().lower()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.saved_ms += self._miss_ms
+        return entry[1]
+
+    def put(self, key: str, vector: List[float], encode_ms: float):
+        self._miss_ms = encode_ms if not self._miss_ms else 0.9 * self._miss_ms + 0.1 * encode_ms
+        self._entries[key] = (time.monotonic(), vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_encode_ms": round(self._miss_ms, 2),
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+
+class EmbeddingService:
+    """Preloaded sentence-transformers model behind a micro-batching queue"""
+
+    def __init__(self, model_name: str, max_batch_size: int = 256, max_wait_ms: float = 20.0,
+                 encode_batch_size: int = 64, cache: Optional[EmbeddingCache] = None,
+                 query_cache: Optional[QueryEmbeddingCache] = None):
+        self.model_name = model_name
+        self.cache = cache
+        self.query_cache = query_cache
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.encode_batch_size = encode_batch_size
+        self.model = None
+        self._load_lock = threading.Lock()
+        # Fast tokenizers raise when one instance is used from several threads at once, so
+        # query encoding and count_tokens() get tokenizers of their own (set by load()) and
+        # never wait for a batch encode, which holds the model's tokenizer until it is done
+        self._encode_lock = threading.Lock()
+        self._query_tokenizer_lock = threading.Lock()
+        self._count_tokenizer_lock = threading.Lock()
+        self._query_module = None
+        self._count_tokenizer = None
+        # One encoder thread: batches run back to back, torch uses the cores within a batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._stats = {
+            "requests": 0,
+            "chunks": 0,
+            "batches": 0,
+            "max_batch_size": 0,
+            "encode_seconds": 0.0,
+            "last_batch_size": 0,
+        }
+
+    def load(self):
+        """Load the model (blocking), safe to call more than once"""
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import SentenceTransformer
+                started = time.perf_counter()
+                model = SentenceTransformer(self.model_name)
+                model.eval()
+                # A copy of the first (Transformer) module tokenizes queries exactly like encode()
+                self._query_module = copy.copy(model[0])
+                self._query_module.tokenizer = copy.deepcopy(model.tokenizer)
+                self._count_tokenizer = copy.deepcopy(model.tokenizer)
+                self.model = model
+                logger.info(f"Loaded embedding model {self.model_name} in {time.perf_counter() - started:.1f}s")
+        return self.model
+
+    async def start(self):
+        """Preload the model and start the batcher on the running loop"""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+        self._ensure_batcher()
+
+    def _ensure_batcher(self):
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.create_task(self._run_batcher())
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts synchronously on the calling thread"""
+        model = self.load()
+        # model.encode uses the model's tokenizer, shared by the batcher and Chroma's embedding function
+        with self._encode_lock:
+            return model.encode(
+                texts,
+                batch_size=self.encode_batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ).tolist()
+
+    def encode_query(self, text: str) -> List[float]:
+        """Embed one query on the calling thread, alongside any running batch encode"""
+        import torch
+        model = self.load()
+        with self._query_tokenizer_lock:
+            features = self._query_module.tokenize([text])
+        # Only the tokenizer is per-thread state; the forward pass is safe to run concurrently
+        with torch.no_grad():
+            output = model({
+                name: value.to(model.device) if hasattr(value, "to") else value for name, value in features.items()
+            })
+        return output["sentence_embedding"][0].cpu().tolist()
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Model tokens per text, excluding special tokens"""
+        self.load()
+        with self._count_tokenizer_lock:
+            encoded = self._count_tokenizer(
+                texts, add_special_tokens=False, return_attention_mask=False, verbose=False
+            )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, serving cached vectors and batching the rest with other callers"""
+        if not texts:
+            return []
+        self._stats["requests"] += 1
+        if self.cache is None:
+            return await self._embed_batched(texts)
+
+        loop = asyncio.get_running_loop()
+        hashes = [EmbeddingCache.text_hash(text) for text in texts]
+        cached = await loop.run_in_executor(None, self.cache.get_many, self.model_name, hashes)
+
+        missing: Dict[bytes, str] = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            vectors = await self._embed_batched(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            cached.update(computed)
+            await loop.run_in_executor(None, self.cache.put_many, self.model_name, computed)
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, reusing the vector of a recently seen identical query"""
+        key = QueryEmbeddingCache.normalize(query)
+        if self.query_cache is not None:
+            vector = self.query_cache.get(key)
+            if vector is not None:
+                return vector
+
+        # Encoded off the batch thread so queries never wait behind ingestion batches
+        started = time.perf_counter()
+        vector = await asyncio.to_thread(self.encode_query, key)
+        if self.query_cache is not None:
+            self.query_cache.put(key, vector, 1000 * (time.perf_counter() - started))
+        return vector
+
+    async def _embed_batched(self, texts: List[str]) -> List[List[float]]:
+        self._ensure_batcher()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending: List[Tuple[List[str], asyncio.Future]] = [await self._queue.get()]
+            count = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while count < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            texts = [text for batch_texts, _ in pending for text in batch_texts]
+            started = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(self._executor, self.encode, texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} chunks failed: {e}")
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self._record_batch(len(texts), time.perf_counter() - started)
+
+            offset = 0
+            for batch_texts, future in pending:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(batch_texts)])
+                offset += len(batch_texts)
+
+    def _record_batch(self, size: int, seconds: float):
+        self._stats["chunks"] += size
+        self._stats["batches"] += 1
+        self._stats["encode_seconds"] += seconds
+        self._stats["last_batch_size"] = size
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], size)
+
+    def metrics(self) -> Dict[str, Any]:
+        stats = self._stats
+        return {
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "requests": stats["requests"],
+            "chunks": stats["chunks"],
+            "batches": stats["batches"],
+            "avg_batch_size": round(stats["chunks"] / stats["batches"], 2) if stats["batches"] else 0.0,
+            "max_batch_size": stats["max_batch_size"],
+            "last_batch_size": stats["last_batch_size"],
+            "queued_requests": self._queue.qsize() if self._queue is not None else 0,
+            "chunks_per_second": round(stats["chunks"] / stats["encode_seconds"], 2) if stats["encode_seconds"] else 0.0,
+            "cache": self.cache.metrics() if self.cache is not None else None,
+            "query_cache": self.query_cache.metrics() if self.query_cache is not None else None,
+        }
+
+    def as_chroma_function(self) -> "ChromaEmbeddingFunction":
+        return ChromaEmbeddingFunction(self)
+
+
+class ChromaEmbeddingFunction:
+    """Chroma embedding function backed by the shared, preloaded model"""
+
+    def __init__(self, service: EmbeddingService):
+        self.service = service
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.service.encode(list(input))
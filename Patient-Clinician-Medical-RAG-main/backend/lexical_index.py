@@ -0,0 +1,450 @@
+"""Array-backed BM25 lexical index over document chunks.
+
+Dense retrieval misses exact tokens such as drug names, lab codes and dosages,
+so every chunk is also indexed lexically. Postings are kept as typed arrays
+(chunk slot and term frequency per term) and scored with NumPy, so an index of
+hundreds of thousands of chunks stays a few bytes per posting. Removed chunks
+are tombstoned and the postings are compacted once enough of them pile up.
+
+Each partition is persisted as a base .npz file plus an append-only delta
+segment of per-chunk term counts, so indexing a document writes only its own
+postings. Processes sharing the directory (the API, worker.py) replay the
+delta records they have not seen yet before reading, and a background thread
+folds the delta into a new base file once it grows past a size. Writers and
+compaction hold an exclusive file lock per partition, readers a shared one.
+Within a process each partition has its own thread lock, so one patient's
+search never waits on another's, and compaction writes the new base file
+outside it.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Tuple, Iterable
+
+import numpy as np
+
+from medical_entities import tokenize
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class BM25Index:
+    """Incrementally maintained BM25 index of one partition's chunks"""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.terms: Dict[str, int] = {}
+        self.postings: List[array] = []  # term -> chunk slots ('I')
+        self.frequencies: List[array] = []  # term -> term frequency per slot ('H')
+        self.chunk_ids: List[str] = []
+        self.slot_documents = array('I')  # slot -> index into document_ids
+        self.lengths = array('I')  # slot -> token count, 0 once removed
+        self.document_ids: List[str] = []
+        self.documents: Dict[str, int] = {}
+        self.live_chunks = 0
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return self.live_chunks
+
+    @property
+    def dead_chunks(self) -> int:
+        return len(self.chunk_ids) - self.live_chunks
+
+    @staticmethod
+    def term_counts(texts: List[str]) -> List[Dict[str, int]]:
+        return [dict(Counter(tokenize(text))) for text in texts]
+
+    def replace_document(self, document_id: str, chunk_ids: List[str], texts: List[str]):
+        """Index a document's chunks in place of any it had before"""
+        self.replace_document_terms(document_id, chunk_ids, self.term_counts(texts))
+
+    def replace_document_terms(self, document_id: str, chunk_ids: List[str], term_counts: List[Dict[str, int]]):
+        """Index a document's chunks, given as term counts, in place of any it had before"""
+        self.remove_document(document_id)
+        document = self.documents.get(document_id)
+        if document is None:
+            document = self.documents[document_id] = len(self.document_ids)
+            self.document_ids.append(document_id)
+
+        for chunk_id, counts in zip(chunk_ids, term_counts):
+            slot = len(self.chunk_ids)
+            self.chunk_ids.append(chunk_id)
+            self.slot_documents.append(document)
+            length = sum(counts.values())
+            # Empty chunks keep length 1 so they are not mistaken for removed ones
+            self.lengths.append(max(1, length))
+            self.live_chunks += 1
+            self.total_length += max(1, length)
+            for term, count in counts.items():
+                term_id = self.terms.get(term)
+                if term_id is None:
+                    term_id = self.terms[term] = len(self.postings)
+                    self.postings.append(array('I'))
+                    self.frequencies.append(array('H'))
+                self.postings[term_id].append(slot)
+                self.frequencies[term_id].append(min(count, 65535))
+
+        if self.dead_chunks > max(1000, self.live_chunks):
+            self.compact()
+
+    def remove_document(self, document_id: str) -> int:
+        """Tombstone a document's chunks, returning how many were removed"""
+        document = self.documents.get(document_id)
+        if document is None:
+            return 0
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        slots = np.nonzero((np.frombuffer(self.slot_documents, dtype=np.uint32) == document) & (lengths > 0))[0]
+        for slot in slots:
+            self.total_length -= self.lengths[slot]
+            self.lengths[slot] = 0
+        self.live_chunks -= len(slots)
+        return len(slots)
+
+    def compact(self):
+        """Drop removed chunks from the postings and renumber the remaining slots"""
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32)
+        alive = lengths > 0
+        new_slots = np.cumsum(alive, dtype=np.int64) - 1
+
+        for term_id, postings in enumerate(self.postings):
+            slots = np.frombuffer(postings, dtype=np.uint32)
+            keep = alive[slots]
+            self.postings[term_id] = array('I', new_slots[slots[keep]].astype(np.uint32).tobytes())
+            self.frequencies[term_id] = array(
+                'H', np.frombuffer(self.frequencies[term_id], dtype=np.uint16)[keep].tobytes()
+            )
+
+        self.chunk_ids = [chunk_id for chunk_id, live in zip(self.chunk_ids, alive) if live]
+        self.slot_documents = array('I', np.frombuffer(self.slot_documents, dtype=np.uint32)[alive].tobytes())
+        self.lengths = array('I', lengths[alive].tobytes())
+
+    def search(self, query: str, k: int, document_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        """Top k (chunk id, BM25 score) for the query, optionally within some documents"""
+        if not self.live_chunks:
+            return []
+        slot_count = len(self.chunk_ids)
+        lengths = np.frombuffer(self.lengths, dtype=np.uint32).astype(np.float32)
+        average_length = self.total_length / self.live_chunks
+        norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+
+        scores = np.zeros(slot_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.terms.get(term)
+            if term_id is None:
+                continue
+            slots = np.frombuffer(self.postings[term_id], dtype=np.uint32)
+            # Tombstoned postings stay until the next compaction; skip them so they
+            # neither score nor count towards the document frequency
+            live = lengths[slots] > 0
+            slots = slots[live]
+            if not len(slots):
+                continue
+            frequencies = np.frombuffer(self.frequencies[term_id], dtype=np.uint16)[live].astype(np.float32)
+            idf = np.log(1 + (self.live_chunks - len(slots) + 0.5) / (len(slots) + 0.5))
+            np.add.at(scores, slots, idf * frequencies * (self.k1 + 1) / (frequencies + norms[slots]))
+
+        if document_ids is not None:
+            allowed = [self.documents[document_id] for document_id in document_ids if document_id in self.documents]
+            scores[~np.isin(np.frombuffer(self.slot_documents, dtype=np.uint32), allowed)] = 0
+
+        candidates = np.nonzero(scores)[0]
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.chunk_ids[slot], float(scores[slot])) for slot in candidates]
+
+    def nbytes(self) -> int:
+        """Approximate memory held by postings and per-chunk arrays"""
+        return (
+            sum(postings.itemsize * len(postings) for postings in self.postings)
+            + sum(frequencies.itemsize * len(frequencies) for frequencies in self.frequencies)
+            + self.lengths.itemsize * len(self.lengths)
+            + self.slot_documents.itemsize * len(self.slot_documents)
+        )
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Compact the index and copy it out as the compressed-row arrays save() writes"""
+        self.compact()
+        offsets = np.zeros(len(self.postings) + 1, dtype=np.int64)
+        np.cumsum([len(postings) for postings in self.postings], out=offsets[1:])
+        return {
+            "terms": np.array(list(self.terms), dtype=object),
+            "offsets": offsets,
+            "postings": np.frombuffer(b"".join(p.tobytes() for p in self.postings), dtype=np.uint32),
+            "frequencies": np.frombuffer(b"".join(f.tobytes() for f in self.frequencies), dtype=np.uint16),
+            "chunk_ids": np.array(self.chunk_ids, dtype=object),
+            # Copies, since a view would keep the arrays from growing
+            "slot_documents": np.frombuffer(self.slot_documents, dtype=np.uint32).copy(),
+            "lengths": np.frombuffer(self.lengths, dtype=np.uint32).copy(),
+            "document_ids": np.array(self.document_ids, dtype=object),
+            "parameters": np.array([self.k1, self.b]),
+        }
+
+    @staticmethod
+    def write_arrays(path: str, arrays: Dict[str, np.ndarray]) -> str:
+        """Write index arrays next to path, returning the temporary file to os.replace over it"""
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(file, **arrays)
+        return temp_path
+
+    def save(self, path: str):
+        """Write the index as compressed-row arrays, atomically replacing path"""
+        os.replace(self.write_arrays(path, self.arrays()), path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=True) as data:
+            index = cls(*data["parameters"].tolist())
+            offsets = data["offsets"]
+            postings, frequencies = data["postings"], data["frequencies"]
+            index.terms = {term: term_id for term_id, term in enumerate(data["terms"].tolist())}
+            index.postings = [array('I', postings[start:end].tobytes()) for start, end in zip(offsets, offsets[1:])]
+            index.frequencies = [array('H', frequencies[start:end].tobytes()) for start, end in zip(offsets, offsets[1:])]
+            index.chunk_ids = data["chunk_ids"].tolist()
+            index.slot_documents = array('I', data["slot_documents"].tobytes())
+            index.lengths = array('I', data["lengths"].tobytes())
+            index.document_ids = data["document_ids"].tolist()
+        index.documents = {document_id: i for i, document_id in enumerate(index.document_ids)}
+        index.live_chunks = sum(1 for length in index.lengths if length)
+        index.total_length = sum(index.lengths)
+        return index
+
+
+class LexicalIndexStore:
+    """Per-partition BM25 indexes persisted under one directory, shared across processes"""
+
+    def __init__(self, directory: str, compact_delta_bytes: int = 4 * 1024 * 1024):
+        self.directory = directory
+        self.compact_delta_bytes = compact_delta_bytes
+        os.makedirs(directory, exist_ok=True)
+        # partition -> (base file identity, delta bytes replayed, index)
+        self._indexes: Dict[str, Tuple[Optional[Tuple[int, int]], int, BM25Index]] = {}
+        self._partition_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()  # guards _partition_locks, _compacting and _stats
+        self._compacting: set = set()
+        self._latencies_ms = deque(maxlen=2000)
+        self._stats = {"delta_records": 0, "compactions": 0}
+
+    def _path(self, partition: str, suffix: str = "npz") -> str:
+        return os.path.join(self.directory, f"{partition}.{suffix}")
+
+    def _partition_lock(self, partition: str) -> threading.Lock:
+        with self._lock:
+            return self._partition_locks.setdefault(partition, threading.Lock())
+
+    @contextmanager
+    def _file_lock(self, partition: str, operation: int):
+        """Hold a flock on the partition's lock file, shared or exclusive across processes"""
+        with open(self._path(partition, "lock"), "a") as file:
+            fcntl.flock(file, operation)
+            yield
+
+    @staticmethod
+    def _identity(path: str) -> Optional[Tuple[int, int]]:
+        # A compaction replaces the base file, which gives it a new inode
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    @staticmethod
+    def _inode(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    @staticmethod
+    def _apply(index: BM25Index, record: Dict[str, Any]) -> int:
+        if record["op"] == "replace":
+            index.replace_document_terms(record["document_id"], record["chunk_ids"], record["terms"])
+            return len(record["chunk_ids"])
+        return sum(index.remove_document(document_id) for document_id in record["document_ids"])
+
+    def _load(self, partition: str) -> BM25Index:
+        """Cached index for the partition, caught up with the files on disk
+
+        Called with the partition's thread lock and at least a shared file lock held.
+        """
+        base = self._identity(self._path(partition))
+        delta_path = self._path(partition, "delta")
+        delta_size = os.path.getsize(delta_path) if os.path.exists(delta_path) else 0
+        cached = self._indexes.get(partition)
+        if cached is not None and cached[0] == base and cached[1] <= delta_size:
+            _, offset, index = cached
+        else:
+            index = BM25Index.load(self._path(partition)) if base is not None else BM25Index()
+            offset = 0
+
+        if delta_size > offset:
+            with open(delta_path, "rb") as file:
+                file.seek(offset)
+                data = file.read(delta_size - offset)
+            # A trailing line without newline is an interrupted append, left for the next writer
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping a corrupt delta record of lexical partition {partition}")
+                    continue
+                self._apply(index, record)
+            offset += len(complete)
+        self._indexes[partition] = (base, offset, index)
+        return index
+
+    def _write(self, partition: str, record: Dict[str, Any]) -> int:
+        """Apply a record to the partition and append it to the delta segment"""
+        with self._partition_lock(partition), self._file_lock(partition, fcntl.LOCK_EX):
+            index = self._load(partition)
+            changed = self._apply(index, record)
+            if record["op"] == "remove" and not changed:
+                return 0
+            base, offset, _ = self._indexes[partition]
+            with open(self._path(partition, "delta"), "ab") as file:
+                if file.tell() > offset:
+                    # Terminate the line an interrupted append left behind
+                    file.write(b"\n")
+                file.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+                offset = file.tell()
+            self._indexes[partition] = (base, offset, index)
+        with self._lock:
+            self._stats["delta_records"] += 1
+            if offset > self.compact_delta_bytes and partition not in self._compacting:
+                self._compacting.add(partition)
+                threading.Thread(target=self._compact_in_background, args=(partition,), daemon=True).start()
+        return changed
+
+    def replace_document(self, partition: str, document_id: str, chunk_ids: List[str], texts: List[str]):
+        self._write(partition, {
+            "op": "replace",
+            "document_id": document_id,
+            "chunk_ids": list(chunk_ids),
+            "terms": BM25Index.term_counts(texts),
+        })
+
+    def remove_documents(self, partition: str, document_ids: Iterable[str]) -> int:
+        """Remove documents' chunks from the partition, returning how many were removed"""
+        if partition not in self._indexes and partition not in self.partitions():
+            return 0
+        return self._write(partition, {"op": "remove", "document_ids": list(document_ids)})
+
+    def compact(self, partition: str):
+        """Fold the partition's delta segment into a new base file
+
+        The index is snapshotted under the locks and written out without them,
+        so searches and writes carry on meanwhile; records appended during the
+        write stay in the delta.
+        """
+        path = self._path(partition)
+        delta_path = self._path(partition, "delta")
+        with self._partition_lock(partition), self._file_lock(partition, fcntl.LOCK_EX):
+            self._load(partition)
+            base, offset, index = self._indexes[partition]
+            delta = self._inode(delta_path)
+            arrays = index.arrays()
+        temp_path = BM25Index.write_arrays(path, arrays)
+
+        with self._partition_lock(partition), self._file_lock(partition, fcntl.LOCK_EX):
+            index = self._load(partition)
+            current_delta = self._inode(delta_path)
+            if self._identity(path) != base or (delta is not None and current_delta != delta):
+                # Another process compacted or dropped the partition meanwhile
+                os.remove(temp_path)
+                return
+            tail = b""
+            if current_delta is not None:
+                with open(delta_path, "rb") as file:
+                    file.seek(offset)
+                    tail = file.read()
+            os.replace(temp_path, path)
+            # A crash before the delta is rewritten only replays records the base already holds
+            temp_path = f"{delta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(tail)
+            os.replace(temp_path, delta_path)
+            self._indexes[partition] = (self._identity(path), len(tail), index)
+        with self._lock:
+            self._stats["compactions"] += 1
+
+    def _compact_in_background(self, partition: str):
+        try:
+            self.compact(partition)
+        except Exception as e:
+            logger.error(f"Compacting lexical partition {partition} failed: {e}")
+        finally:
+            with self._lock:
+                self._compacting.discard(partition)
+
+    def partitions(self) -> List[str]:
+        return sorted({
+            name.rsplit(".", 1)[0] for name in os.listdir(self.directory)
+            if name.endswith(".npz") or name.endswith(".delta")
+        })
+
+    def document_ids(self, partition: str) -> set:
+        """Ids of the documents with live chunks in the partition"""
+        with self._partition_lock(partition):
+            with self._file_lock(partition, fcntl.LOCK_SH):
+                index = self._load(partition)
+            lengths = np.frombuffer(index.lengths, dtype=np.uint32)
+            documents = np.unique(np.frombuffer(index.slot_documents, dtype=np.uint32)[lengths > 0])
+            return {index.document_ids[document] for document in documents}
+
+    def drop(self, partition: str):
+        with self._partition_lock(partition), self._file_lock(partition, fcntl.LOCK_EX):
+            self._indexes.pop(partition, None)
+            for suffix in ("npz", "delta"):
+                try:
+                    os.remove(self._path(partition, suffix))
+                except OSError:
+                    pass
+
+    def search(self, partition: str, query: str, k: int,
+               document_ids: Optional[Iterable[str]] = None) -> List[Tuple[str, float]]:
+        started = time.perf_counter()
+        with self._partition_lock(partition):
+            with self._file_lock(partition, fcntl.LOCK_SH):
+                index = self._load(partition)
+            results = index.search(query, k, document_ids)
+        self._latencies_ms.append(1000 * (time.perf_counter() - started))
+        return results
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else 0.0
+
+        with self._lock:
+            indexes = [index for _, _, index in self._indexes.values()]
+        return {
+            **self._stats,
+            "loaded_partitions": len(indexes),
+            "chunks": sum(len(index) for index in indexes),
+            "bytes": sum(index.nbytes() for index in indexes),
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p99": percentile(0.99),
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists, scoring each id by the sum of 1 / (k + rank)"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
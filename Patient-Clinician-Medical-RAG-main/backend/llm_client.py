@@ -0,0 +1,178 @@
+"""Async pooled client for the Ollama generation API.
+
+Generation used to go through a blocking requests.post inside async handlers,
+freezing the event loop for the length of an answer and opening a new TCP
+connection per call. This client shares one httpx connection pool with
+keep-alive across requests, separates the connect timeout (Ollama down) from
+the read timeout (slow generation), and can be cancelled: cancelling the
+awaiting task closes the connection, which makes Ollama stop generating.
+Streamed generations record time to first token and decode tokens/sec.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Optional, Dict, Any, AsyncIterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """Generation failed: Ollama unreachable, timed out or returned an error"""
+
+
+class OllamaClient:
+    """Shared keep-alive connection pool to an Ollama server"""
+
+    def __init__(self, base_url: str, model: str, connect_timeout: float = 5.0, read_timeout: float = 120.0,
+                 max_connections: int = 8, keepalive_seconds: float = 60.0, options: Optional[Dict[str, Any]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.options = options or {}
+        self.timeout = httpx.Timeout(connect_timeout, read=read_timeout, write=connect_timeout, pool=read_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_seconds
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._latencies_ms = deque(maxlen=2000)
+        self._ttft_ms = deque(maxlen=2000)
+        self._tokens_per_second = deque(maxlen=2000)
+        self._prompt_tokens = deque(maxlen=2000)
+        self._stats = {"requests": 0, "streams": 0, "errors": 0, "timeouts": 0, "cancelled": 0}
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    async def start(self):
+        self._http()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _payload(self, prompt: str, stream: bool, options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"model": self.model, "prompt": prompt, "stream": stream, "options": {**self.options, **(options or {})}}
+
+    def _record_counts(self, message: Dict[str, Any], stats: Optional[Dict[str, Any]]):
+        """Copy Ollama's final token counts into stats"""
+        if "prompt_eval_count" in message:
+            self._prompt_tokens.append(message["prompt_eval_count"])
+        if stats is None:
+            return
+        if "prompt_eval_count" in message:
+            stats["prompt_tokens"] = message["prompt_eval_count"]
+        if "eval_count" in message:
+            stats["completion_tokens"] = message["eval_count"]
+        if message.get("eval_duration"):
+            stats["tokens_per_second"] = round(message["eval_count"] / (message["eval_duration"] / 1e9), 2)
+
+    async def generate(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       stats: Optional[Dict[str, Any]] = None) -> str:
+        """Complete the prompt, raising LLMError on failure
+
+        stats, if given, receives Ollama's prompt and completion token counts.
+        """
+        started = time.perf_counter()
+        self._stats["requests"] += 1
+        try:
+            response = await self._http().post("/api/generate", json=self._payload(prompt, False, options))
+            response.raise_for_status()
+            message = response.json()
+            self._record_counts(message, stats)
+            return message.get("response", "")
+        except asyncio.CancelledError:
+            self._stats["cancelled"] += 1
+            raise
+        except httpx.TimeoutException as e:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"Ollama timed out: {e!r}") from e
+        except (httpx.HTTPError, ValueError) as e:
+            self._stats["errors"] += 1
+            raise LLMError(f"Ollama request failed: {e!r}") from e
+        finally:
+            self._latencies_ms.append(1000 * (time.perf_counter() - started))
+
+    async def stream(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     stats: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield the completion as Ollama generates it, raising LLMError on failure
+
+        stats, if given, receives ttft_ms, completion_tokens, tokens_per_second
+        and prompt_tokens. Closing the iterator early closes the connection.
+        """
+        stats = {} if stats is None else stats
+        started = time.perf_counter()
+        first_token = None
+        pieces = 0
+        done = False
+        self._stats["requests"] += 1
+        self._stats["streams"] += 1
+        try:
+            async with self._http().stream(
+                "POST", "/api/generate", json=self._payload(prompt, True, options)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise LLMError(f"Ollama error: {message['error']}")
+                    if message.get("response"):
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                            stats["ttft_ms"] = round(1000 * (first_token - started), 1)
+                            self._ttft_ms.append(stats["ttft_ms"])
+                        pieces += 1
+                        yield message["response"]
+                    if message.get("done"):
+                        done = True
+                        break
+            if not done:
+                raise LLMError("Ollama stream ended before the answer was done")
+
+            stats.setdefault("completion_tokens", pieces)
+            self._record_counts(message, stats)
+            if "tokens_per_second" not in stats and first_token is not None and pieces > 1:
+                stats["tokens_per_second"] = round((pieces - 1) / (time.perf_counter() - first_token), 2)
+            if "tokens_per_second" in stats:
+                self._tokens_per_second.append(stats["tokens_per_second"])
+        except (asyncio.CancelledError, GeneratorExit):
+            self._stats["cancelled"] += 1
+            raise
+        except LLMError:
+            self._stats["errors"] += 1
+            raise
+        except httpx.TimeoutException as e:
+            self._stats["timeouts"] += 1
+            raise LLMError(f"Ollama timed out: {e!r}") from e
+        except (httpx.HTTPError, ValueError) as e:
+            self._stats["errors"] += 1
+            raise LLMError(f"Ollama request failed: {e!r}") from e
+        finally:
+            self._latencies_ms.append(1000 * (time.perf_counter() - started))
+
+    def metrics(self) -> Dict[str, Any]:
+        def percentile(values: deque, p: float) -> float:
+            values = sorted(values)
+            return round(values[min(len(values) - 1, int(p * len(values)))], 2) if values else 0.0
+
+        return {
+            "model": self.model,
+            **self._stats,
+            "latency_ms_p50": percentile(self._latencies_ms, 0.50),
+            "latency_ms_p99": percentile(self._latencies_ms, 0.99),
+            "ttft_ms_p50": percentile(self._ttft_ms, 0.50),
+            "ttft_ms_p99": percentile(self._ttft_ms, 0.99),
+            "tokens_per_second_p50": percentile(self._tokens_per_second, 0.50),
+            "prompt_tokens_p50": percentile(self._prompt_tokens, 0.50),
+            "prompt_tokens_p99": percentile(self._prompt_tokens, 0.99),
+        }
@@ -0,0 +1,120 @@
+"""Admission control for LLM generations.
+
+A CPU-bound Ollama instance serves only a couple of generations at once;
+firing every request at it makes them all slow down and time out together.
+The scheduler lets max_concurrent generations run, queues up to max_queue
+more in priority order (lower first, FIFO within a priority), and rejects
+the rest immediately with an estimate of when to retry. Waiters that are
+cancelled, e.g. because their client disconnected, leave the queue.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator
+
+
+class LLMQueueFull(Exception):
+    """Raised instead of queueing when the scheduler's queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """Priority queue with a concurrency limit in front of the LLM backend"""
+
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 16):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self._active = 0
+        # [priority, sequence, future]; cancelled waiters are skipped when popped
+        self._queue: List[list] = []
+        self._queued: Dict[int, int] = {}
+        self._sequence = itertools.count()
+        self._wait_ms = deque(maxlen=2000)
+        # Moving average of how long a generation holds its slot
+        self._service_seconds = 0.0
+        self._stats = {"admitted": 0, "rejected": 0, "cancelled_waiting": 0}
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    @property
+    def full(self) -> bool:
+        return self._active >= self.max_concurrent and self.queued >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained"""
+        rounds = (self.queued + self._active) / self.max_concurrent
+        return max(1, round(rounds * (self._service_seconds or 1.0)))
+
+    async def acquire(self, priority: int):
+        """Wait for a generation slot, raising LLMQueueFull if the queue is full"""
+        started = time.perf_counter()
+        if self._active < self.max_concurrent and not self.queued:
+            self._active += 1
+        else:
+            if self.queued >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise LLMQueueFull(self.retry_after())
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, [priority, next(self._sequence), future])
+            self._queued[priority] = self._queued.get(priority, 0) + 1
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    self._queued[priority] -= 1
+                    self._stats["cancelled_waiting"] += 1
+                else:
+                    # The slot was handed over as the waiter was cancelled, pass it on
+                    self.release()
+                raise
+        self._stats["admitted"] += 1
+        self._wait_ms.append(1000 * (time.perf_counter() - started))
+
+    def release(self):
+        """Hand the slot to the first live waiter, or free it"""
+        while self._queue:
+            priority, _, future = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            self._queued[priority] -= 1
+            future.set_result(None)
+            return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int) -> AsyncIterator[None]:
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._service_seconds = elapsed if not self._service_seconds else \
+                0.9 * self._service_seconds + 0.1 * elapsed
+            self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._wait_ms)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else 0.0
+
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "active": self._active,
+            "queue_depth": self.queued,
+            "queue_depth_by_priority": {str(priority): count for priority, count in sorted(self._queued.items()) if count},
+            **self._stats,
+            "avg_generation_ms": round(1000 * self._service_seconds, 1),
+            "wait_ms_p50": percentile(0.50),
+            "wait_ms_p99": percentile(0.99),
+        }
@@ -0,0 +1,171 @@
+"""Dictionary-backed medical entity extraction.
+
+Lexicons of medications, conditions, procedures and lab analytes are loaded
+once into a token-level Aho-Corasick automaton, so a document is scanned in a
+single linear pass no matter how many terms the lexicons hold. Vital signs are
+matched with precompiled patterns and lab analytes only count when followed by
+a numeric result.
+"""
+import logging
+import os
+import re
+from collections import deque
+from typing import List, Dict, Tuple, Iterable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+
+# Lexicon file -> entity category
+LEXICON_FILES = {
+    "medications.txt": "medications",
+    "conditions.txt": "conditions",
+    "procedures.txt": "procedures",
+    "lab_analytes.txt": "lab_values",
+}
+
+ENTITY_CATEGORIES = ["conditions", "medications", "procedures", "vital_signs", "lab_values"]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*", re.IGNORECASE)
+
+VITAL_SIGN_PATTERNS = [
+    re.compile(r'(?:bp|blood pressure):\s*(\d+/\d+)', re.IGNORECASE),
+    re.compile(r'(?:hr|heart rate):\s*(\d+)', re.IGNORECASE),
+    re.compile(r'(?:temp|temperature):\s*(\d+\.?\d*)', re.IGNORECASE),
+]
+
+# Anchored right after a lab analyte: "Hemoglobin: 13.2 g/dL", "K 4.1", "LDL = 130 mg/dL"
+LAB_RESULT_PATTERN = re.compile(
+    r"[ \t]*(?:[:=][ \t]*|is[ \t]+|of[ \t]+)?([<>]?\d+(?:\.\d+)?)(?:[ \t]*(%|[a-zA-Zµ][\w/^µ.]*))?"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+class TokenAutomaton:
+    """Aho-Corasick automaton over word tokens"""
+
+    def __init__(self):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # (phrase length in tokens, category, canonical name) per state
+        self.outputs: List[List[Tuple[int, str, str]]] = [[]]
+        self.size = 0
+
+    def add(self, tokens: List[str], category: str, canonical: str):
+        state = 0
+        for token in tokens:
+            next_state = self.goto[state].get(token)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.outputs.append([])
+                self.goto[state][token] = next_state
+            state = next_state
+        self.outputs[state].append((len(tokens), category, canonical))
+        self.size += 1
+
+    def build(self):
+        """Compute failure links breadth-first"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(token, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+    def search(self, tokens: Iterable[str]) -> List[Tuple[int, int, str, str]]:
+        """Return (start token, end token exclusive, category, canonical) for every match"""
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        matches = []
+        state = 0
+        for index, token in enumerate(tokens):
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            for length, category, canonical in outputs[state]:
+                matches.append((index + 1 - length, index + 1, category, canonical))
+        return matches
+
+
+class MedicalEntityExtractor:
+    """Single-pass lexicon matcher for medical entities"""
+
+    def __init__(self, lexicons: Dict[str, List[List[str]]]):
+        self.automaton = TokenAutomaton()
+        for category, entries in lexicons.items():
+            for names in entries:
+                canonical = names[0]
+                for name in names:
+                    tokens = tokenize(name)
+                    if tokens:
+                        self.automaton.add(tokens, category, canonical)
+        self.automaton.build()
+        logger.info(f"Loaded {self.automaton.size} medical lexicon terms")
+
+    @classmethod
+    def from_directory(cls, directory: str = DEFAULT_LEXICON_DIR) -> "MedicalEntityExtractor":
+        """Load every known lexicon file present in directory"""
+        lexicons: Dict[str, List[List[str]]] = {}
+        for filename, category in LEXICON_FILES.items():
+            path = os.path.join(directory, filename)
+            if not os.path.exists(path):
+                logger.warning(f"Medical lexicon not found: {path}")
+                continue
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        names = [name.strip() for name in line.split("|") if name.strip()]
+                        lexicons.setdefault(category, []).append(names)
+        return cls(lexicons)
+
+    def extract(self, text: str) -> Dict[str, List[str]]:
+        """Extract medical entities from text"""
+        entities: Dict[str, List[str]] = {category: [] for category in ENTITY_CATEGORIES}
+        seen = {category: set() for category in ENTITY_CATEGORIES}
+
+        def add(category: str, value: str):
+            if value not in seen[category]:
+                seen[category].add(value)
+                entities[category].append(value)
+
+        spans = []
+        tokens = []
+        for match in TOKEN_PATTERN.finditer(text):
+            spans.append(match.span())
+            tokens.append(match.group().lower())
+
+        # Leftmost-longest, non-overlapping matches
+        matches = sorted(self.automaton.search(tokens), key=lambda match: (match[0], match[0] - match[1]))
+        covered_until = 0
+        for start, end, category, canonical in matches:
+            if start < covered_until:
+                continue
+            if category == "lab_values":
+                result = LAB_RESULT_PATTERN.match(text, spans[end - 1][1])
+                if not result:
+                    continue
+                value, unit = result.groups()
+                unit = unit.rstrip(".") if unit else unit
+                add(category, f"{canonical} {value} {unit}" if unit else f"{canonical} {value}")
+            else:
+                add(category, canonical)
+            covered_until = end
+
+        for pattern in VITAL_SIGN_PATTERNS:
+            for value in pattern.findall(text):
+                add("vital_signs", value)
+
+        return entities
+
+    def extract_batch(self, texts: List[str]) -> List[Dict[str, List[str]]]:
+        """Extract entities for many texts, e.g. when re-extracting stored documents"""
+        return [self.extract(text or "") for text in texts]
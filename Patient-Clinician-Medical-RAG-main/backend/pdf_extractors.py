@@ -0,0 +1,124 @@
+"""PDF text-layer extraction backends.
+
+Each backend parses a PDF once and returns its per-page text, page count and
+document metadata together. Backends are selected by name with
+get_extractor(); optional libraries are only imported when their backend is
+constructed.
+"""
+import logging
+import threading
+import time
+from typing import List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# PDFium is not thread-safe, every pypdfium2 call in the process goes through this lock
+PDFIUM_LOCK = threading.Lock()
+
+
+class PDFTextExtractor:
+    """Base class for PDF text extraction backends"""
+
+    name = "base"
+
+    def extract(self, file_path: str) -> Dict[str, Any]:
+        """Parse the PDF once and return pages, page_count and metadata
+
+        Each page is a dict with its 1-based page number, text, source and
+        extraction time in seconds.
+        """
+        raise NotImplementedError
+
+    def _page(self, page_number: int, text: str, started: float) -> Dict[str, Any]:
+        return {
+            "page": page_number,
+            "text": text or "",
+            "source": "text_layer",
+            "seconds": round(time.perf_counter() - started, 3)
+        }
+
+
+class PyPDF2Extractor(PDFTextExtractor):
+    """Pure-Python extraction with PyPDF2"""
+
+    name = "pypdf2"
+
+    def __init__(self):
+        from PyPDF2 import PdfReader
+        self._reader_class = PdfReader
+
+    def extract(self, file_path: str) -> Dict[str, Any]:
+        pages: List[Dict[str, Any]] = []
+        with open(file_path, 'rb') as file:
+            pdf_reader = self._reader_class(file)
+            for page_number, page in enumerate(pdf_reader.pages, start=1):
+                started = time.perf_counter()
+                pages.append(self._page(page_number, page.extract_text(), started))
+            metadata = {
+                key.lstrip("/"): str(value)
+                for key, value in (pdf_reader.metadata or {}).items()
+            }
+        return {"pages": pages, "page_count": len(pages), "metadata": metadata}
+
+
+class PdfiumExtractor(PDFTextExtractor):
+    """Native extraction with PDFium through pypdfium2"""
+
+    name = "pdfium"
+
+    def __init__(self):
+        import pypdfium2
+        self._pdfium = pypdfium2
+
+    def extract(self, file_path: str) -> Dict[str, Any]:
+        with PDFIUM_LOCK:
+            return self._extract(file_path)
+
+    def _extract(self, file_path: str) -> Dict[str, Any]:
+        pages: List[Dict[str, Any]] = []
+        pdf = self._pdfium.PdfDocument(file_path)
+        try:
+            for index in range(len(pdf)):
+                started = time.perf_counter()
+                page = pdf[index]
+                text_page = page.get_textpage()
+                try:
+                    text = text_page.get_text_range()
+                finally:
+                    text_page.close()
+                    page.close()
+                pages.append(self._page(index + 1, text, started))
+            metadata = {key: value for key, value in pdf.get_metadata_dict().items() if value}
+        finally:
+            pdf.close()
+        return {"pages": pages, "page_count": len(pages), "metadata": metadata}
+
+
+EXTRACTORS = {
+    PyPDF2Extractor.name: PyPDF2Extractor,
+    PdfiumExtractor.name: PdfiumExtractor,
+}
+
+
+def get_extractor(name: str) -> PDFTextExtractor:
+    """Build the named backend, falling back to PyPDF2 if its library is missing"""
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown PDF extractor '{name}', expected one of {sorted(EXTRACTORS)}")
+    try:
+        return EXTRACTORS[name]()
+    except ImportError as e:
+        if name == PyPDF2Extractor.name:
+            raise
+        logger.warning(f"PDF extractor '{name}' unavailable ({e}), falling back to {PyPDF2Extractor.name}")
+        return PyPDF2Extractor()
+
+
+def available_extractors() -> List[PDFTextExtractor]:
+    """Instantiate every backend whose library is installed"""
+    extractors = []
+    for extractor_class in EXTRACTORS.values():
+        try:
+            extractors.append(extractor_class())
+        except ImportError:
+            continue
+    return extractors
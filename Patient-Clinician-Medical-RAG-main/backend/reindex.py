@@ -0,0 +1,65 @@
+"""Rebuild the vector index from stored document text.
+
+Re-chunks and re-embeds every completed document whose index version differs
+from the current chunking, embedding model and vector store settings, without
+re-running OCR. The new version is built in partitions of its own while
+queries keep searching the active one, and queries switch to it only once
+every document is in it; index GC then drops the old version:
+
+    python reindex.py --batch-size 50 --concurrency 4
+
+With --gc it instead removes chunks of deleted or failed documents and
+compacts the vector store, reporting chunk counts before and after.
+"""
+import argparse
+import asyncio
+
+# As in worker.py, server is only imported when run: processes spawned from here
+# re-import this module and must not initialize the whole API
+
+
+async def run_reindex(batch_size: int, concurrency: int):
+    from server import embedding_service, IndexRebuilder, ensure_shared_indexes, client, logger, INDEX_VERSION
+
+    rebuilder = IndexRebuilder(batch_size=batch_size, concurrency=concurrency)
+    try:
+        await ensure_shared_indexes(separate_process=True)
+        await embedding_service.start()
+        status = await rebuilder.status()
+        logger.info(f"Index version {INDEX_VERSION}: {status['stale_documents']} stale documents")
+        stats = await rebuilder.rebuild()
+        print(
+            f"Reindexed {stats['reindexed']} documents, {stats['failed']} failed, "
+            f"queries search index version {stats['active_version']}"
+        )
+    finally:
+        client.close()
+
+
+async def run_gc():
+    from server import VectorIndexGC, ensure_shared_indexes, client
+
+    try:
+        await ensure_shared_indexes(separate_process=True)
+        stats = await VectorIndexGC(interval_seconds=0).run()
+        print(
+            f"Removed {stats['orphan_documents']} orphan documents: {stats['chunks_before']} -> "
+            f"{stats['chunks_after']} chunks, {stats['bytes_reclaimed']} bytes reclaimed"
+        )
+    finally:
+        client.close()
+
+
+def main():
+    from server import REINDEX_BATCH_SIZE, REINDEX_CONCURRENCY
+
+    parser = argparse.ArgumentParser(description="Rebuild stale HealthSync vector index entries")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=REINDEX_CONCURRENCY)
+    parser.add_argument("--gc", action="store_true", help="collect orphan chunks and compact instead")
+    args = parser.parse_args()
+    asyncio.run(run_gc() if args.gc else run_reindex(args.batch_size, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
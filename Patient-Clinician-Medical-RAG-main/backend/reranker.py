@@ -0,0 +1,178 @@
+"""Cross-encoder reranking of retrieval candidates.
+
+First-stage retrieval returns a wide candidate set cheaply. A small
+cross-encoder then scores every (query, chunk) pair on the CPU in batches and
+the final context is every candidate above a score cutoff, between min_k and
+max_k chunks. Scores are cached by query and chunk text, so repeated questions
+skip the model. Reranking has a latency budget: when it is exceeded the
+caller gets the candidates in first-stage order and the scoring finishes in
+the background, still warming the cache. Jobs whose caller gave up before they
+reached the scoring thread are skipped, and with max_pending jobs already
+waiting or running, requests fall back at once instead of queueing.
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Tuple
+
+from embeddings import QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """Batched CPU cross-encoder with a (query, chunk) score cache"""
+
+    def __init__(self, model_name: str, batch_size: int = 16, score_threshold: float = 0.0,
+                 min_k: int = 1, max_k: int = 8, budget_ms: float = 400.0, cache_entries: int = 50000,
+                 max_pending: int = 4):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.score_threshold = score_threshold
+        self.min_k = min_k
+        self.max_k = max_k
+        self.budget = budget_ms / 1000
+        self.cache_entries = cache_entries
+        self.max_pending = max(1, max_pending)
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # One scoring thread, torch uses the cores within a batch
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        # Jobs submitted to the executor and not finished, only touched on the event loop
+        self._pending = 0
+        self._latencies_ms = deque(maxlen=2000)
+        self._stats = {"requests": 0, "fallbacks": 0, "shed": 0, "stale_skipped": 0, "pairs": 0, "cache_hits": 0, "kept": 0}
+
+    def load(self):
+        """Load the model (blocking), safe to call more than once"""
+        with self._load_lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                started = time.perf_counter()
+                self.model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Loaded reranker {self.model_name} in {time.perf_counter() - started:.1f}s")
+        return self.model
+
+    async def start(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.load)
+
+    @staticmethod
+    def _key(query: str, text: str) -> bytes:
+        return hashlib.sha256(f"{query}\0{text}".encode("utf-8")).digest()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Cross-encoder scores for the texts, computing only uncached pairs"""
+        query = QueryEmbeddingCache.normalize(query)
+        keys = [self._key(query, text) for text in texts]
+        scores: Dict[bytes, float] = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+        self._stats["cache_hits"] += len(scores)
+
+        missing = [(key, text) for key, text in dict(zip(keys, texts)).items() if key not in scores]
+        if missing:
+            model = self.load()
+            computed = model.predict(
+                [(query, text) for _, text in missing], batch_size=self.batch_size, show_progress_bar=False
+            )
+            self._stats["pairs"] += len(missing)
+            with self._cache_lock:
+                for (key, _), value in zip(missing, computed):
+                    scores[key] = self._cache[key] = float(value)
+                while len(self._cache) > self.cache_entries:
+                    self._cache.popitem(last=False)
+        return [scores[key] for key in keys]
+
+    def _score_until(self, deadline: float, query: str, texts: List[str]) -> Optional[List[float]]:
+        """score(), or None if the job only reached the thread after its caller gave up"""
+        if time.monotonic() > deadline:
+            self._stats["stale_skipped"] += 1
+            return None
+        return self.score(query, texts)
+
+    def _job_done(self, _):
+        self._pending -= 1
+
+    def select(self, candidates: List[Dict[str, Any]], scores: List[float]) -> List[Dict[str, Any]]:
+        """Candidates ordered by score, cut at the threshold within [min_k, max_k]"""
+        ranked = sorted(
+            ({**candidate, "rerank_score": score} for candidate, score in zip(candidates, scores)),
+            key=lambda candidate: candidate["rerank_score"],
+            reverse=True
+        )
+        kept = [candidate for candidate in ranked[:self.max_k] if candidate["rerank_score"] >= self.score_threshold]
+        return kept if len(kept) >= self.min_k else ranked[:self.min_k]
+
+    async def rerank(self, query: str, candidates: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Rerank candidates with a "content" key, falling back to their order when over budget"""
+        if not candidates:
+            return [], {"reranked": False, "ms": 0.0}
+        started = time.perf_counter()
+        self._stats["requests"] += 1
+        if self._pending >= self.max_pending:
+            # The queue already holds more work than fits in the budget
+            self._stats["shed"] += 1
+            self._stats["fallbacks"] += 1
+            selected = candidates[:self.max_k]
+            self._stats["kept"] += len(selected)
+            return selected, {"reranked": False, "ms": 0.0, "candidates": len(candidates)}
+
+        self._pending += 1
+        scoring = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._score_until, time.monotonic() + self.budget, query,
+            [candidate["content"] for candidate in candidates]
+        )
+        scoring.add_done_callback(self._job_done)
+        try:
+            scores = await asyncio.wait_for(asyncio.shield(scoring), self.budget)
+            if scores is None:
+                raise asyncio.TimeoutError
+            selected = self.select(candidates, scores)
+            reranked = True
+        except asyncio.TimeoutError:
+            # Scoring keeps running and fills the cache for the next identical query
+            self._stats["fallbacks"] += 1
+            selected = candidates[:self.max_k]
+            reranked = False
+        except Exception as e:
+            logger.error(f"Reranking failed: {e}")
+            self._stats["fallbacks"] += 1
+            selected = candidates[:self.max_k]
+            reranked = False
+
+        elapsed_ms = 1000 * (time.perf_counter() - started)
+        self._latencies_ms.append(elapsed_ms)
+        self._stats["kept"] += len(selected)
+        return selected, {"reranked": reranked, "ms": round(elapsed_ms, 1), "candidates": len(candidates)}
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else 0.0
+
+        requests = self._stats["requests"]
+        lookups = self._stats["pairs"] + self._stats["cache_hits"]
+        return {
+            "model": self.model_name,
+            "requests": requests,
+            "fallbacks": self._stats["fallbacks"],
+            "shed": self._stats["shed"],
+            "stale_skipped": self._stats["stale_skipped"],
+            "pending": self._pending,
+            "pairs_scored": self._stats["pairs"],
+            "cache_entries": len(self._cache),
+            "cache_hit_rate": round(self._stats["cache_hits"] / lookups, 4) if lookups else 0.0,
+            "avg_kept": round(self._stats["kept"] / requests, 2) if requests else 0.0,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p99": percentile(0.99),
+        }
@@ -1,15 +1,21 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import FileResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable, AsyncIterator
+from contextlib import asynccontextmanager
 import uuid
+import time
+import hashlib
+import socket
 from datetime import datetime, timedelta
 import jwt
 from passlib.context import CryptContext
@@ -21,15 +27,20 @@ import io
 
 # Medical analysis and RAG
 import requests
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
 import chromadb
-import pytesseract
-from pdf2image import convert_from_path
-from PyPDF2 import PdfReader
-import cv2
-import numpy as np
-from PIL import Image
+from ocr_engine import OCREngine
+from pdf_extractors import get_extractor
+from medical_entities import MedicalEntityExtractor
+from embeddings import EmbeddingService, EmbeddingCache, QueryEmbeddingCache
+from vector_search import VectorSearchBatcher
+from chunking import MedicalChunker, page_starts
+from reranker import CrossEncoderReranker
+from vector_store import ChromaVectorStore, MmapVectorStore, partition_name, partition_version, version_partition
+from lexical_index import LexicalIndexStore, reciprocal_rank_fusion
+from llm_client import OllamaClient, LLMError
+from answer_cache import AnswerCache
+from llm_scheduler import LLMScheduler, LLMQueueFull
+from context_packing import ContextPacker
 
 # MinIO for file storage
 from minio import Minio
@@ -51,7 +62,7 @@ import matplotlib.dates as mdates
 
 # Wearable data APIs
 from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 import fitbit
@@ -72,6 +83,14 @@ MINIO_ACCESS_KEY = os.environ.get('MINIO_ACCESS_KEY', 'minioadmin')
 MINIO_SECRET_KEY = os.environ.get('MINIO_SECRET_KEY', 'minioadmin')
 MINIO_BUCKET = os.environ.get('MINIO_BUCKET', 'health-documents')
 
+# Upload Configuration
+MAX_FILE_SIZE_MB = int(os.environ.get('MAX_FILE_SIZE_MB', '50'))
+UPLOAD_READ_CHUNK_SIZE = 1024 * 1024
+# Multipart part size for MinIO uploads (S3 minimum is 5 MiB)
+UPLOAD_PART_SIZE = max(5, int(os.environ.get('UPLOAD_PART_SIZE_MB', '10'))) * 1024 * 1024
+# Lifetime of a blob lock, long enough to store a file of MAX_FILE_SIZE_MB
+BLOB_LOCK_SECONDS = 300
+
 # Google Fit Configuration
 GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
@@ -82,6 +101,110 @@ FITBIT_CLIENT_ID = os.environ.get('FITBIT_CLIENT_ID')
 FITBIT_CLIENT_SECRET = os.environ.get('FITBIT_CLIENT_SECRET')
 FITBIT_REDIRECT_URI = os.environ.get('FITBIT_REDIRECT_URI', 'http://localhost:8000/api/wearable/fitbit/callback')
 
+# PDF text extraction backend: pdfium (fast, native) or pypdf2
+PDF_EXTRACTOR = os.environ.get('PDF_EXTRACTOR', 'pdfium')
+
+# Medical entity lexicons (medications.txt, conditions.txt, procedures.txt, lab_analytes.txt)
+MEDICAL_LEXICON_DIR = os.environ.get('MEDICAL_LEXICON_DIR', str(ROOT_DIR / 'lexicons'))
+ENTITY_REEXTRACT_BATCH_SIZE = int(os.environ.get('ENTITY_REEXTRACT_BATCH_SIZE', '100'))
+
+# OCR Configuration
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+OCR_DPI = int(os.environ.get('OCR_DPI', '300'))
+OCR_WINDOW_PAGES = int(os.environ.get('OCR_WINDOW_PAGES', '8'))
+OCR_PAGE_MIN_CHARS = int(os.environ.get('OCR_PAGE_MIN_CHARS', '50'))
+OCR_DESKEW = os.environ.get('OCR_DESKEW', 'false').lower() == 'true'
+OCR_DENOISE = os.environ.get('OCR_DENOISE', 'false').lower() == 'true'
+
+# Ingestion Queue Configuration
+INGEST_EMBEDDED_CONCURRENCY = int(os.environ.get('INGEST_EMBEDDED_CONCURRENCY', '1'))
+INGEST_WORKER_CONCURRENCY = int(os.environ.get('INGEST_WORKER_CONCURRENCY', '2'))
+INGEST_LEASE_SECONDS = int(os.environ.get('INGEST_LEASE_SECONDS', '120'))
+INGEST_MAX_ATTEMPTS = int(os.environ.get('INGEST_MAX_ATTEMPTS', '3'))
+INGEST_RETRY_BASE_SECONDS = int(os.environ.get('INGEST_RETRY_BASE_SECONDS', '30'))
+INGEST_POLL_INTERVAL_SECONDS = float(os.environ.get('INGEST_POLL_INTERVAL_SECONDS', '1.0'))
+
+# Vector Index Configuration
+# Chunk sizes are in embedding-model tokens; all-MiniLM-L6-v2 truncates input past 256
+CHUNK_TOKENS = int(os.environ.get('CHUNK_TOKENS', '240'))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', '24'))
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+# chroma, or mmap for a memory-mapped quantized flat index (VECTOR_STORE_DTYPE float16 or int8)
+VECTOR_STORE_BACKEND = os.environ.get('VECTOR_STORE_BACKEND', 'chroma')
+VECTOR_STORE_PATH = os.environ.get(
+    'VECTOR_STORE_PATH', './medical_vector_mmap' if VECTOR_STORE_BACKEND == 'mmap' else './medical_vector_db'
+)
+VECTOR_STORE_DTYPE = os.environ.get('VECTOR_STORE_DTYPE', 'float16')
+# A Chroma server shared by the API, worker.py and reindex.py; the embedded store (no CHROMA_HOST)
+# is only safe to write from the API process itself
+CHROMA_HOST = os.environ.get('CHROMA_HOST')
+CHROMA_PORT = int(os.environ.get('CHROMA_PORT', '8000'))
+# Documents indexed under a different version are stale and get re-chunked by the rebuild,
+# which writes each version to its own partitions and switches queries over once it is done
+INDEX_VERSION = hashlib.sha256(json.dumps({
+    "chunker": "medical-sections",
+    "chunk_tokens": CHUNK_TOKENS,
+    "chunk_overlap_tokens": CHUNK_OVERLAP_TOKENS,
+    "embedding_model": EMBEDDING_MODEL,
+    "partitioning": "patient",
+    "partition_versions": True,
+    "lexical_index": "bm25",
+    "vector_store": VECTOR_STORE_BACKEND,
+    "vector_dtype": VECTOR_STORE_DTYPE if VECTOR_STORE_BACKEND == "mmap" else None
+}, sort_keys=True).encode()).hexdigest()[:12]
+EMBEDDING_MAX_BATCH_SIZE = int(os.environ.get('EMBEDDING_MAX_BATCH_SIZE', '256'))
+EMBEDDING_MAX_WAIT_MS = float(os.environ.get('EMBEDDING_MAX_WAIT_MS', '20'))
+# Set EMBEDDING_CACHE_PATH empty to disable the on-disk embedding cache
+EMBEDDING_CACHE_PATH = os.environ.get('EMBEDDING_CACHE_PATH', './embedding_cache.sqlite3')
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', '500000'))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', '10000'))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get('QUERY_CACHE_TTL_SECONDS', '3600'))
+VECTOR_SEARCH_THREADS = int(os.environ.get('VECTOR_SEARCH_THREADS', '4'))
+# Queries arriving within this window with the same filter share one vector store call
+VECTOR_SEARCH_COALESCE_MS = float(os.environ.get('VECTOR_SEARCH_COALESCE_MS', '3'))
+VECTOR_SEARCH_MAX_BATCH_SIZE = int(os.environ.get('VECTOR_SEARCH_MAX_BATCH_SIZE', '32'))
+# Hybrid retrieval fuses BM25 and vector rankings with reciprocal rank fusion
+HYBRID_SEARCH = os.environ.get('HYBRID_SEARCH', 'true').lower() == 'true'
+LEXICAL_INDEX_DIR = os.environ.get('LEXICAL_INDEX_DIR', './lexical_index')
+RETRIEVAL_CANDIDATES = int(os.environ.get('RETRIEVAL_CANDIDATES', '20'))
+RRF_K = int(os.environ.get('RRF_K', '60'))
+# Candidates are reranked by a cross-encoder and cut at RERANK_SCORE_THRESHOLD
+RERANK_ENABLED = os.environ.get('RERANK_ENABLED', 'true').lower() == 'true'
+RERANK_MODEL = os.environ.get('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+RERANK_CANDIDATES = int(os.environ.get('RERANK_CANDIDATES', '50'))
+RERANK_BATCH_SIZE = int(os.environ.get('RERANK_BATCH_SIZE', '16'))
+RERANK_SCORE_THRESHOLD = float(os.environ.get('RERANK_SCORE_THRESHOLD', '0.0'))
+RERANK_MIN_K = int(os.environ.get('RERANK_MIN_K', '1'))
+RERANK_MAX_K = int(os.environ.get('RERANK_MAX_K', '8'))
+RERANK_BUDGET_MS = float(os.environ.get('RERANK_BUDGET_MS', '400'))
+RERANK_CACHE_MAX_ENTRIES = int(os.environ.get('RERANK_CACHE_MAX_ENTRIES', '50000'))
+# Reranks queued or running at once; past this requests keep first-stage order right away
+RERANK_MAX_PENDING = int(os.environ.get('RERANK_MAX_PENDING', '4'))
+REINDEX_BATCH_SIZE = int(os.environ.get('REINDEX_BATCH_SIZE', '50'))
+REINDEX_CONCURRENCY = int(os.environ.get('REINDEX_CONCURRENCY', '4'))
+# Orphan chunk collection and compaction interval, 0 disables the periodic run
+GC_INTERVAL_SECONDS = float(os.environ.get('GC_INTERVAL_SECONDS', '3600'))
+
+# Generated answers are cached per query, retrieved chunks, model and prompt; 0 disables
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', '5000'))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', '3600'))
+
+# LLM Configuration
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'llama3.1:8b')
+# Connect fails fast when Ollama is down, read covers a whole CPU generation
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('LLM_CONNECT_TIMEOUT_SECONDS', '5'))
+LLM_READ_TIMEOUT_SECONDS = float(os.environ.get('LLM_READ_TIMEOUT_SECONDS', '120'))
+LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '8'))
+# Context window requested from Ollama; retrieved context fills what the prompt and answer leave
+LLM_NUM_CTX = int(os.environ.get('LLM_NUM_CTX', '4096'))
+LLM_MAX_RESPONSE_TOKENS = int(os.environ.get('LLM_MAX_RESPONSE_TOKENS', '512'))
+# Generations run at once against Ollama, and how many more may wait for a slot
+LLM_MAX_CONCURRENT = int(os.environ.get('LLM_MAX_CONCURRENT', '2'))
+LLM_MAX_QUEUE = int(os.environ.get('LLM_MAX_QUEUE', '16'))
+# How often a pending analysis checks whether its client has gone away
+DISCONNECT_POLL_SECONDS = float(os.environ.get('DISCONNECT_POLL_SECONDS', '0.5'))
+
 # MongoDB connection
 client = AsyncIOMotorClient(MONGO_URL)
 db = client[DB_NAME]
@@ -105,12 +228,112 @@ try:
 except S3Error as e:
     logging.error(f"MinIO bucket creation error: {e}")
 
-# Initialize ChromaDB for RAG
-chroma_client = chromadb.PersistentClient(path="./medical_vector_db")
-try:
-    collection = chroma_client.get_collection("medical_documents")
-except:
-    collection = chroma_client.create_collection("medical_documents")
+# Initialize the vector store for RAG
+embedding_service = EmbeddingService(
+    EMBEDDING_MODEL,
+    max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+    max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+    cache=EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES) if EMBEDDING_CACHE_PATH else None,
+    query_cache=QueryEmbeddingCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS)
+)
+embedding_function = embedding_service.as_chroma_function()
+# Services for the models other index versions were built with, loaded on first use
+embedding_services = {EMBEDDING_MODEL: embedding_service}
+
+def embedding_service_for(model: str) -> EmbeddingService:
+    """The embedding service of the model an index version was built with"""
+    if model not in embedding_services:
+        embedding_services[model] = EmbeddingService(
+            model,
+            max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+            max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+            cache=embedding_service.cache,
+            query_cache=QueryEmbeddingCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS)
+        )
+    return embedding_services[model]
+
+if VECTOR_STORE_BACKEND == MmapVectorStore.name:
+    vector_store = MmapVectorStore(VECTOR_STORE_PATH, dtype=VECTOR_STORE_DTYPE)
+elif CHROMA_HOST:
+    vector_store = ChromaVectorStore(chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT), embedding_function)
+else:
+    vector_store = ChromaVectorStore(chromadb.PersistentClient(path=VECTOR_STORE_PATH), embedding_function)
+lexical_index = LexicalIndexStore(LEXICAL_INDEX_DIR)
+
+async def ensure_shared_indexes(separate_process: bool):
+    """Refuse to write indexes the other index writers cannot see
+
+    The BM25 indexes and the mmap vector store are files that every process
+    writing them (the API, worker.py, reindex.py) must share, so each directory
+    carries an id that the first process registers in MongoDB. A process that
+    finds different files, e.g. a worker on another host without the shared
+    volume, would build an index the API never searches and is stopped here.
+    Embedded Chroma supports a single process, so a separate_process writer
+    needs CHROMA_HOST.
+    """
+    if separate_process and VECTOR_STORE_BACKEND != MmapVectorStore.name and not CHROMA_HOST:
+        raise RuntimeError(
+            "Embedded Chroma can only be written by the API process: set CHROMA_HOST to a Chroma server, "
+            "use VECTOR_STORE_BACKEND=mmap on a shared volume, or ingest inside the API"
+        )
+    directories = {"lexical_index": LEXICAL_INDEX_DIR}
+    if VECTOR_STORE_BACKEND == MmapVectorStore.name:
+        directories["vector_store"] = VECTOR_STORE_PATH
+    for name, directory in directories.items():
+        os.makedirs(directory, exist_ok=True)
+        id_path = os.path.join(directory, "storage_id")
+        if not os.path.exists(id_path):
+            with open(f"{id_path}.{os.getpid()}.tmp", "w") as file:
+                file.write(uuid.uuid4().hex)
+            # Never replaces an id another process wrote first
+            try:
+                os.link(f"{id_path}.{os.getpid()}.tmp", id_path)
+            except FileExistsError:
+                pass
+            os.remove(f"{id_path}.{os.getpid()}.tmp")
+        with open(id_path) as file:
+            storage_id = file.read().strip()
+        registered = await db.index_storage.find_one_and_update(
+            {"_id": name},
+            {"$setOnInsert": {"storage_id": storage_id, "host": socket.gethostname(), "path": os.path.abspath(directory)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if registered["storage_id"] != storage_id:
+            raise RuntimeError(
+                f"{directory} is not the {name} the other index writers use "
+                f"({registered['path']} on {registered['host']}): mount that directory here"
+            )
+vector_search = VectorSearchBatcher(
+    vector_store.query,
+    max_threads=VECTOR_SEARCH_THREADS,
+    coalesce_ms=VECTOR_SEARCH_COALESCE_MS,
+    max_batch_size=VECTOR_SEARCH_MAX_BATCH_SIZE
+)
+reranker = CrossEncoderReranker(
+    RERANK_MODEL,
+    batch_size=RERANK_BATCH_SIZE,
+    score_threshold=RERANK_SCORE_THRESHOLD,
+    min_k=RERANK_MIN_K,
+    max_k=RERANK_MAX_K,
+    budget_ms=RERANK_BUDGET_MS,
+    cache_entries=RERANK_CACHE_MAX_ENTRIES,
+    max_pending=RERANK_MAX_PENDING
+) if RERANK_ENABLED else None
+
+llm_client = OllamaClient(
+    OLLAMA_BASE_URL,
+    OLLAMA_MODEL,
+    connect_timeout=LLM_CONNECT_TIMEOUT_SECONDS,
+    read_timeout=LLM_READ_TIMEOUT_SECONDS,
+    max_connections=LLM_MAX_CONNECTIONS,
+    options={"temperature": 0.1, "num_ctx": LLM_NUM_CTX, "num_predict": LLM_MAX_RESPONSE_TOKENS}
+)
+context_packer = ContextPacker()
+llm_scheduler = LLMScheduler(max_concurrent=LLM_MAX_CONCURRENT, max_queue=LLM_MAX_QUEUE)
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl_seconds=ANSWER_CACHE_TTL_SECONDS
+) if ANSWER_CACHE_MAX_ENTRIES > 0 else None
 
 # Create the main app
 app = FastAPI(title="HealthSync - Patient-Clinician Health Data Platform", version="1.0.0")
@@ -178,6 +401,7 @@ class DocumentUpload(BaseModel):
 class MedicalAnalysisRequest(BaseModel):
     query: str
     document_ids: Optional[List[str]] = None
+    patient_id: Optional[str] = None
     analysis_type: str = "general"
 
 class MedicalAnalysisResponse(BaseModel):
@@ -187,6 +411,7 @@ class MedicalAnalysisResponse(BaseModel):
     confidence_score: float
     sources: List[str]
     timestamp: str
+    cached: bool = False
 
 class WearableDataRequest(BaseModel):
     data_type: str  # steps, heart_rate, sleep, activity
@@ -241,228 +466,492 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
     return User(**user)
 
+class JobSuperseded(Exception):
+    """The document was replaced or deleted, or the job lost its lease, while it was processed"""
+
 # Medical Document Processing
+entity_extractor = MedicalEntityExtractor.from_directory(MEDICAL_LEXICON_DIR)
+
 class MedicalDocumentProcessor:
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        self.text_extractor = get_extractor(PDF_EXTRACTOR)
+        self.ocr_engine = OCREngine(
+            max_workers=OCR_WORKERS,
+            dpi=OCR_DPI,
+            window_pages=OCR_WINDOW_PAGES,
+            deskew=OCR_DESKEW,
+            denoise=OCR_DENOISE
         )
+        self.chunker = MedicalChunker(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, embedding_service.count_tokens)
     
-    async def process_pdf(self, file_path: str) -> Dict[str, Any]:
-        """Extract text from PDF with OCR fallback"""
+    async def process_pdf(self, file_path: str, on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """Extract text from PDF, OCRing only the pages without a usable text layer
+
+        on_progress is awaited with (pages done, pages total) as extraction advances.
+        """
         try:
-            # Try direct text extraction first
-            text = await self._extract_text_direct(file_path)
+            # Try direct text extraction first, page by page, in a single parse
+            extraction = await self._extract_pages_direct(file_path)
+            pages = extraction["pages"]
+            ocr_stats = None
             
-            if len(text.strip()) < 100:
-                # Fallback to OCR
-                text = await self._extract_text_ocr(file_path)
+            if pages:
+                ocr_page_numbers = [
+                    page["page"] for page in pages
+                    if len(page["text"].strip()) < OCR_PAGE_MIN_CHARS
+                ]
+            else:
+                # No readable text layer at all, OCR the whole document
+                ocr_page_numbers = None
+            
+            if ocr_page_numbers is None or ocr_page_numbers:
+                text_layer_done = len(pages) - len(ocr_page_numbers or [])
+                
+                async def on_ocr_progress(done: int, total: int):
+                    if on_progress is not None:
+                        await on_progress(text_layer_done + done, text_layer_done + total)
+                
+                ocr_pages, ocr_stats = await self._extract_text_ocr(file_path, ocr_page_numbers, on_ocr_progress)
+                pages_by_number = {page["page"]: page for page in pages}
+                for ocr_page in ocr_pages:
+                    pages_by_number[ocr_page["page"]] = {**ocr_page, "source": "ocr"}
+                pages = [pages_by_number[number] for number in sorted(pages_by_number)]
+            
+            if on_progress is not None:
+                await on_progress(len(pages), len(pages))
+            
+            text = "\n".join(page["text"] for page in pages)
             
             # Extract medical entities
-            entities = self._extract_medical_entities(text)
+            entities = await asyncio.to_thread(self._extract_medical_entities, text)
             
             return {
                 "success": True,
                 "text": text,
                 "entities": entities,
-                "page_count": self._get_page_count(file_path)
+                "page_count": extraction["page_count"] or len(pages),
+                "pdf_metadata": extraction["metadata"],
+                "pages": [
+                    {
+                        "page": page["page"],
+                        "source": page["source"],
+                        "chars": len(page["text"]),
+                        "seconds": page["seconds"]
+                    } for page in pages
+                ],
+                "ocr_stats": ocr_stats
             }
         except Exception as e:
             logger.error(f"PDF processing failed: {e}")
             return {"success": False, "error": str(e)}
     
-    async def _extract_text_direct(self, file_path: str) -> str:
-        """Direct text extraction from PDF"""
-        text = ""
+    async def _extract_pages_direct(self, file_path: str) -> Dict[str, Any]:
+        """Direct per-page text extraction from the PDF text layer"""
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
+            return await asyncio.to_thread(self.text_extractor.extract, file_path)
         except Exception as e:
-            logger.error(f"Direct text extraction failed: {e}")
-        return text
+            logger.error(f"Direct text extraction failed ({self.text_extractor.name}): {e}")
+            return {"pages": [], "page_count": 0, "metadata": {}}
     
-    async def _extract_text_ocr(self, file_path: str) -> str:
-        """OCR text extraction from PDF"""
-        text = ""
+    async def _extract_text_ocr(self, file_path: str, page_numbers: Optional[List[int]] = None,
+                                on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """OCR text extraction for the given PDF pages using the process pool"""
         try:
-            images = convert_from_path(file_path, dpi=300)
-            for image in images:
-                # Preprocess image for better OCR
-                processed_image = self._preprocess_image(image)
-                page_text = pytesseract.image_to_string(processed_image)
-                text += page_text + "\n"
+            result = await self.ocr_engine.ocr_pdf(file_path, page_numbers, on_progress)
+            return result["pages"], result["stats"]
         except Exception as e:
             logger.error(f"OCR extraction failed: {e}")
-        return text
+            return [], None
     
-    def _preprocess_image(self, image: Image.Image) -> Image.Image:
-        """Preprocess image for better OCR results"""
+    def _extract_medical_entities(self, text: str) -> Dict[str, List[str]]:
+        """Extract medical entities from text"""
+        return entity_extractor.extract(text)
+
+    async def add_to_vector_store(self, text: str, document_id: str, patient_id: str, metadata: Dict,
+                                  pages: Optional[List[Dict[str, Any]]] = None,
+                                  still_current: Optional[Callable[[], Awaitable[bool]]] = None,
+                                  current_version_only: bool = False):
+        """Add document to its patient's partitions of the vector store for RAG
+
+        The chunks go to every index version writes target (see IndexVersions),
+        or only to INDEX_VERSION with current_version_only. pages are the
+        document's page records ({"page", "chars"}) in text order, used to tag
+        chunks with the pages they span. still_current is checked right before
+        the chunks are written; JobSuperseded is raised if it fails.
+        """
         try:
-            # Convert to OpenCV format
-            opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            gray = cv2.cvtColor(opencv_image, cv2.COLOR_BGR2GRAY)
+            ids, texts, metadatas = await asyncio.to_thread(
+                self._split_chunks, text, document_id, {**metadata, "patient_id": patient_id}, pages
+            )
             
-            # Apply threshold to get image with only black and white
-            processed = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+            targets = await index_versions.targets()
+            if current_version_only:
+                targets = [(INDEX_VERSION, EMBEDDING_MODEL)]
+            # Embedded together with chunks from other concurrent ingestions, once per model
+            embeddings = {}
+            for _, model in targets:
+                if model not in embeddings:
+                    embeddings[model] = await embedding_service_for(model).embed(texts)
             
-            # Convert back to PIL
-            return Image.fromarray(processed)
+            if still_current is not None and not await still_current():
+                raise JobSuperseded(f"Document {document_id} changed while it was being indexed")
+            for version, model in targets:
+                await asyncio.to_thread(
+                    self._swap_chunks, version_partition(patient_id, version), document_id, ids, texts, metadatas,
+                    embeddings[model]
+                )
+            logger.info(f"Added {len(ids)} chunks to vector store for document {document_id}")
+            return True
+        except JobSuperseded:
+            raise
         except Exception as e:
-            logger.warning(f"Image preprocessing failed: {e}")
-            return image
+            logger.error(f"Vector store addition failed: {e}")
+            return False
     
-    def _extract_medical_entities(self, text: str) -> Dict[str, List[str]]:
-        """Extract medical entities from text"""
-        entities = {
-            "conditions": [],
-            "medications": [],
-            "procedures": [],
-            "vital_signs": [],
-            "lab_values": []
-        }
+    def _split_chunks(self, text: str, document_id: str, metadata: Dict,
+                      pages: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[str], List[str], List[Dict]]:
+        """Split text into chunk ids, texts and metadatas"""
+        # Extracted text is the page texts joined with newlines
+        page_offsets = page_starts([page["chars"] for page in pages]) if pages else None
+        chunks = self.chunker.split(text, page_offsets)
         
-        # Simple regex-based extraction (in production, use medical NLP libraries)
-        import re
-        
-        # Extract vital signs
-        bp_pattern = r'(?:bp|blood pressure):\s*(\d+/\d+)'
-        hr_pattern = r'(?:hr|heart rate):\s*(\d+)'
-        temp_pattern = r'(?:temp|temperature):\s*(\d+\.?\d*)'
+        texts = [chunk["text"] for chunk in chunks]
+        metadatas = []
+        for chunk in chunks:
+            chunk_metadata = {
+                "document_id": document_id,
+                **metadata,
+                "index_version": INDEX_VERSION,
+                "tokens": chunk["tokens"],
+                "char_start": chunk["char_start"],
+                "char_end": chunk["char_end"]
+            }
+            if "page_start" in chunk:
+                chunk_metadata["page_start"] = pages[chunk["page_start"] - 1]["page"]
+                chunk_metadata["page_end"] = pages[chunk["page_end"] - 1]["page"]
+            if "section" in chunk:
+                chunk_metadata["section"] = chunk["section"]
+            metadatas.append(chunk_metadata)
+        ids = [f"{document_id}_{i}" for i in range(len(chunks))]
+        return ids, texts, metadatas
+    
+    def _swap_chunks(self, partition: str, document_id: str, ids: List[str], texts: List[str],
+                     metadatas: List[Dict], embeddings: List[List[float]]):
+        """Store chunks in a partition in place of the document's existing chunks"""
+        # Upsert overwrites chunk i in place, so queries never see the document missing
+        vector_store.upsert(partition, ids, texts, embeddings, metadatas)
         
-        entities["vital_signs"].extend(re.findall(bp_pattern, text, re.IGNORECASE))
-        entities["vital_signs"].extend(re.findall(hr_pattern, text, re.IGNORECASE))
-        entities["vital_signs"].extend(re.findall(temp_pattern, text, re.IGNORECASE))
+        # Drop trailing chunks left over from a longer previous version
+        current_ids = set(ids)
+        existing = vector_store.get(partition, where={"document_id": document_id}, include=[])
+        stale_ids = [chunk_id for chunk_id in existing['ids'] if chunk_id not in current_ids]
+        if stale_ids:
+            vector_store.delete(partition, stale_ids)
         
-        return entities
+        lexical_index.replace_document(partition_name(partition), document_id, ids, texts)
+        if answer_cache is not None:
+            answer_cache.invalidate_documents([document_id])
     
-    def _get_page_count(self, file_path: str) -> int:
-        """Get number of pages in PDF"""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PdfReader(file)
-                return len(pdf_reader.pages)
-        except:
-            return 0
-
-    async def add_to_vector_store(self, text: str, document_id: str, metadata: Dict):
-        """Add document to vector store for RAG"""
+    def remove_vector_chunks(self, partition: str, document_ids: List[str]) -> int:
+        """Delete documents' chunks from a partition and its lexical index, returning the vector chunk count"""
+        removed = vector_store.delete_documents(partition, document_ids)
+        lexical_index.remove_documents(partition_name(partition), document_ids)
+        if answer_cache is not None:
+            answer_cache.invalidate_documents(document_ids)
+        return removed
+    
+    def copy_vector_chunks(self, source_document_id: str, source_patient_id: str,
+                           document_id: str, patient_id: str, metadata: Dict,
+                           versions: List[Optional[str]]) -> bool:
+        """Reuse another document's chunks and embeddings for a duplicate upload
+
+        The chunks are copied within each of the index versions, False if the
+        source is missing from any of them.
+        """
         try:
-            # Split text into chunks
-            documents = [Document(page_content=text, metadata=metadata)]
-            chunks = self.text_splitter.split_documents(documents)
-            
-            # Add to ChromaDB
-            texts = [chunk.page_content for chunk in chunks]
-            metadatas = [{"document_id": document_id, **chunk.metadata} for chunk in chunks]
-            ids = [f"{document_id}_{i}" for i in range(len(chunks))]
+            sources = []
+            for version in versions:
+                source = vector_store.get(
+                    version_partition(source_patient_id, version),
+                    where={"document_id": source_document_id},
+                    include=['documents', 'metadatas', 'embeddings']
+                )
+                if not source['ids']:
+                    return False
+                sources.append((version, source))
             
-            collection.add(
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
-            )
+            for version, source in sources:
+                # Chunk ids end in their index, keep the original chunk order
+                order = sorted(range(len(source['ids'])), key=lambda i: int(source['ids'][i].rsplit('_', 1)[-1]))
+                ids = [f"{document_id}_{n}" for n in range(len(order))]
+                texts = [source['documents'][i] for i in order]
+                partition = version_partition(patient_id, version)
+                vector_store.upsert(
+                    partition,
+                    ids,
+                    texts,
+                    [source['embeddings'][i] for i in order],
+                    [
+                        {**source['metadatas'][i], **metadata, "document_id": document_id, "patient_id": patient_id}
+                        for i in order
+                    ]
+                )
+                lexical_index.replace_document(partition_name(partition), document_id, ids, texts)
             
-            logger.info(f"Added {len(chunks)} chunks to vector store for document {document_id}")
+            logger.info(f"Copied {len(order)} chunks from document {source_document_id} to {document_id}")
             return True
         except Exception as e:
-            logger.error(f"Vector store addition failed: {e}")
+            logger.error(f"Vector chunk copy failed: {e}")
             return False
 
 # Medical Analysis Service
 class MedicalAnalysisService:
-    def __init__(self):
-        self.ollama_url = "http://localhost:11434"
+    # Bump when the prompt changes so answers cached under the old prompt are not reused
+    PROMPT_VERSION = "2"
+    PROMPT_TEMPLATE = """You are a medical AI assistant. Based on the following medical documents, answer the query.
+
+Medical Context:
+{context}
+
+Query: {query}
+
+Please provide a helpful, accurate response based on the provided medical information. If the information is insufficient, say so clearly."""
     
-    async def analyze_query(self, query: str, document_ids: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Analyze medical query using RAG"""
+    async def analyze_query(self, query: str, patient_ids: List[str], document_ids: Optional[List[str]] = None,
+                            priority: int = 1) -> Dict[str, Any]:
+        """Analyze medical query using RAG over the given patients' documents
+
+        priority orders the LLM queue, lower first. LLMQueueFull is raised when it
+        is full and the answer is not cached, before the prompt is built.
+        """
         try:
             # Search for relevant context
-            context_docs = self._search_similar_documents(query, document_ids)
+            context_docs = await self._search_similar_documents(query, patient_ids, document_ids)
             
-            # Generate response using local LLM (Ollama) or fallback
-            response = await self._generate_response(query, context_docs)
+            # Reuse the answer generated for the same question over the same chunks
+            response = self.cached_answer(query, context_docs)
+            cached = response is not None
+            stats: Dict[str, Any] = {}
+            if not cached:
+                if llm_scheduler.full:
+                    raise LLMQueueFull(llm_scheduler.retry_after())
+                # Generate response using local LLM (Ollama) or fallback
+                response = await self._generate_response(query, context_docs, stats, priority)
+                if stats.get("generated"):
+                    self.cache_answer(query, context_docs, response)
             
             return {
                 "success": True,
                 "response": response,
                 "confidence": 0.85,  # Placeholder
-                "sources": [doc["document_id"] for doc in context_docs]
+                "sources": [doc["document_id"] for doc in context_docs],
+                "cached": cached,
+                "generation": {key: value for key, value in stats.items() if key != "generated"}
             }
+        except LLMQueueFull:
+            raise
         except Exception as e:
             logger.error(f"Medical analysis failed: {e}")
             return {"success": False, "error": str(e)}
     
-    def _search_similar_documents(self, query: str, document_ids: Optional[List[str]] = None, k: int = 3) -> List[Dict]:
-        """Search for similar documents in vector store"""
+    async def retrieve(self, query: str, patient_ids: List[str], document_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Context chunks for a query within the given patients' documents"""
+        return await self._search_similar_documents(query, patient_ids, document_ids)
+    
+    async def _search_similar_documents(self, query: str, patient_ids: List[str],
+                                        document_ids: Optional[List[str]] = None, k: int = 3) -> List[Dict]:
+        """Search the patients' partitions for similar chunks, fusing vector and BM25 rankings
+
+        Only the active index version is searched. With the reranker enabled the top RERANK_CANDIDATES are reranked and the
+        number of chunks returned is set by its score cutoff instead of k.
+        """
         try:
             where_filter = {}
             if document_ids:
                 where_filter = {"document_id": {"$in": document_ids}}
+            if reranker is not None:
+                k = RERANK_CANDIDATES
+            depth = max(k, RETRIEVAL_CANDIDATES) if HYBRID_SEARCH else k
+            state = await index_versions.state()
+            partitions = [version_partition(patient_id, state["version"]) for patient_id in patient_ids]
             
-            results = collection.query(
-                query_texts=[query],
-                n_results=k,
-                where=where_filter if where_filter else None,
-                include=['documents', 'metadatas']
-            )
+            # chunk id -> (partition, content, metadata) for every chunk whose content is known
+            chunks: Dict[str, Tuple[str, str, Dict]] = {}
+            
+            async def vector_ranking() -> List[str]:
+                # The active version's vectors come from the model it was built with
+                query_embedding = await embedding_service_for(state["embedding_model"]).embed_query(query)
+                partition_results = await asyncio.gather(*[
+                    vector_search.query(partition, query_embedding, depth, where_filter if where_filter else None)
+                    for partition in partitions
+                ])
+                # Merge the per-patient candidates by distance
+                matches = []
+                for partition, results in zip(partitions, partition_results):
+                    if results['documents'] and results['documents'][0]:
+                        for chunk_id, distance, doc, metadata in zip(
+                            results['ids'][0], results['distances'][0], results['documents'][0], results['metadatas'][0]
+                        ):
+                            chunks[chunk_id] = (partition, doc, metadata)
+                            matches.append((distance, chunk_id))
+                matches.sort()
+                return [chunk_id for _, chunk_id in matches]
+            
+            async def lexical_ranking() -> List[Tuple[str, str]]:
+                partition_results = await asyncio.gather(*[
+                    asyncio.to_thread(
+                        lexical_index.search, partition_name(partition), query, depth, document_ids or None
+                    )
+                    for partition in partitions
+                ])
+                matches = [
+                    (score, chunk_id, partition)
+                    for partition, results in zip(partitions, partition_results)
+                    for chunk_id, score in results
+                ]
+                matches.sort(reverse=True)
+                return [(chunk_id, partition) for _, chunk_id, partition in matches]
+            
+            if HYBRID_SEARCH:
+                vector_ids, lexical_matches = await asyncio.gather(vector_ranking(), lexical_ranking())
+                fused = reciprocal_rank_fusion([vector_ids, [chunk_id for chunk_id, _ in lexical_matches]], RRF_K)
+                top_ids = [chunk_id for chunk_id, _ in fused[:k]]
+                
+                # Chunks found only lexically are fetched from their partitions
+                lexical_partitions = dict(lexical_matches)
+                missing: Dict[str, List[str]] = {}
+                for chunk_id in top_ids:
+                    if chunk_id not in chunks:
+                        missing.setdefault(lexical_partitions[chunk_id], []).append(chunk_id)
+                for partition, fetched in zip(missing, await asyncio.gather(*[
+                    asyncio.to_thread(self._fetch_chunks, partition, ids) for partition, ids in missing.items()
+                ])):
+                    for chunk_id, doc, metadata in fetched:
+                        chunks[chunk_id] = (partition, doc, metadata)
+            else:
+                top_ids = (await vector_ranking())[:k]
             
             formatted_results = []
-            if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata) in enumerate(zip(results['documents'][0], results['metadatas'][0])):
-                    formatted_results.append({
-                        'content': doc,
-                        'document_id': metadata.get('document_id', 'unknown'),
-                        'metadata': metadata
-                    })
+            for chunk_id in top_ids:
+                if chunk_id not in chunks:
+                    continue
+                _, doc, metadata = chunks[chunk_id]
+                formatted_results.append({
+                    'chunk_id': chunk_id,
+                    'content': doc,
+                    'document_id': metadata.get('document_id', 'unknown'),
+                    'metadata': metadata
+                })
+            
+            if reranker is not None:
+                formatted_results, rerank_stats = await reranker.rerank(query, formatted_results)
+                if not rerank_stats["reranked"]:
+                    logger.warning(f"Reranking over budget after {rerank_stats['ms']} ms, using retrieval order")
             
             return formatted_results
         except Exception as e:
             logger.error(f"Document search failed: {e}")
             return []
     
-    async def _generate_response(self, query: str, context_docs: List[Dict]) -> str:
-        """Generate response using LLM"""
+    def _fetch_chunks(self, partition: str, ids: List[str]) -> List[Tuple[str, str, Dict]]:
+        """Load chunk content and metadata by id from a partition"""
+        results = vector_store.get(partition, ids=ids, include=['documents', 'metadatas'])
+        return list(zip(results['ids'], results['documents'], results['metadatas']))
+    
+    def _build_prompt(self, query: str, context_docs: List[Dict], stats: Optional[Dict[str, Any]] = None) -> str:
+        """Prompt with the context packed into what LLM_NUM_CTX leaves after the template, query and answer
+
+        stats, if given, receives the chunk, passage and estimated prompt token counts.
+        """
+        overhead = context_packer.count_tokens([self.PROMPT_TEMPLATE.format(context="", query=query)])[0]
+        passages = context_packer.pack(context_docs, LLM_NUM_CTX - LLM_MAX_RESPONSE_TOKENS - overhead)
+        prompt = self.PROMPT_TEMPLATE.format(context=ContextPacker.format(passages), query=query)
+        if stats is not None:
+            stats.update({
+                "context_chunks": len(context_docs),
+                "context_passages": len(passages),
+                "context_tokens": sum(passage["tokens"] for passage in passages),
+                "prompt_tokens_estimate": context_packer.count_tokens([prompt])[0]
+            })
+        return prompt
+    
+    def _fallback_response(self, context_docs: List[Dict]) -> str:
+        return f"Based on the available medical documents, I found {len(context_docs)} relevant sources. However, I'm unable to provide a detailed analysis at this time. Please consult with a healthcare professional for proper medical advice."
+    
+    def _answer_key(self, query: str, context_docs: List[Dict]) -> Tuple[str, str]:
+        """Answer cache key and chunk text digest for a query and its context"""
+        ordered = sorted(context_docs, key=lambda doc: doc['chunk_id'])
+        return (
+            AnswerCache.key(query, [doc['chunk_id'] for doc in ordered], llm_client.model, self.PROMPT_VERSION),
+            AnswerCache.digest(doc['content'] for doc in ordered)
+        )
+    
+    def cached_answer(self, query: str, context_docs: List[Dict]) -> Optional[str]:
+        if answer_cache is None:
+            return None
+        answer = answer_cache.get(*self._answer_key(query, context_docs))
+        return answer["response"] if answer is not None else None
+    
+    def cache_answer(self, query: str, context_docs: List[Dict], response: str):
+        if answer_cache is not None:
+            key, digest = self._answer_key(query, context_docs)
+            answer_cache.put(key, digest, [doc['document_id'] for doc in context_docs], {"response": response})
+    
+    async def _generate_response(self, query: str, context_docs: List[Dict],
+                                 stats: Optional[Dict[str, Any]] = None, priority: int = 1) -> str:
+        """Generate response using LLM
+
+        stats, if given, receives the queue wait, LLM token counts and
+        "generated" when the answer came from the model rather than the fallback.
+        """
+        stats = {} if stats is None else stats
         try:
             # Try Ollama first
-            context_text = "\n".join([doc['content'] for doc in context_docs[:3]])
-            
-            prompt = f"""You are a medical AI assistant. Based on the following medical documents, answer the query.
-
-Medical Context:
-{context_text}
-
-Query: {query}
-
-Please provide a helpful, accurate response based on the provided medical information. If the information is insufficient, say so clearly."""
-
-            # Try to use Ollama
-            try:
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": "llama3.1:8b",
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {"temperature": 0.1}
-                    },
-                    timeout=60
-                )
-                
-                if response.status_code == 200:
-                    return response.json().get("response", "Unable to generate response")
-            except:
-                pass
+            prompt = self._build_prompt(query, context_docs, stats)
+
+            # Try to use Ollama once the scheduler grants a slot
+            queued = time.perf_counter()
+            async with llm_scheduler.slot(priority):
+                stats["queue_ms"] = round(1000 * (time.perf_counter() - queued), 1)
+                try:
+                    response = await llm_client.generate(prompt, stats=stats)
+                    if response:
+                        stats["generated"] = True
+                    return response or "Unable to generate response"
+                except LLMError as e:
+                    logger.warning(f"LLM generation failed: {e}")
             
             # Fallback response
-            return f"Based on the available medical documents, I found {len(context_docs)} relevant sources. However, I'm unable to provide a detailed analysis at this time. Please consult with a healthcare professional for proper medical advice."
+            return self._fallback_response(context_docs)
             
+        except LLMQueueFull:
+            raise
         except Exception as e:
             logger.error(f"Response generation failed: {e}")
             return "I'm unable to analyze this query at the moment. Please try again later."
+    
+    async def stream_response(self, query: str, context_docs: List[Dict],
+                              stats: Dict[str, Any], priority: int = 1) -> AsyncIterator[str]:
+        """Yield the answer as Ollama generates it, or the fallback answer if it fails before any text
+
+        The scheduler slot is held for the whole stream. stats receives the
+        queue wait, the stream's TTFT, token count and tokens/sec, and
+        "generated" once the model's answer is complete.
+        """
+        produced = False
+        try:
+            queued = time.perf_counter()
+            async with llm_scheduler.slot(priority):
+                stats["queue_ms"] = round(1000 * (time.perf_counter() - queued), 1)
+                async for piece in llm_client.stream(self._build_prompt(query, context_docs, stats), stats=stats):
+                    produced = True
+                    yield piece
+            stats["generated"] = produced
+        except LLMError as e:
+            if produced:
+                raise
+            logger.warning(f"LLM streaming failed: {e}")
+            yield self._fallback_response(context_docs)
 
 # Wearable Data Service
 class WearableDataService:
@@ -604,11 +1093,461 @@ class ReportGenerator:
             logger.error(f"Report generation failed: {e}")
             raise HTTPException(status_code=500, detail="Failed to generate report")
 
+# Ingestion Job Queue
+class IngestionJobQueue:
+    """MongoDB-backed document ingestion queue with leases and retry backoff"""
+    
+    def __init__(self, jobs, lease_seconds: int, max_attempts: int, retry_base_seconds: int):
+        self.jobs = jobs
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+    
+    async def ensure_indexes(self):
+        await self.jobs.create_index("job_id", unique=True)
+        await self.jobs.create_index([("status", 1), ("available_at", 1)])
+        await self.jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    
+    async def enqueue(self, document_id: str) -> str:
+        """Queue a document for processing"""
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        await self.jobs.insert_one({
+            "job_id": job_id,
+            "document_id": document_id,
+            "status": "queued",
+            "attempts": 0,
+            "available_at": now,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now
+        })
+        return job_id
+    
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the next due job, including jobs whose previous lease expired"""
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def renew_lease(self, job: Dict[str, Any]) -> bool:
+        """Extend the lease on a running job, False if another worker took it over"""
+        now = datetime.utcnow()
+        result = await self.jobs.update_one(
+            {"job_id": job["job_id"], "status": "running", "lease_owner": job["lease_owner"]},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+        )
+        return result.modified_count == 1
+    
+    async def complete(self, job: Dict[str, Any]):
+        await self.jobs.update_one(
+            {"job_id": job["job_id"], "status": "running", "lease_owner": job["lease_owner"]},
+            {"$set": {"status": "completed", "lease_expires_at": None, "updated_at": datetime.utcnow()}}
+        )
+    
+    async def fail(self, job: Dict[str, Any], error: str) -> Optional[bool]:
+        """Record a failed attempt, returns True when the job will be retried
+
+        Returns None when the job was cancelled or its lease taken over meanwhile.
+        """
+        now = datetime.utcnow()
+        retry = job["attempts"] < self.max_attempts
+        update = {"status": "queued" if retry else "failed", "last_error": error, "lease_expires_at": None, "updated_at": now}
+        if retry:
+            update["available_at"] = now + timedelta(seconds=self.retry_base_seconds * 2 ** (job["attempts"] - 1))
+        result = await self.jobs.update_one(
+            {"job_id": job["job_id"], "status": "running", "lease_owner": job["lease_owner"]},
+            {"$set": update}
+        )
+        return retry if result.matched_count else None
+    
+    async def cancel(self, document_id: str) -> int:
+        """Cancel a document's queued and running jobs, returning how many were cancelled"""
+        result = await self.jobs.update_many(
+            {"document_id": document_id, "status": {"$in": ["queued", "running"]}},
+            {"$set": {"status": "cancelled", "lease_expires_at": None, "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+
+class IngestionWorker:
+    """Claims ingestion jobs and processes up to `concurrency` documents at once"""
+    
+    def __init__(self, queue: IngestionJobQueue, concurrency: int, poll_interval: float):
+        self.queue = queue
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stopping = asyncio.Event()
+    
+    def stop(self):
+        self._stopping.set()
+    
+    async def run(self):
+        """Poll for jobs until stopped; in-flight jobs are cancelled and their leases expire"""
+        slots = asyncio.Semaphore(self.concurrency)
+        running = set()
+        logger.info(f"Ingestion worker {self.worker_id} started with concurrency {self.concurrency}")
+        try:
+            while not self._stopping.is_set():
+                await slots.acquire()
+                try:
+                    job = await self.queue.claim(self.worker_id)
+                except Exception as e:
+                    logger.error(f"Ingestion job claim failed: {e}")
+                    job = None
+                
+                if job is None:
+                    slots.release()
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                task = asyncio.create_task(self._run_job(job))
+                running.add(task)
+                task.add_done_callback(running.discard)
+                task.add_done_callback(lambda _: slots.release())
+            
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            for task in running:
+                task.cancel()
+            logger.info(f"Ingestion worker {self.worker_id} stopped")
+    
+    async def _run_job(self, job: Dict[str, Any]):
+        document_id = job["document_id"]
+        lost_lease = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(job, asyncio.current_task(), lost_lease))
+        try:
+            if job["attempts"] > self.queue.max_attempts:
+                raise RuntimeError("Lease expired too many times")
+            await process_document(document_id, job)
+            await self.queue.complete(job)
+            logger.info(f"Ingestion job {job['job_id']} completed for document {document_id}")
+        except asyncio.CancelledError:
+            if not lost_lease.is_set():
+                raise
+            # Another worker owns the job now, it must not see this attempt's writes
+            logger.warning(f"Ingestion job {job['job_id']} aborted after losing its lease")
+        except JobSuperseded as e:
+            # The job was cancelled or the document replaced, whoever did that owns its status
+            logger.info(f"Ingestion job {job['job_id']} superseded: {e}")
+        except Exception as e:
+            logger.error(f"Ingestion job {job['job_id']} failed (attempt {job['attempts']}): {e}")
+            retry = await self.queue.fail(job, str(e))
+            if retry is None:
+                return
+            await db.documents.update_one(
+                {"document_id": document_id},
+                {"$set": {"processing_status": "pending" if retry else "failed", "error": str(e)}}
+            )
+        finally:
+            heartbeat.cancel()
+    
+    async def _heartbeat(self, job: Dict[str, Any], processing: asyncio.Task, lost_lease: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            if not await self.queue.renew_lease(job):
+                logger.warning(f"Lost lease on ingestion job {job['job_id']}")
+                lost_lease.set()
+                processing.cancel()
+                return
+
+class IndexVersions:
+    """Which index version queries search, shared by every process through MongoDB
+
+    Each INDEX_VERSION is written to its own partitions, so a rebuild under new
+    chunking or embedding settings never touches the chunks queries read.
+    Queries search the active version, embedding with the model it was built
+    with. Document writes go to the active version and to this process's
+    INDEX_VERSION, which is registered as building until the rebuild has
+    indexed every document into it and activates it. Indexes written before
+    versioning are the unversioned version None, built with EMBEDDING_MODEL.
+    """
+    
+    STATE_ID = "vector_index"
+    # How long a process keeps using the state it last read
+    REFRESH_SECONDS = 5.0
+    
+    def __init__(self, collection):
+        self.collection = collection
+        self._state: Optional[Dict[str, Any]] = None
+        self._read_at = 0.0
+    
+    async def state(self, refresh: bool = False) -> Dict[str, Any]:
+        """{"version", "embedding_model", "building"} of the active index"""
+        if refresh or self._state is None or time.monotonic() - self._read_at > self.REFRESH_SECONDS:
+            state = await self.collection.find_one({"_id": self.STATE_ID})
+            if state is None:
+                # Documents indexed before versioning stay searchable until the first rebuild
+                unversioned = await db.documents.count_documents({"index_version": {"$exists": True}}, limit=1)
+                state = await self.collection.find_one_and_update(
+                    {"_id": self.STATE_ID},
+                    {"$setOnInsert": {
+                        "version": None if unversioned else INDEX_VERSION,
+                        "embedding_model": EMBEDDING_MODEL,
+                        "building": []
+                    }},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            self._state, self._read_at = state, time.monotonic()
+        return self._state
+    
+    async def targets(self) -> List[Tuple[Optional[str], str]]:
+        """(version, embedding model) of every index a document write goes to, the active one first"""
+        state = await self.state()
+        targets = [(state["version"], state["embedding_model"])]
+        if state["version"] != INDEX_VERSION:
+            if INDEX_VERSION not in state["building"]:
+                # Registered before anything is written to it, so index GC keeps the version
+                await self.collection.update_one({"_id": self.STATE_ID}, {"$addToSet": {"building": INDEX_VERSION}})
+                state["building"].append(INDEX_VERSION)
+            targets.append((INDEX_VERSION, EMBEDDING_MODEL))
+        return targets
+    
+    async def kept(self) -> set:
+        """Versions whose partitions must be kept: the active one and those being built"""
+        state = await self.state(refresh=True)
+        return {state["version"], INDEX_VERSION, *state["building"]}
+    
+    async def activate(self):
+        """Switch queries to INDEX_VERSION, retiring the previously active version"""
+        await self.collection.update_one(
+            {"_id": self.STATE_ID},
+            {"$set": {"version": INDEX_VERSION, "embedding_model": EMBEDDING_MODEL}, "$pull": {"building": INDEX_VERSION}}
+        )
+        await self.state(refresh=True)
+
+class IndexRebuilder:
+    """Re-chunks and re-embeds stored document text whose index version is stale
+
+    Documents are written to INDEX_VERSION's own partitions while queries keep
+    searching the active version, which is switched to INDEX_VERSION only once
+    no stale document is left.
+    """
+    
+    def __init__(self, batch_size: int, concurrency: int):
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def start(self) -> bool:
+        """Start a rebuild in the background, False if one is already running"""
+        if self.running:
+            return False
+        self.task = asyncio.create_task(self.rebuild())
+        return True
+    
+    async def status(self) -> Dict[str, Any]:
+        state = await index_versions.state(refresh=True)
+        return {
+            "index_version": INDEX_VERSION,
+            "active_version": state["version"],
+            "building_versions": state["building"],
+            "running": self.running,
+            "stale_documents": await db.documents.count_documents(self._stale_filter()),
+            "last_run": self.last_run
+        }
+    
+    def _stale_filter(self) -> Dict[str, Any]:
+        return {"processing_status": "completed", "index_version": {"$ne": INDEX_VERSION}}
+    
+    async def rebuild(self) -> Dict[str, Any]:
+        """Rebuild chunks for every stale document without re-running OCR"""
+        stats = {
+            "index_version": INDEX_VERSION, "reindexed": 0, "failed": 0, "activated": False,
+            "started_at": datetime.utcnow()
+        }
+        self.last_run = stats
+        slots = asyncio.Semaphore(self.concurrency)
+        failed_ids = []
+        # Registers INDEX_VERSION as building before its first partition is written
+        await index_versions.targets()
+        
+        async def reindex(document: Dict[str, Any]):
+            async with slots:
+                metadata = {
+                    "document_id": document["document_id"],
+                    "filename": document["filename"],
+                    "document_type": document["document_type"]
+                }
+                async def still_current() -> bool:
+                    return await db.documents.count_documents(
+                        {**revision_filter(document), "processing_status": "completed"}, limit=1
+                    ) > 0
+                
+                try:
+                    added = await doc_processor.add_to_vector_store(
+                        document.get("extracted_text", ""), document["document_id"], document["patient_id"], metadata,
+                        document.get("pages"), still_current, current_version_only=True
+                    )
+                except JobSuperseded:
+                    # Replaced or deleted meanwhile, its own ingestion job indexes it
+                    return
+                if added:
+                    await db.documents.update_one(
+                        revision_filter(document),
+                        {"$set": {"index_version": INDEX_VERSION, "indexed_at": datetime.utcnow()}}
+                    )
+                    stats["reindexed"] += 1
+                else:
+                    failed_ids.append(document["document_id"])
+                    stats["failed"] += 1
+        
+        projection = {
+            "document_id": 1, "patient_id": 1, "extracted_text": 1, "pages": 1, "filename": 1, "document_type": 1,
+            "revision": 1
+        }
+        while True:
+            # Reindexed documents drop out of the filter, failed ones are skipped
+            batch = await db.documents.find(
+                {**self._stale_filter(), "document_id": {"$nin": failed_ids}}, projection
+            ).limit(self.batch_size).to_list(self.batch_size)
+            if not batch:
+                break
+            await asyncio.gather(*[reindex(document) for document in batch])
+            logger.info(f"Index rebuild progress: {stats['reindexed']} reindexed, {stats['failed']} failed")
+        
+        # Documents written under another version meanwhile, e.g. by a worker not yet redeployed, keep it inactive
+        stale = await db.documents.count_documents(self._stale_filter())
+        if (await index_versions.state(refresh=True))["version"] != INDEX_VERSION:
+            if stale:
+                logger.warning(f"Index version {INDEX_VERSION} stays inactive, {stale} documents are not indexed in it")
+            else:
+                await index_versions.activate()
+                stats["activated"] = True
+                logger.info(f"Queries switched to index version {INDEX_VERSION}")
+        stats["active_version"] = (await index_versions.state())["version"]
+        
+        stats["finished_at"] = datetime.utcnow()
+        logger.info(f"Index rebuild to version {INDEX_VERSION} finished: {stats['reindexed']} reindexed, {stats['failed']} failed")
+        return stats
+
+class VectorIndexGC:
+    """Removes chunks of documents that no longer exist and retired index versions, and compacts the vector store"""
+    
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def start(self) -> bool:
+        """Start a collection in the background, False if one is already running"""
+        if self.running:
+            return False
+        self.task = asyncio.create_task(self.run())
+        return True
+    
+    async def run_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if self.start():
+                try:
+                    await self.task
+                except Exception as e:
+                    logger.error(f"Vector index GC failed: {e}")
+    
+    async def run(self) -> Dict[str, Any]:
+        """Reconcile every partition against db.documents, then compact it"""
+        stats = {
+            "partitions": 0, "partitions_dropped": 0, "orphan_documents": 0, "chunks_before": 0,
+            "chunks_after": 0, "bytes_reclaimed": 0, "started_at": datetime.utcnow()
+        }
+        self.last_run = stats
+        partitions = await asyncio.to_thread(vector_store.partitions)
+        # Read after listing the partitions: a version is registered before its first partition exists
+        kept = await index_versions.kept()
+        for partition in partitions:
+            stats["partitions"] += 1
+            patient_id, version = partition_version(partition)
+            if version not in kept:
+                # An index version that was replaced by a completed rebuild
+                stats["chunks_before"] += await asyncio.to_thread(vector_store.count, partition)
+                await asyncio.to_thread(vector_store.drop, partition)
+                await asyncio.to_thread(lexical_index.drop, partition_name(partition))
+                stats["partitions_dropped"] += 1
+                continue
+            indexed = await asyncio.to_thread(vector_store.document_ids, partition)
+            lexical = await asyncio.to_thread(lexical_index.document_ids, partition_name(partition))
+            stats["chunks_before"] += await asyncio.to_thread(vector_store.count, partition)
+            
+            # Read after the indexes so chunks of documents inserted meanwhile are kept
+            valid = set(await db.documents.distinct(
+                "document_id", {"patient_id": patient_id, "processing_status": {"$ne": "failed"}}
+            ))
+            orphans = sorted((indexed | lexical) - valid)
+            if orphans:
+                await asyncio.to_thread(doc_processor.remove_vector_chunks, partition, orphans)
+                stats["orphan_documents"] += len(orphans)
+            
+            chunks = await asyncio.to_thread(vector_store.count, partition)
+            stats["chunks_after"] += chunks
+            if not chunks and not valid:
+                await asyncio.to_thread(vector_store.drop, partition)
+                await asyncio.to_thread(lexical_index.drop, partition_name(partition))
+                stats["partitions_dropped"] += 1
+            else:
+                compacted = await asyncio.to_thread(vector_store.compact, partition)
+                stats["bytes_reclaimed"] += compacted["bytes_before"] - compacted["bytes_after"]
+        
+        # Lexical indexes of partitions the vector store no longer has
+        known = {partition_name(partition) for partition in partitions}
+        for partition in await asyncio.to_thread(lexical_index.partitions):
+            if partition not in known:
+                await asyncio.to_thread(lexical_index.drop, partition)
+                stats["partitions_dropped"] += 1
+        
+        stats["finished_at"] = datetime.utcnow()
+        logger.info(
+            f"Vector index GC removed {stats['orphan_documents']} orphan documents: "
+            f"{stats['chunks_before']} -> {stats['chunks_after']} chunks, {stats['bytes_reclaimed']} bytes reclaimed"
+        )
+        return stats
+
 # Initialize services
+index_versions = IndexVersions(db.index_state)
 doc_processor = MedicalDocumentProcessor()
 analysis_service = MedicalAnalysisService()
 wearable_service = WearableDataService()
 report_generator = ReportGenerator()
+ingestion_queue = IngestionJobQueue(
+    db.ingestion_jobs,
+    lease_seconds=INGEST_LEASE_SECONDS,
+    max_attempts=INGEST_MAX_ATTEMPTS,
+    retry_base_seconds=INGEST_RETRY_BASE_SECONDS
+)
+embedded_workers: List[asyncio.Task] = []
+index_rebuilder = IndexRebuilder(batch_size=REINDEX_BATCH_SIZE, concurrency=REINDEX_CONCURRENCY)
+index_gc = VectorIndexGC(interval_seconds=GC_INTERVAL_SECONDS)
 
 # API Routes
 
@@ -689,7 +1628,6 @@ async def get_dashboard(current_user: User = Depends(get_current_user)):
 # Document management routes
 @api_router.post("/documents/upload")
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     patient_id: Optional[str] = None,
     document_type: str = "medical_record",
@@ -701,108 +1639,273 @@ async def upload_document(
     document_id = str(uuid.uuid4())
     
     try:
-        # Upload to MinIO
-        file_content = await file.read()
-        minio_key = f"documents/{document_id}/{file.filename}"
-        
-        minio_client.put_object(
-            MINIO_BUCKET,
-            minio_key,
-            io.BytesIO(file_content),
-            len(file_content),
-            content_type=file.content_type
-        )
+        content_hash, file_size = await hash_upload(file)
+        minio_key = f"blobs/sha256/{content_hash}"
         
         # Store document metadata
         document_data = {
             "document_id": document_id,
             "filename": file.filename,
-            "file_size": len(file_content),
+            "file_size": file_size,
             "content_type": file.content_type,
+            "content_hash": content_hash,
             "minio_key": minio_key,
             "user_id": current_user.id,
             "patient_id": patient_id if patient_id else current_user.id,
             "document_type": document_type,
             "uploaded_at": datetime.utcnow(),
+            "revision": str(uuid.uuid4()),
             "processing_status": "pending"
         }
+        # Inserted before any chunks are written so index GC never sees them as orphans,
+        # and under the blob lock so release_blob cannot remove the blob it reuses
+        async with blob_lock(minio_key):
+            await put_blob(file, minio_key, file_size)
+            await db.documents.insert_one(document_data)
         
-        await db.documents.insert_one(document_data)
-        
-        # Process document in background
-        background_tasks.add_task(process_document_background, document_id, file_content)
+        # Reuse the processing results of an identical, already processed upload
+        source = await db.documents.find_one({"content_hash": content_hash, "processing_status": "completed"})
+        if source and await asyncio.to_thread(
+            doc_processor.copy_vector_chunks, source["document_id"], source["patient_id"], document_id,
+            document_data["patient_id"], {
+                "document_id": document_id,
+                "filename": file.filename,
+                "document_type": document_type
+            }, [version for version, _ in await index_versions.targets()]
+        ):
+            processed = {
+                "processing_status": "completed",
+                "extracted_text": source.get("extracted_text", ""),
+                "medical_entities": source.get("medical_entities", {}),
+                "page_count": source.get("page_count", 0),
+                "pdf_metadata": source.get("pdf_metadata", {}),
+                "pages": source.get("pages", []),
+                # Copied into INDEX_VERSION's partitions, whatever version the source was processed under
+                "index_version": INDEX_VERSION,
+                "deduplicated_from": source["document_id"],
+                "processed_at": datetime.utcnow()
+            }
+            document_data.update(processed)
+            await db.documents.update_one({"document_id": document_id}, {"$set": processed})
+            logger.info(f"Document {document_id} deduplicated from {source['document_id']}")
+        else:
+            # Hand the document to the ingestion workers
+            await ingestion_queue.enqueue(document_id)
         
         return DocumentUpload(
             document_id=document_id,
             filename=file.filename,
-            file_size=len(file_content),
+            file_size=file_size,
             content_type=file.content_type,
             patient_id=patient_id,
             document_type=document_type,
-            upload_status="uploaded"
+            upload_status="deduplicated" if "deduplicated_from" in document_data else "uploaded"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Document upload failed: {e}")
         raise HTTPException(status_code=500, detail="Document upload failed")
 
-async def process_document_background(document_id: str, file_content: bytes):
-    """Background task to process uploaded document"""
+async def hash_upload(file: UploadFile) -> Tuple[str, int]:
+    """SHA-256 and size of an uploaded PDF, enforcing the size limit"""
+    # Hash the spooled upload in fixed-size chunks instead of reading it whole
+    hasher = hashlib.sha256()
+    file_size = 0
+    while chunk := await file.read(UPLOAD_READ_CHUNK_SIZE):
+        hasher.update(chunk)
+        file_size += len(chunk)
+        if file_size > MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise HTTPException(status_code=413, detail=f"File exceeds {MAX_FILE_SIZE_MB} MB limit")
+    await file.seek(0)
+    return hasher.hexdigest(), file_size
+
+@asynccontextmanager
+async def blob_lock(minio_key: str):
+    """Hold a lock on a stored file across API processes
+
+    Taken while an upload checks for the blob and records the document that
+    references it, and while release_blob counts references and removes it.
+    The lock expires so a crashed holder cannot block the key for good.
+    """
+    owner = uuid.uuid4().hex
+    while True:
+        try:
+            await db.blob_locks.insert_one({
+                "_id": minio_key,
+                "owner": owner,
+                "expires_at": datetime.utcnow() + timedelta(seconds=BLOB_LOCK_SECONDS)
+            })
+            break
+        except DuplicateKeyError:
+            await db.blob_locks.delete_one({"_id": minio_key, "expires_at": {"$lt": datetime.utcnow()}})
+            await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        await db.blob_locks.delete_one({"_id": minio_key, "owner": owner})
+
+async def put_blob(file: UploadFile, minio_key: str, file_size: int):
+    """Store an upload under its content address unless it already is, call under blob_lock"""
+    # Stream to MinIO as multipart parts, once per unique file
+    if not await asyncio.to_thread(minio_object_exists, minio_key):
+        await asyncio.to_thread(
+            minio_client.put_object,
+            MINIO_BUCKET,
+            minio_key,
+            file.file,
+            file_size,
+            content_type=file.content_type,
+            part_size=UPLOAD_PART_SIZE
+        )
+
+async def release_blob(minio_key: Optional[str]):
+    """Delete a stored file once no document references it
+
+    Covers content-addressed blobs and the per-document objects of uploads made
+    before content addressing. Failures are logged, an unreferenced object is harmless.
+    """
+    if not minio_key:
+        return
     try:
-        # Update status
+        async with blob_lock(minio_key):
+            if await db.documents.count_documents({"minio_key": minio_key}, limit=1):
+                return
+            await asyncio.to_thread(minio_client.remove_object, MINIO_BUCKET, minio_key)
+    except Exception as e:
+        logger.warning(f"Removing {minio_key} failed: {e}")
+
+async def remove_document_chunks(patient_id: str, document_id: str) -> Optional[int]:
+    """Remove a document's chunks, None if that failed and index GC has to collect them
+
+    Chunks are removed from the index versions writes target; other versions
+    being built are reconciled by index GC. The count is the active version's.
+    """
+    try:
+        removed = [
+            await asyncio.to_thread(
+                doc_processor.remove_vector_chunks, version_partition(patient_id, version), [document_id]
+            )
+            for version, _ in await index_versions.targets()
+        ]
+        return removed[0]
+    except Exception as e:
+        logger.warning(f"Removing chunks of document {document_id} failed, leaving them to index GC: {e}")
+        return None
+
+def minio_object_exists(key: str) -> bool:
+    """Check whether an object is already stored in the MinIO bucket"""
+    try:
+        minio_client.stat_object(MINIO_BUCKET, key)
+        return True
+    except S3Error as e:
+        if e.code in ("NoSuchKey", "NoSuchObject"):
+            return False
+        raise
+
+def revision_filter(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Match the document only while it still has the revision it was read at"""
+    # Documents uploaded before revisions were introduced match on the field being absent
+    return {"document_id": document["document_id"], "revision": document.get("revision")}
+
+async def process_document(document_id: str, job: Optional[Dict[str, Any]] = None):
+    """Process an uploaded document, raising on failure so the job can be retried
+
+    Results are only written while the document keeps the revision it was read
+    at and the job still holds its lease; otherwise JobSuperseded is raised.
+    """
+    document = await db.documents.find_one({"document_id": document_id})
+    if not document:
+        raise JobSuperseded(f"Document {document_id} no longer exists")
+    
+    async def still_current() -> bool:
+        if job is not None and not await ingestion_queue.renew_lease(job):
+            return False
+        return await db.documents.count_documents(revision_filter(document), limit=1) > 0
+    
+    if not await still_current():
+        raise JobSuperseded(f"Document {document_id} changed before processing started")
+    await db.documents.update_one(
+        revision_filter(document),
+        {"$set": {"processing_status": "processing"}}
+    )
+    
+    async def report_progress(pages_done: int, pages_total: int):
         await db.documents.update_one(
-            {"document_id": document_id},
-            {"$set": {"processing_status": "processing"}}
+            revision_filter(document),
+            {"$set": {"progress": {"pages_done": pages_done, "pages_total": pages_total}}}
         )
+    
+    # Fetch the stored object into a temporary file for processing
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+        temp_path = temp_file.name
+    
+    try:
+        await asyncio.to_thread(minio_client.fget_object, MINIO_BUCKET, document["minio_key"], temp_path)
         
-        # Save to temporary file for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(file_content)
-            temp_path = temp_file.name
+        result = await doc_processor.process_pdf(temp_path, on_progress=report_progress)
+        if not result["success"]:
+            raise RuntimeError(result.get("error", "Unknown error"))
         
-        # Process document
-        result = await doc_processor.process_pdf(temp_path)
+        # Add to vector store
+        metadata = {
+            "document_id": document_id,
+            "filename": document["filename"],
+            "document_type": document["document_type"]
+        }
         
-        if result["success"]:
-            # Add to vector store
-            document = await db.documents.find_one({"document_id": document_id})
-            metadata = {
-                "document_id": document_id,
-                "filename": document["filename"],
-                "document_type": document["document_type"]
-            }
-            
-            await doc_processor.add_to_vector_store(result["text"], document_id, metadata)
-            
-            # Update document with processing results
-            await db.documents.update_one(
-                {"document_id": document_id},
-                {"$set": {
-                    "processing_status": "completed",
-                    "extracted_text": result["text"],
-                    "medical_entities": result["entities"],
-                    "page_count": result["page_count"],
-                    "processed_at": datetime.utcnow()
-                }}
-            )
-        else:
-            await db.documents.update_one(
-                {"document_id": document_id},
-                {"$set": {
-                    "processing_status": "failed",
-                    "error": result.get("error", "Unknown error")
-                }}
-            )
+        if not await doc_processor.add_to_vector_store(
+            result["text"], document_id, document["patient_id"], metadata, result["pages"], still_current
+        ):
+            raise RuntimeError("Vector store addition failed")
         
+        # Update document with processing results
+        updated = await db.documents.update_one(
+            revision_filter(document),
+            {"$set": {
+                "processing_status": "completed",
+                "extracted_text": result["text"],
+                "medical_entities": result["entities"],
+                "page_count": result["page_count"],
+                "pdf_metadata": result["pdf_metadata"],
+                "pages": result["pages"],
+                "ocr_stats": result["ocr_stats"],
+                "index_version": INDEX_VERSION,
+                "processed_at": datetime.utcnow()
+            }, "$unset": {"error": ""}}
+        )
+        if updated.matched_count == 0:
+            raise JobSuperseded(f"Document {document_id} changed while it was being processed")
+    finally:
         # Clean up temp file
         os.unlink(temp_path)
+
+@api_router.post("/documents/entities/reextract")
+async def reextract_document_entities(current_user: User = Depends(get_current_user)):
+    """Re-run medical entity extraction over the stored text of the user's documents"""
+    try:
+        updated = 0
+        cursor = db.documents.find(
+            {"user_id": current_user.id, "processing_status": "completed"},
+            {"document_id": 1, "extracted_text": 1}
+        ).batch_size(ENTITY_REEXTRACT_BATCH_SIZE)
         
+        while batch := await cursor.to_list(ENTITY_REEXTRACT_BATCH_SIZE):
+            results = await asyncio.to_thread(
+                entity_extractor.extract_batch,
+                [doc.get("extracted_text", "") for doc in batch]
+            )
+            await db.documents.bulk_write([
+                UpdateOne({"document_id": doc["document_id"]}, {"$set": {"medical_entities": entities}})
+                for doc, entities in zip(batch, results)
+            ])
+            updated += len(batch)
+        
+        return {"documents_updated": updated}
     except Exception as e:
-        logger.error(f"Document processing failed: {e}")
-        await db.documents.update_one(
-            {"document_id": document_id},
-            {"$set": {"processing_status": "failed", "error": str(e)}}
-        )
+        logger.error(f"Entity re-extraction failed: {e}")
+        raise HTTPException(status_code=500, detail="Entity re-extraction failed")
 
 @api_router.get("/documents")
 async def list_documents(current_user: User = Depends(get_current_user)):
@@ -817,7 +1920,8 @@ async def list_documents(current_user: User = Depends(get_current_user)):
             "file_size": doc["file_size"],
             "document_type": doc["document_type"],
             "uploaded_at": doc["uploaded_at"].isoformat() if isinstance(doc["uploaded_at"], datetime) else doc["uploaded_at"],
-            "processing_status": doc["processing_status"]
+            "processing_status": doc["processing_status"],
+            "progress": doc.get("progress")
         })
     
     return {"documents": formatted_docs}
@@ -844,17 +1948,146 @@ async def download_document(document_id: str, current_user: User = Depends(get_c
         logger.error(f"Document download failed: {e}")
         raise HTTPException(status_code=500, detail="Document download failed")
 
+@api_router.put("/documents/{document_id}")
+async def replace_document(
+    document_id: str,
+    file: UploadFile = File(...),
+    document_type: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Replace a document's file, dropping its chunks and processing the new file"""
+    document = await db.documents.find_one({"document_id": document_id, "user_id": current_user.id})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if not file.filename.lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported")
+    
+    try:
+        content_hash, file_size = await hash_upload(file)
+        minio_key = f"blobs/sha256/{content_hash}"
+        update = {
+            "filename": file.filename,
+            "file_size": file_size,
+            "content_type": file.content_type,
+            "content_hash": content_hash,
+            "minio_key": minio_key,
+            "document_type": document_type or document.get("document_type", "medical_record"),
+            "uploaded_at": datetime.utcnow(),
+            # A new revision makes a job still processing the old file drop its results
+            "revision": str(uuid.uuid4()),
+            "processing_status": "pending"
+        }
+        async with blob_lock(minio_key):
+            await put_blob(file, minio_key, file_size)
+            await db.documents.update_one(
+                {"document_id": document_id},
+                {"$set": update, "$unset": {
+                    "extracted_text": "", "medical_entities": "", "pages": "", "page_count": "", "pdf_metadata": "",
+                    "ocr_stats": "", "index_version": "", "progress": "", "error": "", "deduplicated_from": ""
+                }}
+            )
+        await ingestion_queue.cancel(document_id)
+        
+        # Chunks of the old file are removed now rather than left to be overwritten
+        chunks_removed = await remove_document_chunks(document["patient_id"], document_id)
+        await ingestion_queue.enqueue(document_id)
+        if document.get("minio_key") != minio_key:
+            await release_blob(document.get("minio_key"))
+        
+        return {"document_id": document_id, "filename": file.filename, "file_size": file_size,
+                "upload_status": "replaced", "chunks_removed": chunks_removed}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Document replace failed: {e}")
+        raise HTTPException(status_code=500, detail="Document replace failed")
+
+@api_router.delete("/documents/{document_id}")
+async def delete_document(document_id: str, current_user: User = Depends(get_current_user)):
+    """Delete a document, its chunks, its pending jobs and its file if no other document shares it"""
+    document = await db.documents.find_one({"document_id": document_id, "user_id": current_user.id})
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    try:
+        await ingestion_queue.cancel(document_id)
+        # The record goes first, so chunks a failed removal leaves behind are orphans for index GC
+        await db.documents.delete_one({"document_id": document_id})
+        chunks_removed = await remove_document_chunks(document["patient_id"], document_id)
+        await release_blob(document.get("minio_key"))
+        return {"document_id": document_id, "deleted": True, "chunks_removed": chunks_removed}
+    except Exception as e:
+        logger.error(f"Document delete failed: {e}")
+        raise HTTPException(status_code=500, detail="Document delete failed")
+
+# Vector index routes
+@api_router.post("/index/rebuild", status_code=202)
+async def rebuild_vector_index(current_user: User = Depends(get_current_user)):
+    """Re-chunk and re-embed stale documents from their stored text"""
+    if current_user.role != UserRole.CLINICIAN:
+        raise HTTPException(status_code=403, detail="Only clinicians can rebuild the index")
+    
+    started = index_rebuilder.start()
+    return {"started": started, **await index_rebuilder.status()}
+
+@api_router.post("/index/gc", status_code=202)
+async def collect_vector_index(current_user: User = Depends(get_current_user)):
+    """Remove orphan chunks and compact the vector store"""
+    if current_user.role != UserRole.CLINICIAN:
+        raise HTTPException(status_code=403, detail="Only clinicians can run index GC")
+    
+    started = index_gc.start()
+    return {"started": started, "running": index_gc.running, "last_run": index_gc.last_run}
+
+@api_router.get("/index/status")
+async def vector_index_status(current_user: User = Depends(get_current_user)):
+    """Current index version, number of stale documents and the last GC run"""
+    return {**await index_rebuilder.status(), "gc": {"running": index_gc.running, "last_run": index_gc.last_run}}
+
 # Medical analysis routes
+def llm_priority(user: User) -> int:
+    """LLM queue priority, clinicians ahead of patients"""
+    return 0 if user.role == UserRole.CLINICIAN else 1
+
+async def cancel_on_disconnect(http_request: Request, awaitable: Awaitable):
+    """Await a result, cancelling the work (and any LLM generation) if the client disconnects"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.info("Client disconnected, cancelling analysis")
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        task.cancel()
+
+async def resolve_query_patients(current_user: User, request: MedicalAnalysisRequest) -> List[str]:
+    """Vector partitions a query is routed to"""
+    if current_user.role != UserRole.CLINICIAN:
+        return [current_user.id]
+    if request.patient_id:
+        return [request.patient_id]
+    if request.document_ids:
+        return await db.documents.distinct("patient_id", {"document_id": {"$in": request.document_ids}})
+    # Without an explicit scope, clinicians search the patients whose documents they uploaded
+    return await db.documents.distinct("patient_id", {"user_id": current_user.id})
+
 @api_router.post("/analyze", response_model=MedicalAnalysisResponse)
 async def analyze_medical_query(
     request: MedicalAnalysisRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user)
 ):
     analysis_id = str(uuid.uuid4())
-    
     try:
-        # Perform analysis
-        result = await analysis_service.analyze_query(request.query, request.document_ids)
+        # Perform analysis within the patients the user may query
+        patient_ids = await resolve_query_patients(current_user, request)
+        result = await cancel_on_disconnect(
+            http_request,
+            analysis_service.analyze_query(request.query, patient_ids, request.document_ids, llm_priority(current_user))
+        )
         
         if not result["success"]:
             raise HTTPException(status_code=500, detail=result.get("error", "Analysis failed"))
@@ -868,6 +2101,8 @@ async def analyze_medical_query(
             "confidence_score": result["confidence"],
             "sources": result["sources"],
             "analysis_type": request.analysis_type,
+            "cached": result["cached"],
+            "generation": result["generation"],
             "created_at": datetime.utcnow()
         }
         
@@ -879,15 +2114,108 @@ async def analyze_medical_query(
             response=result["response"],
             confidence_score=result["confidence"],
             sources=result["sources"],
-            timestamp=datetime.utcnow().isoformat()
+            timestamp=datetime.utcnow().isoformat(),
+            cached=result["cached"]
         )
         
     except HTTPException:
         raise
+    except LLMQueueFull as e:
+        raise HTTPException(
+            status_code=429, detail="Analysis queue is full", headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Medical analysis failed: {e}")
         raise HTTPException(status_code=500, detail="Analysis failed")
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@api_router.post("/analyze/stream")
+async def stream_medical_query(
+    request: MedicalAnalysisRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Analyze a query, relaying the answer as it is generated over Server-Sent Events
+
+    Events are "sources" once retrieval is done, "token" for each piece of
+    text, then "done" with timing stats, or "error". The analysis is stored
+    when the stream completes; a client that disconnects cancels generation.
+    A cached answer is sent as a single token event.
+    """
+    analysis_id = str(uuid.uuid4())
+    patient_ids = await resolve_query_patients(current_user, request)
+    context_docs = await analysis_service.retrieve(request.query, patient_ids, request.document_ids)
+    sources = [doc["document_id"] for doc in context_docs]
+    cached_response = analysis_service.cached_answer(request.query, context_docs)
+    # Reject before the stream starts while it can still be a 429
+    if cached_response is None and llm_scheduler.full:
+        raise HTTPException(
+            status_code=429, detail="Analysis queue is full",
+            headers={"Retry-After": str(llm_scheduler.retry_after())}
+        )
+    
+    async def events():
+        yield sse_event("sources", {"analysis_id": analysis_id, "sources": sources})
+        
+        started = time.perf_counter()
+        stats: Dict[str, Any] = {}
+        pieces = []
+        if cached_response is not None:
+            pieces.append(cached_response)
+            yield sse_event("token", {"text": cached_response})
+        else:
+            try:
+                async for piece in analysis_service.stream_response(
+                    request.query, context_docs, stats, llm_priority(current_user)
+                ):
+                    pieces.append(piece)
+                    yield sse_event("token", {"text": piece})
+            except LLMQueueFull as e:
+                yield sse_event("error", {
+                    "analysis_id": analysis_id, "detail": "Analysis queue is full", "retry_after": e.retry_after
+                })
+                return
+            except LLMError as e:
+                logger.error(f"Streaming analysis {analysis_id} failed: {e}")
+                yield sse_event("error", {"analysis_id": analysis_id, "detail": "Analysis failed"})
+                return
+            if stats.get("generated"):
+                analysis_service.cache_answer(request.query, context_docs, "".join(pieces))
+        
+        generation = {
+            "cached": cached_response is not None,
+            "queue_ms": stats.get("queue_ms"),
+            "prompt_tokens": stats.get("prompt_tokens"),
+            "prompt_tokens_estimate": stats.get("prompt_tokens_estimate"),
+            "context_passages": stats.get("context_passages"),
+            "ttft_ms": stats.get("ttft_ms"),
+            "completion_tokens": stats.get("completion_tokens"),
+            "tokens_per_second": stats.get("tokens_per_second"),
+            "total_ms": round(1000 * (time.perf_counter() - started), 1)
+        }
+        await db.analyses.insert_one({
+            "analysis_id": analysis_id,
+            "user_id": current_user.id,
+            "query": request.query,
+            "response": "".join(pieces),
+            "confidence_score": 0.85,  # Placeholder
+            "sources": sources,
+            "analysis_type": request.analysis_type,
+            "streamed": True,
+            "cached": generation["cached"],
+            "generation": generation,
+            "created_at": datetime.utcnow()
+        })
+        yield sse_event("done", {"analysis_id": analysis_id, **generation})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # Wearable data routes
 @api_router.get("/wearable/google/auth")
 async def google_fit_auth(current_user: User = Depends(get_current_user)):
@@ -1105,6 +2433,20 @@ async def download_report(report_id: str, current_user: User = Depends(get_curre
         logger.error(f"Report download failed: {e}")
         raise HTTPException(status_code=500, detail="Report download failed")
 
+# Metrics
+@api_router.get("/metrics")
+async def get_metrics():
+    """Pipeline throughput metrics for this process"""
+    return {
+        "embedding": embedding_service.metrics(),
+        "vector_search": vector_search.metrics(),
+        "lexical_search": lexical_index.metrics(),
+        "reranker": reranker.metrics() if reranker is not None else None,
+        "llm": llm_client.metrics(),
+        "llm_scheduler": llm_scheduler.metrics(),
+        "answer_cache": answer_cache.metrics() if answer_cache is not None else None
+    }
+
 # Health check
 @api_router.get("/health")
 async def health_check():
@@ -1115,7 +2457,7 @@ async def health_check():
         "services": {
             "database": "connected",
             "minio": "connected" if minio_client else "disconnected",
-            "vector_store": "connected" if collection else "disconnected"
+            "vector_store": vector_store.name
         }
     }
 
@@ -1134,9 +2476,30 @@ app.add_middleware(
 # Startup event
 @app.on_event("startup")
 async def startup_event():
+    # Load the embedding model before the first upload or query needs it
+    await embedding_service.start()
+    if reranker is not None:
+        await reranker.start()
+    await llm_client.start()
+    await db.documents.create_index("content_hash")
+    await db.documents.create_index([("processing_status", 1), ("index_version", 1)])
+    await ingestion_queue.ensure_indexes()
+    await ensure_shared_indexes(separate_process=False)
+    
+    # Set INGEST_EMBEDDED_CONCURRENCY=0 and run worker.py to process documents outside the API
+    if INGEST_EMBEDDED_CONCURRENCY > 0:
+        worker = IngestionWorker(ingestion_queue, INGEST_EMBEDDED_CONCURRENCY, INGEST_POLL_INTERVAL_SECONDS)
+        embedded_workers.append(asyncio.create_task(worker.run()))
+    if GC_INTERVAL_SECONDS > 0:
+        embedded_workers.append(asyncio.create_task(index_gc.run_periodically()))
     logger.info("HealthSync Platform API started successfully")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    for task in embedded_workers:
+        task.cancel()
+    doc_processor.ocr_engine.shutdown()
+    vector_search.shutdown()
+    await llm_client.aclose()
     client.close()
     logger.info("HealthSync Platform API shutdown completed")
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""Coalescing vector search executor.
+
+Vector store queries are synchronous, so they run on a bounded thread pool
+instead of the event loop. Queries that arrive within a few milliseconds of
+each other and target the same partition with the same filter are merged into
+one multi-query call and the results are split back to each caller.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Any, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# query_fn(partition, query_embeddings, n_results, where) -> Chroma-style result dict
+QueryFunction = Callable[[str, List[List[float]], int, Optional[Dict[str, Any]]], Dict[str, Any]]
+
+# Result fields holding one list per query; others, such as Chroma's "included", are not split
+PER_QUERY_FIELDS = ("ids", "documents", "metadatas", "distances", "embeddings")
+
+
+class VectorSearchBatcher:
+    """Runs vector queries off the event loop, merging near-simultaneous ones"""
+
+    def __init__(self, query_fn: QueryFunction, max_threads: int = 4, coalesce_ms: float = 3.0,
+                 max_batch_size: int = 32):
+        self.query_fn = query_fn
+        self.coalesce = coalesce_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="vector-search")
+        self._pending: Dict[Tuple[str, str], List[Tuple[List[float], int, asyncio.Future]]] = {}
+        self._latencies_ms = deque(maxlen=2000)
+        self._stats = {"queries": 0, "calls": 0, "max_batch": 0}
+
+    async def query(self, partition: str, query_embedding: List[float], n_results: int,
+                    where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Search one partition for one embedding and return a single-query Chroma-style result"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        future = loop.create_future()
+        key = (partition, json.dumps(where, sort_keys=True))
+
+        group = self._pending.get(key)
+        if group is None:
+            group = self._pending[key] = []
+            loop.call_later(self.coalesce, self._flush, key, where)
+        group.append((query_embedding, n_results, future))
+        if len(group) >= self.max_batch_size:
+            self._flush(key, where)
+
+        try:
+            return await future
+        finally:
+            self._stats["queries"] += 1
+            self._latencies_ms.append(1000 * (time.perf_counter() - started))
+
+    def _flush(self, key: Tuple[str, str], where: Optional[Dict[str, Any]]):
+        group = self._pending.pop(key, None)
+        if group:
+            asyncio.ensure_future(self._run_group(key[0], group, where))
+
+    async def _run_group(self, partition: str, group: List[Tuple[List[float], int, asyncio.Future]],
+                         where: Optional[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        embeddings = [embedding for embedding, _, _ in group]
+        n_results = max(n for _, n, _ in group)
+        self._stats["calls"] += 1
+        self._stats["max_batch"] = max(self._stats["max_batch"], len(group))
+        error: Optional[BaseException] = None
+        try:
+            results = await loop.run_in_executor(self._executor, self.query_fn, partition, embeddings, n_results, where)
+            for index, (_, n, future) in enumerate(group):
+                if not future.done():
+                    future.set_result({
+                        field: [values[index][:n]] if field in PER_QUERY_FIELDS else values
+                        for field, values in results.items()
+                        if values is not None
+                    })
+        except Exception as e:
+            error = e
+        finally:
+            # No caller may be left waiting, whether the query or the split failed or this task was cancelled
+            for _, _, future in group:
+                if not future.done():
+                    if error is None:
+                        future.cancel()
+                    else:
+                        future.set_exception(error)
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies_ms)
+
+        def percentile(p: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else 0.0
+
+        calls = self._stats["calls"]
+        return {
+            "queries": self._stats["queries"],
+            "store_calls": calls,
+            "avg_queries_per_call": round(self._stats["queries"] / calls, 2) if calls else 0.0,
+            "max_queries_per_call": self._stats["max_batch"],
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p99": percentile(0.99),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,587 @@
+"""Partitioned vector store backends.
+
+Chunks live in one partition per patient and index version. Every backend
+takes and returns Chroma-style dicts, so callers do not depend on the backend:
+
+    chroma  one Chroma collection per partition
+    mmap    quantized (float16 or int8) vectors in an append-only memory-mapped
+            file per partition, with chunk text and metadata in SQLite. Nothing
+            is loaded at startup and a query only pages in the rows it scans,
+            so RSS and cold start stay flat as the corpus grows.
+
+Filters support the subset used by the application: {"document_id": id} and
+{"document_id": {"$in": [ids]}}.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Dict, Any, Iterable, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances")
+
+
+def partition_name(patient_id: str) -> str:
+    """Storage name of a patient's partition, hashed to fit any backend's naming rules"""
+    return f"patient_{hashlib.sha256(patient_id.encode()).hexdigest()[:32]}"
+
+
+def version_partition(patient_id: str, version: Optional[str]) -> str:
+    """Partition of a patient within an index version, the bare patient id for unversioned indexes"""
+    return patient_id if version is None else f"{patient_id}@{version}"
+
+
+def partition_version(partition: str) -> Tuple[str, Optional[str]]:
+    """(patient id, index version) of a partition named by version_partition"""
+    patient_id, separator, version = partition.rpartition("@")
+    return (patient_id, version) if separator else (partition, None)
+
+
+def document_ids_filter(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Document ids a where filter selects, or None for no filter"""
+    if not where:
+        return None
+    if set(where) != {"document_id"}:
+        raise ValueError(f"Unsupported vector store filter: {where}")
+    condition = where["document_id"]
+    if isinstance(condition, str):
+        return [condition]
+    if isinstance(condition, dict) and set(condition) == {"$in"}:
+        return list(condition["$in"])
+    raise ValueError(f"Unsupported vector store filter: {where}")
+
+
+class VectorStore:
+    """Base class for partitioned chunk stores"""
+
+    name = "base"
+
+    def upsert(self, partition: str, ids: List[str], documents: List[str],
+               embeddings: List[List[float]], metadatas: List[Dict[str, Any]]):
+        """Insert chunks, replacing any with the same ids"""
+        raise NotImplementedError
+
+    def delete(self, partition: str, ids: List[str]):
+        raise NotImplementedError
+
+    def get(self, partition: str, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+            include: Iterable[str] = ("documents", "metadatas")) -> Dict[str, Any]:
+        """Chunks by id or filter as {"ids": [...], <included field>: [...]}"""
+        raise NotImplementedError
+
+    def query(self, partition: str, query_embeddings: List[List[float]], n_results: int,
+              where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Nearest chunks per query embedding, as lists per query of ids, documents, metadatas and distances"""
+        raise NotImplementedError
+
+    def delete_documents(self, partition: str, document_ids: List[str]) -> int:
+        """Delete every chunk of the documents, returning how many were removed"""
+        raise NotImplementedError
+
+    def partitions(self) -> List[str]:
+        """Every partition that has been written to"""
+        raise NotImplementedError
+
+    def count(self, partition: str) -> int:
+        raise NotImplementedError
+
+    def document_ids(self, partition: str) -> set:
+        """Ids of the documents with chunks in the partition"""
+        raise NotImplementedError
+
+    def compact(self, partition: str) -> Dict[str, int]:
+        """Reclaim space left by deleted chunks, reporting bytes before and after"""
+        return {"bytes_before": 0, "bytes_after": 0}
+
+    def drop(self, partition: str):
+        """Remove the partition and all of its chunks"""
+        raise NotImplementedError
+
+    def empty_result(self, queries: int) -> Dict[str, Any]:
+        return {field: [[] for _ in range(queries)] for field in RESULT_FIELDS}
+
+
+class ChromaVectorStore(VectorStore):
+    """One Chroma collection per partition"""
+
+    name = "chroma"
+
+    def __init__(self, client, embedding_function=None):
+        self.client = client
+        self.embedding_function = embedding_function
+        self._collections: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, partition: str, create: bool = False):
+        """The partition's collection, or None if it does not exist and create is False"""
+        name = partition_name(partition)
+        with self._lock:
+            if name not in self._collections:
+                if create:
+                    self._collections[name] = self.client.get_or_create_collection(
+                        name, embedding_function=self.embedding_function, metadata={"patient_id": partition}
+                    )
+                else:
+                    try:
+                        self._collections[name] = self.client.get_collection(
+                            name, embedding_function=self.embedding_function
+                        )
+                    except Exception:
+                        return None
+            return self._collections[name]
+
+    def upsert(self, partition, ids, documents, embeddings, metadatas):
+        if ids:
+            self._collection(partition, create=True).upsert(
+                ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas
+            )
+
+    def delete(self, partition, ids):
+        collection = self._collection(partition)
+        if collection is not None and ids:
+            collection.delete(ids=ids)
+
+    def get(self, partition, ids=None, where=None, include=("documents", "metadatas")):
+        collection = self._collection(partition)
+        if collection is None:
+            return {"ids": [], **{field: [] for field in include}}
+        return collection.get(ids=ids, where=where, include=list(include))
+
+    def query(self, partition, query_embeddings, n_results, where=None):
+        collection = self._collection(partition)
+        if collection is None:
+            return self.empty_result(len(query_embeddings))
+        return collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=['documents', 'metadatas', 'distances']
+        )
+
+    def delete_documents(self, partition, document_ids):
+        collection = self._collection(partition)
+        if collection is None or not document_ids:
+            return 0
+        before = collection.count()
+        collection.delete(where={"document_id": {"$in": list(document_ids)}})
+        return before - collection.count()
+
+    def partitions(self):
+        partitions = []
+        for collection in self.client.list_collections():
+            # Older clients return collections, newer ones only names
+            name = getattr(collection, "name", collection)
+            if name.startswith("patient_"):
+                metadata = getattr(collection, "metadata", None) or self.client.get_collection(name).metadata or {}
+                if "patient_id" in metadata:
+                    partitions.append(metadata["patient_id"])
+        return partitions
+
+    def count(self, partition):
+        collection = self._collection(partition)
+        return collection.count() if collection is not None else 0
+
+    def document_ids(self, partition):
+        collection = self._collection(partition)
+        if collection is None:
+            return set()
+        return {metadata.get("document_id") for metadata in collection.get(include=["metadatas"])["metadatas"]}
+
+    def drop(self, partition):
+        name = partition_name(partition)
+        with self._lock:
+            self._collections.pop(name, None)
+        try:
+            self.client.delete_collection(name)
+        except Exception as e:
+            logger.warning(f"Dropping collection {name} failed: {e}")
+
+
+class MmapVectorStore(VectorStore):
+    """Quantized flat index over memory-mapped per-partition vector files
+
+    Vectors are L2-normalized and appended as float16, or as int8 with a
+    float32 scale per row. Replaced and deleted chunks leave dead rows in the
+    file until compact() rewrites it as a new file version. Distances are
+    cosine distances. Several processes may share the directory: writers take
+    SQLite's write lock for the whole change, so they are serialized across
+    processes, and readers see one consistent snapshot.
+    """
+
+    name = "mmap"
+
+    # Rows dequantized and scored at a time
+    BLOCK_ROWS = 65536
+    # Stay below SQLite's bound-parameter limit
+    QUERY_CHUNK = 500
+    # Reads retried when another process compacts the file they were about to map
+    SNAPSHOT_ATTEMPTS = 3
+
+    def __init__(self, directory: str, dtype: str = "float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype '{dtype}', expected float16 or int8")
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # partition -> (generation, (live rows, chunk ids)), reloaded when another process writes
+        self._live_rows: Dict[str, Tuple[int, Tuple[np.ndarray, List[str]]]] = {}
+        self._connection = sqlite3.connect(
+            os.path.join(directory, "chunks.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS partitions ("
+            " partition TEXT PRIMARY KEY,"
+            " dim INTEGER NOT NULL,"
+            " rows INTEGER NOT NULL,"
+            " generation INTEGER NOT NULL,"
+            " file_version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(partitions)")}
+        if "file_version" not in columns:
+            self._connection.execute("ALTER TABLE partitions ADD COLUMN file_version INTEGER NOT NULL DEFAULT 0")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " partition TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " row INTEGER NOT NULL,"
+            " document_id TEXT,"
+            " document TEXT,"
+            " metadata TEXT,"
+            " PRIMARY KEY (partition, id))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chunks_document ON chunks (partition, document_id)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS chunks_row ON chunks (partition, row)")
+        self._connection.commit()
+
+        try:
+            import faiss
+            self._faiss = faiss
+        except ImportError:
+            self._faiss = None
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """The thread lock and one SQLite transaction
+
+        BEGIN IMMEDIATE takes the database write lock up front, so a writer's
+        read of the row count, its file append and its commit cannot interleave
+        with another process's.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._connection.rollback()
+                raise
+            self._connection.commit()
+
+    def _path(self, partition: str, suffix: str, version: int = 0) -> str:
+        # Compaction writes a new file version so open mappings of the old one stay valid
+        name = partition_name(partition) if not version else f"{partition_name(partition)}.v{version}"
+        return os.path.join(self.directory, f"{name}.{suffix}")
+
+    def _partition(self, partition: str) -> Optional[Tuple[int, int, int, int]]:
+        """(dim, rows, generation, file version) of a partition, None if it has never been written"""
+        return self._connection.execute(
+            "SELECT dim, rows, generation, file_version FROM partitions WHERE partition = ?", (partition,)
+        ).fetchone()
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.dtype == np.float16:
+            return vectors.astype(np.float16), None
+        scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _open(self, partition: str, state: Tuple[int, int, int, int]) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Map the partition's vector (and int8 scale) files, called with the lock held"""
+        dim, rows, _, version = state
+        vectors = np.memmap(self._path(partition, self.dtype.name, version), dtype=self.dtype, mode="r", shape=(rows, dim))
+        scales = None
+        if self.dtype == np.int8:
+            scales = np.memmap(self._path(partition, "scale", version), dtype=np.float32, mode="r", shape=(rows,))
+        return vectors, scales
+
+    @staticmethod
+    def _read(mapped: Tuple[np.ndarray, Optional[np.ndarray]], row_numbers: np.ndarray) -> np.ndarray:
+        """Dequantized float32 vectors for the given rows"""
+        vectors, scales = mapped
+        # A run of consecutive rows is read as a slice instead of a gather
+        if len(row_numbers) and row_numbers[-1] - row_numbers[0] == len(row_numbers) - 1:
+            row_numbers = slice(int(row_numbers[0]), int(row_numbers[-1]) + 1)
+        block = vectors[row_numbers].astype(np.float32)
+        if scales is not None:
+            block *= scales[row_numbers][:, None]
+        return block
+
+    def upsert(self, partition, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        quantized, scales = self._quantize(vectors)
+
+        with self._transaction(write=True):
+            state = self._partition(partition)
+            dim, rows, generation, version = state if state else (vectors.shape[1], 0, 0, 0)
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match partition dimension {dim}")
+
+            # Rows past the committed count are leftovers of an interrupted write
+            with open(self._path(partition, self.dtype.name, version), "ab") as file:
+                file.truncate(rows * dim * self.dtype.itemsize)
+                file.write(quantized.tobytes())
+            if scales is not None:
+                with open(self._path(partition, "scale", version), "ab") as file:
+                    file.truncate(rows * 4)
+                    file.write(scales.tobytes())
+
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO chunks (partition, id, row, document_id, document, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (partition, chunk_id, rows + i, (metadata or {}).get("document_id"), document, json.dumps(metadata or {}))
+                    for i, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO partitions (partition, dim, rows, generation, file_version)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (partition, dim, rows + len(ids), generation + 1, version)
+            )
+
+    def _delete_where(self, partition: str, column: str, values: List[str]) -> int:
+        if not values:
+            return 0
+        with self._transaction(write=True):
+            deleted = 0
+            for start in range(0, len(values), self.QUERY_CHUNK):
+                part = values[start:start + self.QUERY_CHUNK]
+                deleted += self._connection.execute(
+                    f"DELETE FROM chunks WHERE partition = ? AND {column} IN ({','.join('?' * len(part))})",
+                    [partition, *part]
+                ).rowcount
+            self._connection.execute("UPDATE partitions SET generation = generation + 1 WHERE partition = ?", (partition,))
+        return deleted
+
+    def delete(self, partition, ids):
+        self._delete_where(partition, "id", ids)
+
+    def delete_documents(self, partition, document_ids):
+        return self._delete_where(partition, "document_id", document_ids)
+
+    def _select(self, partition: str, columns: str, ids: Optional[List[str]] = None,
+                document_ids: Optional[List[str]] = None) -> List[tuple]:
+        """Chunk rows of a partition, optionally restricted by chunk or document ids, in row order"""
+        if ids is None and document_ids is None:
+            return self._connection.execute(
+                f"SELECT {columns} FROM chunks WHERE partition = ? ORDER BY row", (partition,)
+            ).fetchall()
+        column, values = ("id", ids) if ids is not None else ("document_id", document_ids)
+        rows = []
+        for start in range(0, len(values), self.QUERY_CHUNK):
+            part = values[start:start + self.QUERY_CHUNK]
+            rows.extend(self._connection.execute(
+                f"SELECT {columns} FROM chunks WHERE partition = ? AND {column} IN ({','.join('?' * len(part))})",
+                [partition, *part]
+            ).fetchall())
+        return sorted(rows, key=lambda row: row[0])
+
+    def get(self, partition, ids=None, where=None, include=("documents", "metadatas")):
+        include = list(include)
+        for attempt in range(self.SNAPSHOT_ATTEMPTS):
+            try:
+                with self._transaction():
+                    state = self._partition(partition)
+                    if state is None:
+                        return {"ids": [], **{field: [] for field in include}}
+                    rows = self._select(partition, "row, id, document, metadata", ids, document_ids_filter(where))
+                    if "embeddings" in include and rows:
+                        row_numbers = np.array([row[0] for row in rows], dtype=np.int64)
+                        embeddings = self._read(self._open(partition, state), row_numbers).tolist()
+                break
+            except FileNotFoundError:
+                # Another process compacted the partition after this snapshot was taken
+                if attempt == self.SNAPSHOT_ATTEMPTS - 1:
+                    raise
+        result: Dict[str, Any] = {"ids": [row[1] for row in rows]}
+        if "documents" in include:
+            result["documents"] = [row[2] for row in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [json.loads(row[3]) for row in rows]
+        if "embeddings" in include:
+            result["embeddings"] = embeddings if rows else []
+        return result
+
+    def _candidates(self, partition: str, generation: int,
+                    document_ids: Optional[List[str]]) -> Tuple[np.ndarray, List[str]]:
+        """Live rows and their chunk ids, called with the lock held"""
+        if document_ids is not None:
+            selected = self._select(partition, "row, id", document_ids=document_ids)
+            return np.array([row for row, _ in selected], dtype=np.int64), [chunk_id for _, chunk_id in selected]
+        cached = self._live_rows.get(partition)
+        if cached is None or cached[0] != generation:
+            selected = self._select(partition, "row, id")
+            cached = self._live_rows[partition] = (
+                generation,
+                (np.array([row for row, _ in selected], dtype=np.int64), [chunk_id for _, chunk_id in selected])
+            )
+        return cached[1]
+
+    def _top_k(self, queries: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Inner-product scores and positions of the k best vectors per query"""
+        if self._faiss is not None:
+            return self._faiss.knn(queries, vectors, k, metric=self._faiss.METRIC_INNER_PRODUCT)
+        scores = queries @ vectors.T
+        positions = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < scores.shape[1] else \
+            np.tile(np.arange(scores.shape[1]), (len(queries), 1))
+        return np.take_along_axis(scores, positions, axis=1), positions
+
+    def query(self, partition, query_embeddings, n_results, where=None):
+        for attempt in range(self.SNAPSHOT_ATTEMPTS):
+            try:
+                with self._transaction():
+                    state = self._partition(partition)
+                    if state is None:
+                        return self.empty_result(len(query_embeddings))
+                    rows, chunk_ids = self._candidates(partition, state[2], document_ids_filter(where))
+                    if not len(rows) or n_results < 1:
+                        return self.empty_result(len(query_embeddings))
+                    mapped = self._open(partition, state)
+                break
+            except FileNotFoundError:
+                # Another process compacted the partition after this snapshot was taken
+                if attempt == self.SNAPSHOT_ATTEMPTS - 1:
+                    raise
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        # Best scores per query and their positions in the candidate list
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(rows), self.BLOCK_ROWS):
+            block_rows = rows[start:start + self.BLOCK_ROWS]
+            scores, positions = self._top_k(queries, self._read(mapped, block_rows), min(n_results, len(block_rows)))
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_positions = np.concatenate([best_positions, start + positions], axis=1)
+            if best_scores.shape[1] > n_results:
+                keep = np.argpartition(-best_scores, n_results - 1, axis=1)[:, :n_results]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_positions = np.take_along_axis(best_positions, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_positions = np.take_along_axis(best_positions, order, axis=1)
+
+        best_ids = list(dict.fromkeys(chunk_ids[position] for position in best_positions.ravel()))
+        with self._lock:
+            found = {
+                chunk_id: (document, metadata)
+                for _, chunk_id, document, metadata in self._select(partition, "row, id, document, metadata", ids=best_ids)
+            }
+
+        result = self.empty_result(len(queries))
+        for query_index in range(len(queries)):
+            for score, position in zip(best_scores[query_index], best_positions[query_index]):
+                chunk_id = chunk_ids[position]
+                # Chunks deleted since the candidates were read are skipped
+                if chunk_id in found:
+                    document, metadata = found[chunk_id]
+                    result["ids"][query_index].append(chunk_id)
+                    result["documents"][query_index].append(document)
+                    result["metadatas"][query_index].append(json.loads(metadata))
+                    result["distances"][query_index].append(round(1.0 - float(score), 6))
+        return result
+
+    def partitions(self):
+        with self._lock:
+            return [partition for partition, in self._connection.execute("SELECT partition FROM partitions")]
+
+    def count(self, partition):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM chunks WHERE partition = ?", (partition,)
+            ).fetchone()[0]
+
+    def document_ids(self, partition):
+        with self._lock:
+            return {
+                document_id for document_id, in self._connection.execute(
+                    "SELECT DISTINCT document_id FROM chunks WHERE partition = ?", (partition,)
+                )
+            }
+
+    def _file_bytes(self, partition: str, version: int) -> int:
+        return sum(
+            os.path.getsize(path) for path in (
+                self._path(partition, self.dtype.name, version), self._path(partition, "scale", version)
+            ) if os.path.exists(path)
+        )
+
+    def _remove_files(self, partition: str, version: int):
+        for path in (self._path(partition, self.dtype.name, version), self._path(partition, "scale", version)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def compact(self, partition):
+        """Rewrite the partition's vector file without dead rows"""
+        with self._transaction(write=True):
+            state = self._partition(partition)
+            if state is None:
+                return {"bytes_before": 0, "bytes_after": 0}
+            dim, rows, generation, version = state
+            bytes_before = self._file_bytes(partition, version)
+            live = self._select(partition, "row, id")
+            if len(live) == rows:
+                return {"bytes_before": bytes_before, "bytes_after": bytes_before}
+
+            mapped = self._open(partition, state)
+            new_version = version + 1
+            row_numbers = np.array([row for row, _ in live], dtype=np.int64)
+            with open(self._path(partition, self.dtype.name, new_version), "wb") as file:
+                for start in range(0, len(row_numbers), self.BLOCK_ROWS):
+                    file.write(np.ascontiguousarray(mapped[0][row_numbers[start:start + self.BLOCK_ROWS]]).tobytes())
+            if mapped[1] is not None:
+                with open(self._path(partition, "scale", new_version), "wb") as file:
+                    file.write(np.ascontiguousarray(mapped[1][row_numbers]).tobytes())
+            del mapped
+
+            self._connection.executemany(
+                "UPDATE chunks SET row = ? WHERE partition = ? AND id = ?",
+                [(new_row, partition, chunk_id) for new_row, (_, chunk_id) in enumerate(live)]
+            )
+            self._connection.execute(
+                "UPDATE partitions SET rows = ?, generation = ?, file_version = ? WHERE partition = ?",
+                (len(live), generation + 1, new_version, partition)
+            )
+            self._connection.commit()
+            # Queries that mapped the old file keep reading it until they finish, and
+            # other processes' snapshots of the old version retry on the new one
+            self._remove_files(partition, version)
+            return {"bytes_before": bytes_before, "bytes_after": self._file_bytes(partition, new_version)}
+
+    def drop(self, partition):
+        with self._transaction(write=True):
+            state = self._partition(partition)
+            self._connection.execute("DELETE FROM chunks WHERE partition = ?", (partition,))
+            self._connection.execute("DELETE FROM partitions WHERE partition = ?", (partition,))
+            self._connection.commit()
+            self._live_rows.pop(partition, None)
+            if state is not None:
+                self._remove_files(partition, state[3])
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
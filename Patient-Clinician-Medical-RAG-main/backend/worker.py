@@ -0,0 +1,65 @@
+"""Standalone document ingestion worker.
+
+Runs ingestion jobs from the MongoDB queue outside the API process. Start as
+many of these as needed and set INGEST_EMBEDDED_CONCURRENCY=0 on the API so
+it only enqueues work. Workers write the same indexes the API searches: run
+them with CHROMA_HOST set (chroma backend) and with LEXICAL_INDEX_DIR and, for
+the mmap backend, VECTOR_STORE_PATH on a volume shared with the API. A worker
+that cannot see those indexes refuses to start:
+
+    python worker.py --concurrency 2
+"""
+import argparse
+import asyncio
+import signal
+
+# server is imported inside the functions, not here: the OCR pool's spawned processes
+# re-import this module, and importing server would set up MinIO, Chroma, the caches
+# and the app again in every one of them
+
+
+async def run_worker(concurrency: int):
+    from server import (
+        embedding_service,
+        IngestionWorker,
+        ingestion_queue,
+        ensure_shared_indexes,
+        doc_processor,
+        client,
+        logger,
+        INGEST_POLL_INTERVAL_SECONDS,
+    )
+
+    await ingestion_queue.ensure_indexes()
+    await ensure_shared_indexes(separate_process=True)
+    await embedding_service.start()
+    worker = IngestionWorker(ingestion_queue, concurrency, INGEST_POLL_INTERVAL_SECONDS)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        doc_processor.ocr_engine.shutdown()
+        client.close()
+        logger.info("Ingestion worker shutdown completed")
+
+
+def main():
+    from server import INGEST_WORKER_CONCURRENCY
+
+    parser = argparse.ArgumentParser(description="HealthSync document ingestion worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=INGEST_WORKER_CONCURRENCY,
+        help="documents processed at once by this worker"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import answer_cache
+from answer_cache import AnswerCache
+
+
+def put(cache, query, chunk_ids, document_ids, answer, texts=("chunk",)):
+    key = AnswerCache.key(query, chunk_ids, "model", "v1")
+    cache.put(key, AnswerCache.digest(texts), document_ids, answer)
+    return key
+
+
+def test_key_ignores_chunk_order_and_query_formatting():
+    assert AnswerCache.key("What is my HbA1c?", ["b", "a"], "m", "v1") == \
+        AnswerCache.key("  what is my hba1c? ", ["a", "b"], "m", "v1")
+    assert AnswerCache.key("q", ["a"], "m", "v1") != AnswerCache.key("q", ["a"], "m", "v2")
+    assert AnswerCache.key("q", ["a"], "m", "v1") != AnswerCache.key("q", ["a", "b"], "m", "v1")
+
+
+def test_hit_and_digest_mismatch():
+    cache = AnswerCache()
+    key = put(cache, "q", ["c1"], ["d1"], {"response": "A"})
+    assert cache.get(key, AnswerCache.digest(["chunk"])) == {"response": "A"}
+    # Chunk text changed under the same ids, e.g. reprocessed by a worker
+    assert cache.get(key, AnswerCache.digest(["edited chunk"])) is None
+    assert cache.get(key, AnswerCache.digest(["chunk"])) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(ttl_seconds=60)
+    key = put(cache, "q", ["c1"], ["d1"], {"response": "A"})
+    now[0] += 59
+    assert cache.get(key, AnswerCache.digest(["chunk"])) is not None
+    now[0] += 2
+    assert cache.get(key, AnswerCache.digest(["chunk"])) is None
+    assert cache.metrics()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    first = put(cache, "q1", ["c1"], ["d1"], {"response": "1"})
+    second = put(cache, "q2", ["c2"], ["d2"], {"response": "2"})
+    cache.get(first, AnswerCache.digest(["chunk"]))
+    third = put(cache, "q3", ["c3"], ["d3"], {"response": "3"})
+    assert cache.get(second, AnswerCache.digest(["chunk"])) is None
+    assert cache.get(first, AnswerCache.digest(["chunk"])) is not None
+    assert cache.get(third, AnswerCache.digest(["chunk"])) is not None
+    # The evicted entry no longer counts against its document
+    assert cache.invalidate_documents(["d2"]) == 0
+
+
+def test_invalidate_documents_drops_every_answer_using_them():
+    cache = AnswerCache()
+    shared = put(cache, "q1", ["c1", "c2"], ["d1", "d2"], {"response": "1"})
+    only_d2 = put(cache, "q2", ["c3"], ["d2"], {"response": "2"})
+    only_d3 = put(cache, "q3", ["c4"], ["d3"], {"response": "3"})
+    assert cache.invalidate_documents(["d2"]) == 2
+    assert cache.get(shared, AnswerCache.digest(["chunk"])) is None
+    assert cache.get(only_d2, AnswerCache.digest(["chunk"])) is None
+    assert cache.get(only_d3, AnswerCache.digest(["chunk"])) is not None
+    assert cache.metrics()["invalidated"] == 2
+
+
+def test_put_replaces_an_entry_and_its_documents():
+    cache = AnswerCache()
+    key = put(cache, "q", ["c1"], ["d1"], {"response": "old"})
+    put(cache, "q", ["c1"], ["d2"], {"response": "new"})
+    assert cache.invalidate_documents(["d1"]) == 0
+    assert cache.get(key, AnswerCache.digest(["chunk"])) == {"response": "new"}
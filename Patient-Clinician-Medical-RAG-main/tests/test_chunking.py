@@ -0,0 +1,66 @@
+import pytest
+
+from chunking import MedicalChunker, estimate_tokens, page_starts
+
+LAB_TABLE = "\n".join(f"Analyte{i}    {i}.5    mg/dL    ref 1-10" for i in range(6))
+
+
+def note(paragraph_sentences=30):
+    prose = " ".join(f"Sentence number {i} describes the patient's course in detail." for i in range(paragraph_sentences))
+    return f"HISTORY OF PRESENT ILLNESS\n{prose}\n\nLABORATORY RESULTS\n{LAB_TABLE}\n\nPLAN\nContinue metformin."
+
+
+def test_chunks_stay_within_budget_and_spans_match_text():
+    text = note()
+    chunker = MedicalChunker(chunk_tokens=60, overlap_tokens=10)
+    chunks = chunker.split(text)
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert chunk["tokens"] <= 60
+        assert text[chunk["char_start"]:chunk["char_end"]] == chunk["text"]
+
+
+def test_table_that_fits_is_never_split():
+    chunks = MedicalChunker(chunk_tokens=120, overlap_tokens=10).split(note())
+    holding_rows = [chunk for chunk in chunks if "Analyte0" in chunk["text"]]
+    assert len(holding_rows) == 1
+    assert LAB_TABLE in holding_rows[0]["text"]
+    assert holding_rows[0]["section"].startswith("LABORATORY RESULTS")
+
+
+def test_oversized_table_splits_between_rows():
+    table = "\n".join(f"Analyte{i}    {i}.5    mg/dL    ref 1-10" for i in range(40))
+    chunks = MedicalChunker(chunk_tokens=50, overlap_tokens=0).split(f"LABS\n{table}")
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert all(line.startswith(("Analyte", "LABS")) and line.endswith("ref 1-10") or line == "LABS"
+                   for line in chunk["text"].split("\n"))
+
+
+def test_overlap_is_carried_only_within_a_block():
+    text = note()
+    chunks = MedicalChunker(chunk_tokens=60, overlap_tokens=15).split(text)
+    prose_chunks = [chunk for chunk in chunks if "Sentence number" in chunk["text"]]
+    assert any(later["char_start"] < earlier["char_end"] for earlier, later in zip(prose_chunks, prose_chunks[1:]))
+    table_chunk = next(chunk for chunk in chunks if "Analyte0" in chunk["text"])
+    assert "Sentence number" not in table_chunk["text"]
+
+
+def test_pages_of_each_chunk():
+    pages = ["First page text. " * 20, "Second page text. " * 20, "Third page text. " * 20]
+    text = "\n".join(pages)
+    chunks = MedicalChunker(chunk_tokens=40, overlap_tokens=0).split(text, page_starts([len(page) for page in pages]))
+    assert chunks[0]["page_start"] == 1
+    assert chunks[-1]["page_end"] == 3
+    for chunk in chunks:
+        assert chunk["page_start"] <= chunk["page_end"]
+
+
+def test_empty_text_and_invalid_overlap():
+    assert MedicalChunker().split("  \n\n ") == []
+    with pytest.raises(ValueError):
+        MedicalChunker(chunk_tokens=10, overlap_tokens=10)
+
+
+def test_estimate_tokens_splits_words_numbers_and_symbols():
+    assert estimate_tokens(["HbA1c 7.2%", ""]) == [7, 0]
@@ -0,0 +1,90 @@
+from context_packing import ContextPacker
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def chunk(chunk_id, text, document_id="A", start=None, **metadata):
+    if start is not None:
+        metadata.update(char_start=start, char_end=start + len(text))
+    return {"chunk_id": chunk_id, "content": text, "document_id": document_id, "metadata": {"filename": "f", **metadata}}
+
+
+def words(word, count):
+    return " ".join([word] * count)
+
+
+def ids(passages):
+    return [passage["chunk_ids"] for passage in passages]
+
+
+def test_overlapping_chunks_merge_and_overlap_is_sent_once():
+    packer = ContextPacker(count_words)
+    text = "alpha beta gamma delta epsilon zeta"
+    first, second = text[:16], text[11:]
+    passages = packer.pack([chunk("c2", second, start=11), chunk("c1", first, start=0)], 100)
+    assert ids(passages) == [["c1", "c2"]]
+    assert passages[0]["text"] == text
+    assert passages[0]["rank"] == 0
+
+
+def test_distant_chunks_and_other_documents_stay_separate():
+    packer = ContextPacker(count_words)
+    passages = packer.pack([
+        chunk("a1", "one two", start=0),
+        chunk("b1", "three four", document_id="B", start=0),
+        chunk("a2", "five six", start=500),
+    ], 100)
+    assert ids(passages) == [["a1"], ["b1"], ["a2"]]
+
+
+def test_duplicate_text_is_sent_once_at_its_best_rank():
+    packer = ContextPacker(count_words)
+    passages = packer.pack([
+        chunk("x", "unrelated words here", document_id="X"),
+        chunk("b1", "same text", document_id="B", start=0),
+        chunk("a1", "same text", document_id="A", start=0),
+    ], 100)
+    assert len(passages) == 2
+    assert [passage["rank"] for passage in passages] == [0, 1]
+
+
+def test_passages_fill_the_budget_best_first():
+    packer = ContextPacker(count_words)
+    docs = [chunk(f"c{i}", words(f"w{i}", 9), document_id=f"D{i}") for i in range(4)]
+    # Each block is 9 words plus a one-word source line
+    passages = packer.pack(docs, 25)
+    assert ids(passages) == [["c0"], ["c1"]]
+    assert sum(passage["tokens"] for passage in passages) <= 25
+    assert packer.pack(docs, 0) == []
+    assert packer.pack([], 10) == []
+
+
+def test_over_budget_passage_drops_its_lowest_ranked_chunks_first():
+    packer = ContextPacker(count_words)
+    parts = [words("a", 20), words("b", 20), words("c", 20)]
+    starts = [0, 40, 80]
+    # The top-ranked chunk is the last one of the merged passage
+    docs = [chunk("c3", parts[2], start=starts[2]), chunk("c1", parts[0], start=starts[0]),
+            chunk("c2", parts[1], start=starts[1])]
+    assert ids(packer.pack(docs, 100)) == [["c1", "c2", "c3"]]
+    # Dropping the middle chunk splits the passage, kept in document order
+    assert ids(packer.pack(docs, 45)) == [["c1"], ["c3"]]
+    assert ids(packer.pack(docs, 30)) == [["c3"]]
+
+
+def test_top_chunk_larger_than_the_budget_is_truncated():
+    packer = ContextPacker(count_words)
+    docs = [chunk("c1", words("a", 50), start=0), chunk("c2", words("b", 50), start=100)]
+    passages = packer.pack(docs, 10)
+    assert ids(passages) == [["c1"]]
+    assert passages[0]["truncated"]
+    assert passages[0]["tokens"] <= 10
+    assert passages[0]["text"].startswith("a a")
+
+
+def test_block_names_file_and_pages():
+    assert ContextPacker.block({"document_id": "d", "text": " x ", "metadata": {"filename": "labs.pdf", "page_start": 2, "page_end": 3}}) \
+        == "[labs.pdf, pages 2-3]\nx"
+    assert ContextPacker.block({"document_id": "d", "text": "x", "metadata": {"page_start": 4}}) == "[d, page 4]\nx"
@@ -0,0 +1,122 @@
+from lexical_index import BM25Index, LexicalIndexStore, reciprocal_rank_fusion
+
+
+def build_index():
+    index = BM25Index()
+    index.replace_document("d1", ["d1_0", "d1_1"], ["metformin 500 mg twice daily", "blood pressure stable"])
+    index.replace_document("d2", ["d2_0"], ["metformin metformin dose increased"])
+    index.replace_document("d3", ["d3_0"], ["lisinopril 10 mg daily"])
+    return index
+
+
+def test_search_ranks_by_term_frequency():
+    results = build_index().search("metformin", 10)
+    assert [chunk_id for chunk_id, _ in results] == ["d2_0", "d1_0"]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_search_filters_documents_and_limits_k():
+    index = build_index()
+    assert [chunk_id for chunk_id, _ in index.search("metformin", 10, document_ids=["d1"])] == ["d1_0"]
+    assert len(index.search("metformin daily mg", 1)) == 1
+    assert index.search("unknownterm", 10) == []
+
+
+def test_replace_document_drops_old_chunks():
+    index = build_index()
+    index.replace_document("d2", ["d2_0"], ["aspirin daily"])
+    assert [chunk_id for chunk_id, _ in index.search("metformin", 10)] == ["d1_0"]
+    assert len(index) == 4
+
+
+def test_remove_then_compact_keeps_ranking():
+    index = build_index()
+    assert index.remove_document("d3") == 1
+    assert index.remove_document("missing") == 0
+    before = index.search("metformin daily", 10)
+    assert "d3_0" not in [chunk_id for chunk_id, _ in before]
+    index.compact()
+    assert index.dead_chunks == 0
+    assert index.search("metformin daily", 10) == before
+
+
+def test_reindexing_documents_keeps_scores_and_idf_positive():
+    index = BM25Index()
+    for _ in range(4):
+        for number in range(20):
+            index.replace_document(f"d{number}", [f"d{number}_0"], [f"note {number} blood pressure stable"])
+    index.replace_document("m", ["m_0"], ["metformin 500 mg"])
+    assert index.dead_chunks == 60
+    fresh = BM25Index()
+    for number in range(20):
+        fresh.replace_document(f"d{number}", [f"d{number}_0"], [f"note {number} blood pressure stable"])
+    fresh.replace_document("m", ["m_0"], ["metformin 500 mg"])
+    assert index.search("blood metformin", 30) == fresh.search("blood metformin", 30)
+    assert all(score > 0 for _, score in index.search("blood", 30))
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_index()
+    path = str(tmp_path / "partition.npz")
+    index.save(path)
+    assert BM25Index.load(path).search("metformin mg", 10) == index.search("metformin mg", 10)
+
+
+def test_store_sees_other_instances_writes(tmp_path):
+    # Two instances on one directory stand in for the API and a worker process
+    api, worker = LexicalIndexStore(str(tmp_path)), LexicalIndexStore(str(tmp_path))
+    worker.replace_document("p", "d1", ["d1_0"], ["warfarin 5 mg"])
+    assert [chunk_id for chunk_id, _ in api.search("p", "warfarin", 5)] == ["d1_0"]
+    api.replace_document("p", "d2", ["d2_0"], ["warfarin held"])
+    assert worker.remove_documents("p", ["d1"]) == 1
+    assert [chunk_id for chunk_id, _ in api.search("p", "warfarin", 5)] == ["d2_0"]
+    assert api.document_ids("p") == {"d2"}
+
+
+def test_store_compaction_folds_delta(tmp_path):
+    store = LexicalIndexStore(str(tmp_path))
+    store.replace_document("p", "d1", ["d1_0"], ["insulin glargine nightly"])
+    store.replace_document("p", "d2", ["d2_0"], ["insulin lispro with meals"])
+    store.compact("p")
+    assert (tmp_path / "p.delta").stat().st_size == 0
+    reopened = LexicalIndexStore(str(tmp_path))
+    assert {chunk_id for chunk_id, _ in reopened.search("p", "insulin", 5)} == {"d1_0", "d2_0"}
+
+
+def test_store_keeps_writes_made_while_compaction_writes_the_base(tmp_path, monkeypatch):
+    store = LexicalIndexStore(str(tmp_path))
+    store.replace_document("p", "d1", ["d1_0"], ["insulin glargine nightly"])
+    write_arrays = BM25Index.write_arrays
+
+    def write_during_compaction(path, arrays):
+        # Would deadlock if compaction still held the partition's locks here
+        store.replace_document("p", "d2", ["d2_0"], ["insulin lispro with meals"])
+        return write_arrays(path, arrays)
+
+    monkeypatch.setattr(BM25Index, "write_arrays", staticmethod(write_during_compaction))
+    store.compact("p")
+    assert (tmp_path / "p.delta").stat().st_size > 0
+    for reader in (store, LexicalIndexStore(str(tmp_path))):
+        assert {chunk_id for chunk_id, _ in reader.search("p", "insulin", 5)} == {"d1_0", "d2_0"}
+
+
+def test_store_remove_from_unknown_partition_writes_nothing(tmp_path):
+    store = LexicalIndexStore(str(tmp_path))
+    assert store.remove_documents("p", ["d1"]) == 0
+    assert store.partitions() == []
+
+
+def test_store_drop(tmp_path):
+    store = LexicalIndexStore(str(tmp_path))
+    store.replace_document("p", "d1", ["d1_0"], ["atorvastatin"])
+    assert store.partitions() == ["p"]
+    store.drop("p")
+    assert store.partitions() == []
+    assert store.search("p", "atorvastatin", 5) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "a", "d"]], k=60)
+    assert [item for item, _ in fused][:2] in (["a", "b"], ["b", "a"])
+    assert fused[0][1] == fused[1][1] == 1 / 61 + 1 / 62
+    assert [item for item, _ in fused][2:] == ["c", "d"]
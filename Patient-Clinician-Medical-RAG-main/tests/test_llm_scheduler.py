@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import LLMScheduler, LLMQueueFull
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def hold(scheduler, priority, order, name, release):
+    async with scheduler.slot(priority):
+        order.append(name)
+        await release.wait()
+
+
+def test_waiters_run_by_priority_then_arrival():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue=10)
+        order, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(scheduler, 5, order, "running", release))]
+        await asyncio.sleep(0)
+        for name, priority in [("low-1", 9), ("high-1", 1), ("low-2", 9), ("high-2", 1)]:
+            tasks.append(asyncio.create_task(hold(scheduler, priority, order, name, release)))
+            await asyncio.sleep(0)
+        assert scheduler.queued == 4
+        release.set()
+        await asyncio.gather(*tasks)
+        return order, scheduler
+
+    order, scheduler = run(scenario())
+    assert order == ["running", "high-1", "high-2", "low-1", "low-2"]
+    assert scheduler.metrics()["active"] == 0
+    assert scheduler.metrics()["admitted"] == 5
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue=1)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(scheduler, 0, [], name, release)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        assert scheduler.full
+        with pytest.raises(LLMQueueFull) as rejected:
+            await scheduler.acquire(0)
+        release.set()
+        await asyncio.gather(*tasks)
+        return rejected.value, scheduler
+
+    rejected, scheduler = run(scenario())
+    assert rejected.retry_after >= 1
+    assert scheduler.metrics()["rejected"] == 1
+    assert not scheduler.full
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue=5)
+        order, release = [], asyncio.Event()
+        running = asyncio.create_task(hold(scheduler, 0, order, "running", release))
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(hold(scheduler, 0, order, "cancelled", release))
+        waiting = asyncio.create_task(hold(scheduler, 1, order, "waiting", release))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        release.set()
+        await asyncio.gather(running, waiting)
+        return order, scheduler
+
+    order, scheduler = run(scenario())
+    assert order == ["running", "waiting"]
+    assert scheduler.metrics()["cancelled_waiting"] == 1
+    assert scheduler.metrics()["active"] == 0
+
+
+def test_slot_is_released_when_the_generation_fails():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrent=1, max_queue=0)
+        with pytest.raises(RuntimeError):
+            async with scheduler.slot(0):
+                raise RuntimeError("generation failed")
+        async with scheduler.slot(0):
+            pass
+        return scheduler
+
+    assert run(scenario()).metrics()["active"] == 0
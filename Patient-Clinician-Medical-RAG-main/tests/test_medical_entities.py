@@ -0,0 +1,51 @@
+from medical_entities import MedicalEntityExtractor, TokenAutomaton, tokenize
+
+
+def extractor():
+    return MedicalEntityExtractor({
+        "conditions": [["Diabetes Mellitus", "diabetes"], ["Type 2 Diabetes Mellitus", "t2dm"], ["Hypertension", "htn"]],
+        "medications": [["Metformin", "glucophage"], ["Aspirin"]],
+        "lab_values": [["Hemoglobin A1c", "hba1c", "a1c"], ["LDL Cholesterol", "ldl"]],
+    })
+
+
+def test_automaton_finds_overlapping_and_nested_phrases():
+    automaton = TokenAutomaton()
+    for phrase in ("heart failure", "congestive heart failure", "failure"):
+        automaton.add(tokenize(phrase), "conditions", phrase)
+    automaton.build()
+    matches = automaton.search(tokenize("congestive heart failure noted"))
+    assert sorted((start, end, name) for start, end, _, name in matches) == [
+        (0, 3, "congestive heart failure"), (1, 3, "heart failure"), (2, 3, "failure")
+    ]
+
+
+def test_automaton_follows_failure_links():
+    automaton = TokenAutomaton()
+    automaton.add(["a", "b", "c"], "x", "abc")
+    automaton.add(["b", "d"], "x", "bd")
+    automaton.build()
+    assert [(start, end) for start, end, _, _ in automaton.search(["a", "b", "d"])] == [(1, 3)]
+
+
+def test_leftmost_longest_match_wins_and_synonyms_map_to_canonical():
+    entities = extractor().extract("History of type 2 diabetes mellitus and HTN. Started Glucophage, aspirin.")
+    assert entities["conditions"] == ["Type 2 Diabetes Mellitus", "Hypertension"]
+    assert entities["medications"] == ["Metformin", "Aspirin"]
+
+
+def test_lab_values_need_a_numeric_result():
+    entities = extractor().extract("HbA1c: 7.2 % today. LDL was discussed. A1c 6.9")
+    assert entities["lab_values"] == ["Hemoglobin A1c 7.2 %", "Hemoglobin A1c 6.9"]
+
+
+def test_vital_signs_and_duplicates():
+    entities = extractor().extract("BP: 132/84, HR: 76, temp: 98.4. Diabetes. diabetes.")
+    assert entities["vital_signs"] == ["132/84", "76", "98.4"]
+    assert entities["conditions"] == ["Diabetes Mellitus"]
+
+
+def test_bundled_lexicons_load():
+    extractor = MedicalEntityExtractor.from_directory()
+    assert extractor.automaton.size > 0
+    assert extractor.extract_batch(["", None]) == [extractor.extract(""), extractor.extract("")]
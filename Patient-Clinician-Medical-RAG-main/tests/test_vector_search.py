@@ -0,0 +1,54 @@
+import asyncio
+
+from vector_search import VectorSearchBatcher
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def chroma_query(partition, query_embeddings, n_results, where):
+    # Shaped like a Chroma >= 0.5 result, which adds the non-per-query "included" field
+    return {
+        "ids": [[f"{partition}-{i}-{n}" for n in range(n_results)] for i in range(len(query_embeddings))],
+        "distances": [[0.1 * n for n in range(n_results)] for _ in query_embeddings],
+        "documents": [[f"text {n}" for n in range(n_results)] for _ in query_embeddings],
+        "metadatas": [[{} for _ in range(n_results)] for _ in query_embeddings],
+        "embeddings": None,
+        "included": ["metadatas", "documents", "distances"],
+    }
+
+
+def test_coalesced_queries_get_their_own_results():
+    async def scenario():
+        batcher = VectorSearchBatcher(chroma_query, coalesce_ms=20)
+        try:
+            return await asyncio.wait_for(asyncio.gather(
+                batcher.query("p", [1.0, 0.0], 2), batcher.query("p", [0.0, 1.0], 1)
+            ), timeout=5)
+        finally:
+            batcher.shutdown()
+
+    first, second = run(scenario())
+    assert first["ids"] == [["p-0-0", "p-0-1"]]
+    assert second["ids"] == [["p-1-0"]]
+    assert first["included"] == ["metadatas", "documents", "distances"]
+    assert "embeddings" not in first
+
+
+def test_failed_split_fails_every_waiting_query():
+    def malformed_query(partition, query_embeddings, n_results, where):
+        return {"ids": [["only-one-query"]]}
+
+    async def scenario():
+        batcher = VectorSearchBatcher(malformed_query, coalesce_ms=20)
+        try:
+            return await asyncio.wait_for(asyncio.gather(
+                batcher.query("p", [1.0], 1), batcher.query("p", [0.0], 1), return_exceptions=True
+            ), timeout=5)
+        finally:
+            batcher.shutdown()
+
+    first, second = run(scenario())
+    assert first == {"ids": [["only-one-query"]]}
+    assert isinstance(second, IndexError)
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from vector_store import MmapVectorStore, partition_version, version_partition
+
+
+def vectors(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+@pytest.fixture(params=["float16", "int8"])
+def store(tmp_path, request):
+    store = MmapVectorStore(str(tmp_path), dtype=request.param)
+    yield store
+    store.close()
+
+
+def upsert(store, partition, document_id, ids, embeddings):
+    store.upsert(partition, ids, [f"text of {chunk_id}" for chunk_id in ids], embeddings,
+                 [{"document_id": document_id} for _ in ids])
+
+
+def test_query_returns_nearest_with_cosine_distance(store):
+    upsert(store, "p", "d1", ["a", "b", "c"], vectors([1, 0, 0], [0, 1, 0], [1, 1, 0]))
+    result = store.query("p", [[1, 0, 0]], 2)
+    assert result["ids"] == [["a", "c"]]
+    assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-2)
+    assert result["distances"][0][1] == pytest.approx(1 - 2 ** -0.5, abs=1e-2)
+    assert result["documents"] == [["text of a", "text of c"]]
+
+
+def test_upsert_replaces_existing_ids(store):
+    upsert(store, "p", "d1", ["a", "b"], vectors([1, 0], [0, 1]))
+    upsert(store, "p", "d1", ["a"], vectors([0, 1]))
+    assert store.count("p") == 2
+    assert sorted(store.query("p", [[0, 1]], 2)["ids"][0]) == ["a", "b"]
+    # Rows of replaced vectors stay in the file until compaction
+    assert store._partition("p")[1] == 3
+
+
+def test_query_filters_by_document(store):
+    upsert(store, "p", "d1", ["a"], vectors([1, 0]))
+    upsert(store, "p", "d2", ["b"], vectors([1, 0.1]))
+    assert store.query("p", [[1, 0]], 5, where={"document_id": "d2"})["ids"] == [["b"]]
+    assert store.query("p", [[1, 0]], 5, where={"document_id": {"$in": ["d1"]}})["ids"] == [["a"]]
+
+
+def test_delete_documents_and_document_ids(store):
+    upsert(store, "p", "d1", ["a", "b"], vectors([1, 0], [0, 1]))
+    upsert(store, "p", "d2", ["c"], vectors([1, 1]))
+    assert store.delete_documents("p", ["d1", "missing"]) == 2
+    assert store.document_ids("p") == {"d2"}
+    assert store.query("p", [[1, 0]], 5)["ids"] == [["c"]]
+
+
+def test_compact_drops_dead_rows_and_keeps_results(store):
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(40, 16)).astype(np.float32)
+    upsert(store, "p", "d1", [f"a{i}" for i in range(20)], embeddings[:20])
+    upsert(store, "p", "d2", [f"b{i}" for i in range(20)], embeddings[20:])
+    store.delete_documents("p", ["d1"])
+    before = store.query("p", embeddings[20:25].tolist(), 3)
+    stored = store.get("p", ids=["b3"], include=["embeddings"])["embeddings"][0]
+
+    stats = store.compact("p")
+    assert stats["bytes_after"] < stats["bytes_before"]
+    dim, rows, _, version = store._partition("p")
+    assert (dim, rows, version) == (16, 20, 1)
+    assert store.query("p", embeddings[20:25].tolist(), 3) == before
+    assert store.get("p", ids=["b3"], include=["embeddings"])["embeddings"][0] == stored
+    # Appends after compaction go to the new file version
+    upsert(store, "p", "d3", ["c0"], embeddings[:1])
+    assert store.query("p", embeddings[:1].tolist(), 1)["ids"] == [["c0"]]
+
+
+def test_compact_without_dead_rows_is_a_no_op(store):
+    upsert(store, "p", "d1", ["a"], vectors([1, 0]))
+    stats = store.compact("p")
+    assert stats["bytes_before"] == stats["bytes_after"]
+    assert store._partition("p")[3] == 0
+
+
+def test_drop_and_unknown_partitions(store):
+    upsert(store, "p", "d1", ["a"], vectors([1, 0]))
+    store.drop("p")
+    assert store.partitions() == []
+    assert store.count("p") == 0
+    assert store.query("p", [[1, 0]], 3)["ids"] == [[]]
+    assert store.get("missing", ids=["a"])["ids"] == []
+
+
+def test_dimension_mismatch_is_rejected(store):
+    upsert(store, "p", "d1", ["a"], vectors([1, 0]))
+    with pytest.raises(ValueError):
+        upsert(store, "p", "d1", ["b"], vectors([1, 0, 0]))
+
+
+def test_index_versions_get_their_own_partitions(store):
+    old, new = version_partition("p", None), version_partition("p", "v2")
+    assert partition_version(old) == ("p", None) and partition_version(new) == ("p", "v2")
+    upsert(store, old, "d1", ["a"], vectors([1, 0]))
+    upsert(store, new, "d1", ["a"], vectors([0, 1, 0]))
+    assert store.query(old, [[1, 0]], 1)["ids"] == [["a"]]
+    assert sorted(store.partitions()) == sorted([old, new])
+
+
+def test_second_instance_sees_writes(tmp_path):
+    writer, reader = MmapVectorStore(str(tmp_path)), MmapVectorStore(str(tmp_path))
+    upsert(writer, "p", "d1", ["a", "b"], vectors([1, 0], [0, 1]))
+    assert reader.query("p", [[0, 1]], 1)["ids"] == [["b"]]
+    writer.delete_documents("p", ["d1"])
+    writer.compact("p")
+    assert reader.query("p", [[0, 1]], 1)["ids"] == [[]]